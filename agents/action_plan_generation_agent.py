@@ -22,7 +22,7 @@ from langchain_core.prompts import PromptTemplate
 from pydantic import BaseModel, Field
 from langchain_core.output_parsers import JsonOutputParser
 
-llmchat = get_llmchat()
+llmchat = get_llmchat("action_plan_generation_agent")
 
 
 class Output(BaseModel):
@@ -103,6 +103,11 @@ Instructions:
 
         return info_chain
 
+    async def ainvoke(self, input_params):
+        prompt = self.generate_prompt(input_params['user_query'])
+
+        return await self.plan_chain.ainvoke({'user_query': input_params['user_query'], 'prompt': prompt})
+
     def action_plan_agent(self):
         prompt = """ {prompt}"""
 
@@ -0,0 +1,335 @@
+"""
+Cache of the programs generated by the coding agent.
+
+Many coding queries are the same template with a different user and date, e.g. "total screen time for test004 on
+2025-08-28". The user ids, dates and times of a query are replaced by placeholders to form its signature, and the
+last successful program generated for a signature is stored in SQLite with the values it was generated for. A query
+with the same signature and databases runs the stored program with its own values substituted in on a code worker,
+without the LLM conversation. Programs that cannot be adapted or fail fall back to the coding agent.
+"""
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date
+from hashlib import sha256
+
+from autogen_core.base import CancellationToken
+from autogen_core.components.code_executor import CodeBlock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from agents.config import CODE_CACHE_PATH, CODE_CACHE_MAX_ENTRIES, VERBOSE
+from agents.code_executor_pool import get_code_executor_pool
+from agents.coding_agent import get_shared_loop
+from data_streams.constants import time_zone_dict
+
+MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+MONTH_PATTERN = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+
+# Patterns of the values parameterized out of queries, matched in this order
+DATE_PATTERNS = [
+    (re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b"), lambda m: (m[1], m[2], m[3])),
+    (re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{4})\b"), lambda m: (m[3], m[1], m[2])),
+    (re.compile(rf"\b{MONTH_PATTERN}\s+(\d{{1,2}})(?:st|nd|rd|th)?,?\s+(\d{{4}})\b", re.IGNORECASE),
+     lambda m: (m[3], MONTHS.index(m[1].lower()) + 1, m[2])),
+    (re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?{MONTH_PATTERN},?\s+(\d{{4}})\b", re.IGNORECASE),
+     lambda m: (m[3], MONTHS.index(m[2].lower()) + 1, m[1])),
+]
+TIME_PATTERN = re.compile(r"\b(\d{1,2}):(\d{2})(?::(\d{2}))?(?:\s*([ap])\.?m\b\.?)?|\b(\d{1,2})\s*([ap])\.?m\b\.?",
+                          re.IGNORECASE)
+UID_PATTERN = re.compile(r"\b[A-Za-z]+[_-]?\d{3,}\b")
+# Dates written in generated code, as in value_patterns
+CODE_DATE_PATTERN = re.compile(r"\b(\d{4})[-/](\d{2})[-/](\d{2})\b|\b(\d{2})/(\d{2})/(\d{4})\b|"
+                               r"\bdate(?:time)?\(\s*(\d{4})\s*,\s*(\d{1,2})\s*,\s*(\d{1,2})\b")
+
+_stats = {'hits': 0, 'misses': 0, 'fallbacks': 0, 'seconds_saved': 0.0}
+_stats_lock = threading.Lock()
+
+
+def _count(name, value=1):
+    with _stats_lock:
+        _stats[name] += value
+
+
+def get_code_cache_stats():
+    """Return the hits, misses, fallbacks to the coding agent and seconds saved by the code cache."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses'] + stats['fallbacks']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+    return stats
+
+
+def to_time(hour, minute, second=None, meridiem=None):
+    hour = int(hour)
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem.lower() == 'p' else 0)
+    return f"{hour:02d}:{int(minute):02d}:{int(second or 0):02d}"
+
+
+def parameterize_query(query):
+    """
+    Replace the user ids, dates and times of a query with numbered placeholders.
+
+    Parameters:
+    - query (str): The query of the coding function.
+
+    Returns:
+    - tuple: (signature, params), the normalized query with placeholders such as {DATE0}, and the value of each
+      placeholder ('test004', dates as '%Y-%m-%d', times as '%H:%M:%S'). The signature ignores punctuation and
+      case.
+    """
+    params = {}
+
+    def placeholder(kind, value):
+        name = f"{kind}{sum(key.startswith(kind) for key in params)}"
+        params[name] = value
+        return "{" + name + "}"
+
+    def replace_date(match, groups):
+        try:
+            year, month, day = (int(value) for value in groups(match))
+            return placeholder("DATE", date(year, month, day).isoformat())
+        except ValueError:
+            return match[0]
+
+    def replace_time(match):
+        if match[5]:
+            return placeholder("TIME", to_time(match[5], 0, meridiem=match[6]))
+        return placeholder("TIME", to_time(match[1], match[2], match[3], match[4]))
+
+    signature = query
+    for pattern, groups in DATE_PATTERNS:
+        signature = pattern.sub(lambda match: replace_date(match, groups), signature)
+    signature = TIME_PATTERN.sub(replace_time, signature)
+    # Only known user ids are parameters, not other tokens of the same form such as 'top100'
+    signature = UID_PATTERN.sub(lambda match: placeholder("UID", match[0]) if match[0] in time_zone_dict
+                                else match[0], signature)
+    # Punctuation and case do not change the template
+    signature = re.sub(r"\s+", " ", re.sub(r"[^\w{}\s]", " ", signature)).strip().lower()
+    # Placeholders are lowercased with the query
+    signature = re.sub(r"\{(uid|date|time)(\d+)\}", lambda m: "{" + m[1].upper() + m[2] + "}", signature)
+    return signature, params
+
+
+def value_patterns(kind, value):
+    """
+    Return the patterns matching a parameter value in code, with the function (new value, match) formatting a new
+    value like the match.
+    """
+    if kind == "UID":
+        return [(rf"(?<![\w-]){re.escape(value)}(?![\w-])", lambda new, match: new)]
+    if kind == "DATE":
+        year, month, day = (int(part) for part in value.split("-"))
+        arguments = rf"\s*{year}\s*,\s*0?{month}\s*,\s*0?{day}\b"
+        return [
+            (rf"\b{year:04d}-{month:02d}-{day:02d}\b", lambda new, match: new),
+            (rf"\b{year:04d}/{month:02d}/{day:02d}\b", lambda new, match: new.replace("-", "/")),
+            (rf"\b{month:02d}/{day:02d}/{year:04d}\b", lambda new, match: f"{new[5:7]}/{new[8:10]}/{new[:4]}"),
+            (rf"(?<=\bdate\(){arguments}|(?<=\bdatetime\(){arguments}",
+             lambda new, match: f"{int(new[:4])}, {int(new[5:7])}, {int(new[8:10])}"),
+        ]
+    hour, minute, second = value.split(":")
+    return [(rf"\b{hour}:{minute}(:{second})?\b", lambda new, match: new if match[1] else new[:5])]
+
+
+def code_dates(code):
+    """Return the dates written in a program, as '%Y-%m-%d' strings."""
+    dates = set()
+    for match in CODE_DATE_PATTERN.finditer(code):
+        year, month, day = (match[1], match[2], match[3]) if match[1] else \
+            (match[6], match[4], match[5]) if match[4] else (match[7], match[8], match[9])
+        dates.add(f"{int(year):04d}-{int(month):02d}-{int(day):02d}")
+    return dates
+
+
+def dates_follow_query(code, params):
+    """Return whether every date written in a program is a date of the query it was generated for."""
+    return code_dates(code) <= {value for name, value in params.items() if name.startswith("DATE")}
+
+
+def substitute_parameters(code, old_params, new_params):
+    """
+    Replace the parameter values a program was generated for with new values, all at once so values can be swapped.
+
+    Parameters:
+    - code (str): The program.
+    - old_params (dict): Placeholder to value the program was generated for.
+    - new_params (dict): Placeholder to new value, with the same placeholders.
+
+    Returns:
+    - str: The program for the new values, or None if a changed value cannot be found in the program, two
+      placeholders had the same value and now differ, or the program has other dates (e.g. the day after a date of
+      the query, or the date of a query saying 'yesterday') that would not follow the query.
+    """
+    if set(old_params) != set(new_params) or not dates_follow_query(code, old_params):
+        return None
+    replacements = []
+
+    for name, old in old_params.items():
+        new = new_params[name]
+        if old == new:
+            continue
+        if any(old_params[other] == old and new_params[other] != new for other in old_params if other != name):
+            return None
+        found = False
+        for pattern, format_value in value_patterns(re.sub(r"\d+$", "", name), old):
+            def mark(match, format_value=format_value, new=new):
+                # Values are marked first and replaced at the end, so a new value is not replaced again
+                replacements.append(format_value(new, match))
+                return f"\x00{len(replacements) - 1}\x00"
+            code, count = re.subn(pattern, mark, code)
+            found = found or count > 0
+        if not found:
+            return None
+    return re.sub(r"\x00(\d+)\x00", lambda match: replacements[int(match[1])], code)
+
+
+def successful_program(result, executions):
+    """
+    Return the code blocks of the last successful execution of a coding agent run that found an answer.
+
+    Parameters:
+    - result (TaskResult): The result of the coding agent.
+    - executions (list): (code blocks, CommandLineCodeResult) of every execution of the run.
+
+    Returns:
+    - list: [(code, language)] or None.
+    """
+    if not result.messages or "Fetching Data Failed" in result.messages[-1].content:
+        return None
+    for code_blocks, execution in reversed(executions):
+        if execution.exit_code == 0 and execution.output.strip():
+            return [(block.code, block.language) for block in code_blocks]
+    return None
+
+
+class CodeCache:
+    """SQLite store of the last successful program generated per query signature and databases."""
+
+    def __init__(self, cache_path=CODE_CACHE_PATH, max_entries=CODE_CACHE_MAX_ENTRIES):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS code_cache (key TEXT PRIMARY KEY, signature TEXT, "
+                               "databases TEXT, params TEXT, code TEXT, generation_seconds REAL, hits INTEGER, "
+                               "created_at REAL, last_used REAL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.cache_path, timeout=30)
+
+    @staticmethod
+    def key(signature, databases):
+        return sha256(json.dumps([signature, sorted(databases)]).encode('utf-8')).hexdigest()
+
+    def lookup(self, user_query, databases):
+        """
+        Find the program stored for the signature of a query and adapt it to the values of the query.
+
+        Returns:
+        - tuple: (key, code blocks, generation seconds), or None if there is no program or it cannot be adapted.
+        """
+        signature, params = parameterize_query(user_query)
+        key = self.key(signature, databases)
+        with self._connect() as connection:
+            row = connection.execute("SELECT params, code, generation_seconds FROM code_cache WHERE key = ?",
+                                     (key,)).fetchone()
+        if row is None:
+            return None
+        old_params, code_blocks, generation_seconds = json.loads(row[0]), json.loads(row[1]), row[2]
+        adapted = []
+        for code, language in code_blocks:
+            code = substitute_parameters(code, old_params, params)
+            if code is None:
+                return None
+            adapted.append(CodeBlock(code=code, language=language))
+        return key, adapted, generation_seconds
+
+    def record_hit(self, key):
+        with self._connect() as connection:
+            connection.execute("UPDATE code_cache SET hits = hits + 1, last_used = ? WHERE key = ?",
+                               (time.time(), key))
+
+    def remove(self, key):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM code_cache WHERE key = ?", (key,))
+
+    def store(self, user_query, databases, code_blocks, generation_seconds):
+        """
+        Store the program generated for a query, replacing the program of the same signature and databases. Programs
+        with dates that are not dates of the query are not stored, as they could not follow the next query.
+        """
+        signature, params = parameterize_query(user_query)
+        if not all(dates_follow_query(code, params) for code, _ in code_blocks):
+            return
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO code_cache VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?)",
+                               (self.key(signature, databases), signature, json.dumps(sorted(databases)),
+                                json.dumps(params), json.dumps(code_blocks), generation_seconds, now, now))
+            # Evict the least recently used programs
+            connection.execute("DELETE FROM code_cache WHERE key NOT IN "
+                               "(SELECT key FROM code_cache ORDER BY last_used DESC LIMIT ?)", (self.max_entries,))
+
+    async def run_async(self, user_query, databases):
+        """
+        Answer a query with the stored program of its signature, run on a code worker.
+
+        Returns:
+        - str: The output of the program, or None if the query has to go to the coding agent.
+        """
+        start = time.perf_counter()
+        entry = await asyncio.to_thread(self.lookup, user_query, databases)
+        if entry is None:
+            _count('misses')
+            return None
+        key, code_blocks, generation_seconds = entry
+
+        async with get_code_executor_pool().worker() as code_executor:
+            result = await code_executor.execute_code_blocks(code_blocks, CancellationToken())
+        if result.exit_code != 0 or not result.output.strip():
+            # The program does not work for these values, the coding agent writes a new one
+            await asyncio.to_thread(self.remove, key)
+            _count('fallbacks')
+            if VERBOSE:
+                print(f"Cached program failed with exit code {result.exit_code}, generating a new one")
+            return None
+
+        await asyncio.to_thread(self.record_hit, key)
+        seconds_saved = max(0.0, generation_seconds - (time.perf_counter() - start))
+        _count('hits')
+        _count('seconds_saved', seconds_saved)
+        if VERBOSE:
+            stats = get_code_cache_stats()
+            print(f"Code cache hit, saved {seconds_saved:.1f}s (hit rate {stats['hit_rate']:.0%}, "
+                  f"{stats['seconds_saved']:.1f}s saved in total)")
+        return result.output
+
+    def run(self, user_query, databases):
+        """Synchronous run_async, on the event loop of the coding agent."""
+        return asyncio.run_coroutine_threadsafe(self.run_async(user_query, databases), get_shared_loop()).result()
+
+    def store_result(self, user_query, databases, result, executions, generation_seconds):
+        """Store the program of a coding agent run if it found an answer."""
+        code_blocks = successful_program(result, executions)
+        if code_blocks is not None:
+            self.store(user_query, databases, code_blocks, generation_seconds)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_code_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CodeCache()
+    return _cache
@@ -0,0 +1,369 @@
+"""
+Pool of warm code execution workers for the coding agent.
+
+Each worker is a long-running agents/code_worker.py process with the import preamble of generated code already
+loaded, started in a Docker container of the sensemaking image or as a sandboxed local process (CODE_EXECUTOR_BACKEND
+in agents/config.py, Docker by default). Local workers need neither Docker nor a container start, and limit the CPU
+time, memory and network access of the scripts themselves, but not their access to the filesystem. The coding agent
+borrows a worker for the duration of a request and returns it afterwards. Workers are health checked when they are
+handed out and recycled after a number of requests or a failure.
+"""
+import asyncio
+import atexit
+import json
+import os
+import queue
+import select
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from hashlib import sha256
+from pathlib import Path
+
+from autogen_core.components.code_executor import CommandLineCodeResult, get_file_name_from_content, silence_pip
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from agents.config import (DOCKER_NAME, CODE_EXECUTOR_POOL_SIZE, CODE_EXECUTOR_MAX_USES, CODE_EXECUTOR_TIMEOUT,
+                           CODE_EXECUTOR_BACKEND, CODE_EXECUTOR_MEMORY_MB, CODE_EXECUTOR_ALLOW_NETWORK)
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Scripts run in a directory next to sample_data, so the relative CSV paths resolve
+WORK_DIR = os.path.join(REPO_ROOT, "code_runs")
+DOCKER_REPO_ROOT = "/workspace"
+
+PYTHON_LANGUAGES = ("python", "python3", "py")
+SHELL_LANGUAGES = ("sh", "bash", "shell")
+
+# Seconds a worker may take to load the preamble or answer a health check
+STARTUP_TIMEOUT = 120
+PING_TIMEOUT = 5
+
+
+class WorkerError(Exception):
+    pass
+
+
+def docker_available():
+    return shutil.which("docker") is not None
+
+
+def resolve_backend(backend=CODE_EXECUTOR_BACKEND):
+    if backend == "auto":
+        if docker_available():
+            return "docker"
+        print("!" * 80)
+        print("WARNING: Docker is not installed, LLM-generated code runs directly on this host. Local workers limit\n"
+              "its CPU time, memory and network access but NOT its filesystem access: it can read and write every\n"
+              "file of this user. Set CODE_EXECUTOR_BACKEND = \"docker\" in agents/config.py to require Docker.")
+        print("!" * 80)
+        return "local"
+    if backend not in ("docker", "local"):
+        raise ValueError(f"Unknown code executor backend: {backend}, expected 'docker', 'local' or 'auto'")
+    return backend
+
+
+class CodeWorker:
+    """
+    A code_worker.py process, usable as the code executor of an autogen CodeExecutorAgent. Outside of a pool, a
+    worker is started and stopped with async with CodeWorker(0) as code_executor: ...
+
+    Requests to the process are blocking and made from a thread, so a worker can be used from any event loop.
+    """
+
+    def __init__(self, worker_id, backend="local", timeout=CODE_EXECUTOR_TIMEOUT, memory_mb=CODE_EXECUTOR_MEMORY_MB,
+                 allow_network=CODE_EXECUTOR_ALLOW_NETWORK):
+        """
+        Parameters:
+        - worker_id (int): Number of the worker, used to name its scratch directory and container.
+        - backend (str): "docker" to run the worker in a container of the sensemaking image, "local" otherwise.
+        - timeout (int): Seconds a script may run before it is killed.
+        - memory_mb (int): Largest address space of a script in megabytes, None for no limit.
+        - allow_network (bool): Whether the scripts may access the network.
+        """
+        self.worker_id = worker_id
+        self.backend = backend
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.allow_network = allow_network
+        self.process = None
+        self.uses = 0
+        self.broken = False
+        self.preloaded = []
+        self.network_isolated = False
+        # (code blocks, result) of every execution of the current request
+        self.executions = []
+        self.lock = threading.Lock()
+
+    def command(self):
+        scratch_dir = f"worker-{self.worker_id}"
+        limits = ["--memory-mb", str(self.memory_mb)] if self.memory_mb else []
+        if self.backend == "docker":
+            work_dir = f"{DOCKER_REPO_ROOT}/code_runs"
+            # The container is isolated from the network by Docker rather than by the worker
+            network = [] if self.allow_network else ["--network", "none"]
+            return ["docker", "run", "-i", "--rm", "--name", f"{DOCKER_NAME}-worker-{os.getpid()}-{self.worker_id}",
+                    *network, "-v", f"{REPO_ROOT}:{DOCKER_REPO_ROOT}", "-w", work_dir, DOCKER_NAME,
+                    "python", "-u", f"{DOCKER_REPO_ROOT}/agents/code_worker.py",
+                    "--work-dir", work_dir, "--scratch-dir", f"{work_dir}/{scratch_dir}", *limits]
+        network = [] if self.allow_network else ["--isolate-network"]
+        return [sys.executable, "-u", os.path.join(REPO_ROOT, "agents", "code_worker.py"),
+                "--work-dir", WORK_DIR, "--scratch-dir", os.path.join(WORK_DIR, scratch_dir), *limits, *network]
+
+    def start(self):
+        """Start the worker process and wait until it has loaded the preamble."""
+        os.makedirs(WORK_DIR, exist_ok=True)
+        self.process = subprocess.Popen(self.command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        cwd=WORK_DIR, text=True, bufsize=1)
+        self.uses = 0
+        self.broken = False
+        ready = self._read(STARTUP_TIMEOUT)
+        self.preloaded = ready.get("preloaded", [])
+        self.network_isolated = ready.get("network_isolated", False)
+        if ready.get("failed"):
+            print(f"Code worker {self.worker_id} could not preload: {', '.join(ready['failed'])}")
+        if self.backend == "local" and not self.allow_network and not self.network_isolated:
+            print(f"Code worker {self.worker_id} could not isolate the network, scripts can access it")
+
+    def stop(self):
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        try:
+            process.stdin.close()
+            process.wait(timeout=5)
+        except Exception:
+            process.kill()
+            process.wait()
+
+    def respawn(self):
+        self.stop()
+        self.start()
+
+    async def restart(self):
+        """Restart the worker process, as required by the autogen code executor interface."""
+        await asyncio.to_thread(self.respawn)
+
+    async def __aenter__(self):
+        await asyncio.to_thread(self.start)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await asyncio.to_thread(self.stop)
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def healthy(self):
+        """Check that the worker process answers a ping."""
+        if self.broken or not self.alive():
+            return False
+        try:
+            return self.request({"op": "ping"}, PING_TIMEOUT).get("ok", False)
+        except WorkerError:
+            return False
+
+    def _read(self, timeout):
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        line = self.process.stdout.readline() if ready else ''
+        if not line:
+            self.broken = True
+            raise WorkerError(f"Code worker {self.worker_id} did not answer within {timeout} seconds"
+                              if not ready else f"Code worker {self.worker_id} exited")
+        return json.loads(line)
+
+    def request(self, message, timeout):
+        with self.lock:
+            try:
+                self.process.stdin.write(json.dumps(message) + "\n")
+                self.process.stdin.flush()
+            except (OSError, ValueError, AttributeError) as e:
+                self.broken = True
+                raise WorkerError(f"Code worker {self.worker_id} is not running: {e}")
+            reply = self._read(timeout)
+        if "error" in reply:
+            raise WorkerError(reply["error"])
+        return reply
+
+    def run_code(self, code, language, filename):
+        # The worker kills scripts at the timeout, the extra time covers reading their output
+        return self.request({"op": "run", "code": code, "language": language, "filename": filename,
+                             "timeout": self.timeout}, self.timeout + 30)
+
+    async def execute_code_blocks(self, code_blocks, cancellation_token):
+        """
+        Run code blocks one after the other, stopping at the first failure, like the autogen command line executors.
+
+        Parameters:
+        - code_blocks (List[CodeBlock]): The python or shell code blocks to run.
+        - cancellation_token (CancellationToken): Token cancelling the execution.
+
+        Returns:
+        - CommandLineCodeResult: The exit code of the last block and the output of all blocks.
+        """
+        output = ""
+        code_files = []
+        exit_code = 0
+        for code_block in code_blocks:
+            language = code_block.language.lower()
+            code = silence_pip(code_block.code, language)
+            if language in PYTHON_LANGUAGES:
+                language = "python"
+            elif language in SHELL_LANGUAGES:
+                language = "sh"
+            else:
+                exit_code = 1
+                output += "\n" + f"unknown language {language}"
+                break
+
+            try:
+                filename = get_file_name_from_content(code, Path(WORK_DIR))
+            except ValueError:
+                return CommandLineCodeResult(exit_code=1, output="Filename is not in the workspace", code_file=None)
+            if filename is None:
+                code_hash = sha256(code.encode()).hexdigest()
+                filename = f"tmp_code_{code_hash}.{'py' if language == 'python' else 'sh'}"
+
+            task = asyncio.ensure_future(asyncio.to_thread(self.run_code, code, language, filename))
+            cancellation_token.link_future(task)
+            try:
+                result = await task
+            except asyncio.CancelledError:
+                # The script may still be running, so the worker is recycled
+                self.broken = True
+                output += "\n Cancelled"
+                exit_code = 125
+                break
+            except WorkerError as e:
+                output += "\n" + str(e)
+                exit_code = 1
+                break
+
+            output += result["output"]
+            code_files.append(result["code_file"])
+            exit_code = result["exit_code"]
+            if exit_code != 0:
+                break
+
+        result = CommandLineCodeResult(exit_code=exit_code, output=output,
+                                       code_file=code_files[0] if code_files else None)
+        self.executions.append((code_blocks, result))
+        return result
+
+
+class CodeExecutorPool:
+    """A fixed number of warm code workers handed out one request at a time."""
+
+    def __init__(self, size=CODE_EXECUTOR_POOL_SIZE, backend=CODE_EXECUTOR_BACKEND, max_uses=CODE_EXECUTOR_MAX_USES,
+                 timeout=CODE_EXECUTOR_TIMEOUT, memory_mb=CODE_EXECUTOR_MEMORY_MB,
+                 allow_network=CODE_EXECUTOR_ALLOW_NETWORK):
+        """
+        Parameters:
+        - size (int): Number of workers kept warm.
+        - backend (str): "docker", "local", or "auto" for Docker when it is installed and local otherwise.
+        - max_uses (int): Number of requests served by a worker before it is replaced by a fresh one.
+        - timeout (int): Seconds a script may run before it is killed.
+        - memory_mb (int): Largest address space of a script in megabytes, None for no limit.
+        - allow_network (bool): Whether the scripts may access the network.
+        """
+        self.backend = resolve_backend(backend)
+        self.max_uses = max_uses
+        self.workers = [CodeWorker(worker_id, self.backend, timeout, memory_mb, allow_network)
+                        for worker_id in range(size)]
+        self.idle = queue.Queue()
+        # Requests wait for a worker on their own threads. Waiting on the default executor of the event loop would
+        # take the threads the requests holding a worker need to run their code, and deadlock in bursts
+        self.acquire_executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="code-worker-acquire")
+        self.stats_lock = threading.Lock()
+        self._stats = {'requests': 0, 'restarts': 0, 'wait_seconds': 0.0}
+        self.closed = False
+
+        # Warm the workers in the background, each is handed out once its preamble is loaded
+        for worker in self.workers:
+            threading.Thread(target=self._warm, args=(worker,), daemon=True).start()
+
+    def _warm(self, worker):
+        try:
+            worker.start()
+        except Exception as e:
+            # Handed out anyway, the health check restarts it
+            print(f"Failed to start code worker {worker.worker_id}: {str(e)}")
+            worker.broken = True
+        self.idle.put(worker)
+
+    def _count(self, name, value=1):
+        with self.stats_lock:
+            self._stats[name] += value
+
+    def acquire(self):
+        """Take an idle worker, waiting for one if all are busy, and make sure it is healthy."""
+        if self.closed:
+            raise WorkerError("The code executor pool is closed")
+        start = time.perf_counter()
+        worker = self.idle.get()
+        try:
+            if not worker.healthy():
+                self._count('restarts')
+                worker.respawn()
+        except Exception:
+            self.idle.put(worker)
+            raise
+        worker.uses += 1
+        worker.executions = []
+        self._count('requests')
+        self._count('wait_seconds', time.perf_counter() - start)
+        return worker
+
+    def release(self, worker):
+        """Return a worker to the pool, replacing it first if it is broken or has served max_uses requests."""
+        if self.closed:
+            worker.stop()
+        elif worker.broken or worker.uses >= self.max_uses:
+            self._count('restarts')
+            worker.stop()
+            threading.Thread(target=self._warm, args=(worker,), daemon=True).start()
+        else:
+            self.idle.put(worker)
+
+    @asynccontextmanager
+    async def worker(self):
+        """Borrow a worker for the duration of a request: async with pool.worker() as code_executor: ..."""
+        future = self.acquire_executor.submit(self.acquire)
+        try:
+            worker = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # A worker acquired after the request was cancelled goes back to the pool
+            future.add_done_callback(
+                lambda done: done.cancelled() or done.exception() is not None or self.release(done.result()))
+            raise
+        try:
+            yield worker
+        finally:
+            self.release(worker)
+
+    def stats(self):
+        with self.stats_lock:
+            return dict(self._stats, backend=self.backend, size=len(self.workers))
+
+    def close(self):
+        self.closed = True
+        self.acquire_executor.shutdown(wait=False, cancel_futures=True)
+        for worker in self.workers:
+            worker.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_code_executor_pool():
+    """Return the shared code executor pool, starting its workers on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = CodeExecutorPool()
+            atexit.register(_pool.close)
+    return _pool
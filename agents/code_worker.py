@@ -0,0 +1,218 @@
+"""
+Code execution worker used by the code executor pool.
+
+The worker imports the standard preamble of generated code (numpy, pandas, sklearn, geopy, folium, ...) once, then
+reads JSON requests line by line from stdin and answers each with one JSON line on stdout. Every script runs in a
+forked child process, so it starts with the preamble already imported and cannot change the state of the worker.
+
+Requests:
+- {"op": "ping"}: health check, answered with the pid of the worker and the preloaded modules.
+- {"op": "run", "code": str, "language": "python" | "sh", "filename": str, "timeout": float}: write the code to
+  filename in the scratch directory of the worker and run it, answered with its exit code and output.
+
+Scripts are sandboxed with resource limits on their CPU time, memory, file size and core dumps, and are killed at
+their timeout. With --isolate-network the worker moves itself to an empty network namespace after loading the
+preamble, so the scripts cannot reach the network (Linux only).
+
+The worker runs the same way on the host and in the Docker container, e.g.
+python -u agents/code_worker.py --work-dir code_runs --scratch-dir code_runs/worker-0 --isolate-network
+"""
+import argparse
+import ctypes
+import importlib
+import json
+import math
+import os
+import resource
+import runpy
+import signal
+import sys
+import tempfile
+import time
+import traceback
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data_processing')))
+
+# Modules imported by the include statements of the code generation prompt
+PREAMBLE_MODULES = ["numpy", "pandas", "math", "datetime", "scipy.spatial", "sklearn.cluster", "shapely.geometry",
+                    "geopy.distance", "geopy.geocoders", "folium", "pytz",
+                    "data_processing.data_processing_utils", "data_streams.constants"]
+
+# Exit code of a script killed at its timeout, the same as the timeout command on linux
+TIMEOUT_EXIT_CODE = 124
+MAX_FILE_MB = 1024
+
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+
+
+def load_preamble(modules=PREAMBLE_MODULES):
+    """Import the preamble modules, returning the modules loaded and the modules that failed to import."""
+    loaded, failed = [], []
+    for module in modules:
+        try:
+            importlib.import_module(module)
+            loaded.append(module)
+        except Exception as e:
+            failed.append(f"{module}: {e}")
+    return loaded, failed
+
+
+def isolate_network():
+    """
+    Move the process to a new network namespace, which only has a loopback interface that is down.
+
+    Returns:
+    - bool: Whether the process was isolated.
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    libc = ctypes.CDLL(None, use_errno=True)
+    uid, gid = os.getuid(), os.getgid()
+    if libc.unshare(CLONE_NEWNET) == 0:
+        return True
+    # Unprivileged processes need their own user namespace to create a network namespace
+    if libc.unshare(CLONE_NEWUSER | CLONE_NEWNET) != 0:
+        return False
+    # Keep the same user and group inside the user namespace, so the files of the scripts keep their owner
+    try:
+        for path, content in (("/proc/self/setgroups", "deny"), ("/proc/self/uid_map", f"{uid} {uid} 1"),
+                              ("/proc/self/gid_map", f"{gid} {gid} 1")):
+            with open(path, "w") as f:
+                f.write(content)
+    except OSError:
+        pass
+    return True
+
+
+def apply_limits(timeout, memory_mb):
+    """
+    Limit the resources of the process running a script.
+
+    Parameters:
+    - timeout (float): Seconds of CPU time allowed, the wall clock timeout is enforced by the worker.
+    - memory_mb (int): Largest address space in megabytes, None for no limit.
+    """
+    cpu_seconds = math.ceil(timeout) + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (MAX_FILE_MB * 1024 * 1024, MAX_FILE_MB * 1024 * 1024))
+    if memory_mb:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_mb * 1024 * 1024, memory_mb * 1024 * 1024))
+
+
+def run_child(path, language, work_dir, output, timeout, memory_mb):
+    """Run a script in the forked child process. Never returns."""
+    exit_code = 1
+    try:
+        os.setsid()
+        apply_limits(timeout, memory_mb)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(output.fileno(), 1)
+        os.dup2(output.fileno(), 2)
+        os.chdir(work_dir)
+        if language == "python":
+            sys.argv = [path]
+            runpy.run_path(path, run_name="__main__")
+            exit_code = 0
+        else:
+            os.execvp("sh", ["sh", path])
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            exit_code = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exit_code)
+
+
+def wait_child(pid, timeout):
+    """Wait for a child process, killing its process group at the timeout. Returns its exit code, None on timeout."""
+    deadline = time.monotonic() + timeout
+    delay = 0.001
+    while True:
+        finished, status = os.waitpid(pid, os.WNOHANG)
+        if finished:
+            return os.waitstatus_to_exitcode(status)
+        if time.monotonic() >= deadline:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                # The child has not started its own process group yet
+                os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            return None
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+
+
+def run_code(request, work_dir, scratch_dir, memory_mb=None):
+    """Write the code of a run request to the scratch directory and run it in a forked child process."""
+    filename = os.path.basename(request.get("filename") or "code_generation.py")
+    path = os.path.join(scratch_dir, filename)
+    timeout = request.get("timeout", 60)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(request["code"])
+
+    with tempfile.TemporaryFile() as output:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            run_child(path, request.get("language", "python"), work_dir, output, timeout, memory_mb)
+        exit_code = wait_child(pid, timeout)
+        output.seek(0)
+        text = output.read().decode("utf-8", errors="replace")
+
+    if exit_code is None:
+        return {"exit_code": TIMEOUT_EXIT_CODE, "output": text + "\n Timeout", "code_file": path}
+    if exit_code == -signal.SIGXCPU:
+        text += "\n CPU time limit exceeded"
+    # Scripts killed by a signal get a negative exit code
+    return {"exit_code": exit_code if exit_code >= 0 else 128 - exit_code, "output": text, "code_file": path}
+
+
+def serve(work_dir, scratch_dir, modules=PREAMBLE_MODULES, memory_mb=None, network=True):
+    os.makedirs(scratch_dir, exist_ok=True)
+    # The protocol uses the original stdout, anything the worker itself prints goes to stderr
+    protocol = os.fdopen(os.dup(1), "w", buffering=1)
+    os.dup2(2, 1)
+    loaded, failed = load_preamble(modules)
+    # The preamble may need the network to load, the scripts do not get it
+    network_isolated = not network and isolate_network()
+
+    def reply(message):
+        protocol.write(json.dumps(message) + "\n")
+
+    reply({"ready": True, "pid": os.getpid(), "preloaded": loaded, "failed": failed,
+           "network_isolated": network_isolated})
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            if request.get("op") == "ping":
+                reply({"ok": True, "pid": os.getpid(), "preloaded": loaded})
+            elif request.get("op") == "run":
+                reply(run_code(request, work_dir, scratch_dir, memory_mb))
+            else:
+                reply({"error": f"Unknown operation: {request.get('op')}"})
+        except Exception as e:
+            reply({"error": str(e)})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run generated code with the import preamble preloaded.")
+    parser.add_argument("--work-dir", required=True, help="Directory the scripts run in.")
+    parser.add_argument("--scratch-dir", required=True, help="Directory the scripts are written to.")
+    parser.add_argument("--memory-mb", type=int, default=None, help="Largest address space of a script.")
+    parser.add_argument("--isolate-network", action="store_true", help="Run the scripts without network access.")
+    args = parser.parse_args()
+    serve(os.path.abspath(args.work_dir), os.path.abspath(args.scratch_dir), memory_mb=args.memory_mb,
+          network=not args.isolate_network)
@@ -1,16 +1,16 @@
 """
 This file defines a coding agent that can execute code based on user queries and
-system prompts in docker container.
+system prompts with a worker of the code executor pool.
 """
 
 import asyncio
 import logging
+import threading
 from autogen_agentchat import EVENT_LOGGER_NAME
 from autogen_agentchat.agents import CodeExecutorAgent, CodingAssistantAgent
 from autogen_agentchat.base import TaskResult
 from autogen_agentchat.logging import ConsoleLogHandler
 from autogen_agentchat.teams import RoundRobinGroupChat, StopMessageTermination
-from autogen_ext.code_executor.docker_executor import DockerCommandLineCodeExecutor
 
 import sys
 import os
@@ -20,24 +20,46 @@ from agents.llm_factory import get_llm_chat_openai
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from agents.agent_utils import generate_code_generation_prompt
-from agents.config import DOCKER_NAME
+from agents.code_executor_pool import get_code_executor_pool
 
 logger = logging.getLogger(EVENT_LOGGER_NAME)
 logger.addHandler(ConsoleLogHandler())
 logger.setLevel(logging.INFO)
 
+_shared_loop = None
+_shared_loop_lock = threading.Lock()
 
 
-async def coding_agent(user_query, system_prompt) -> TaskResult:
+def get_shared_loop():
+    """Return the event loop running synchronous coding agent calls, started in a daemon thread on first use."""
+    global _shared_loop
+    with _shared_loop_lock:
+        if _shared_loop is None:
+            _shared_loop = asyncio.new_event_loop()
+            threading.Thread(target=_shared_loop.run_forever, name="coding-agent-loop", daemon=True).start()
+    return _shared_loop
+
+
+async def coding_agent(user_query, system_prompt, executions=None) -> TaskResult:
+    """
+    Run the coding assistant and a code executor on a query until the assistant terminates.
+
+    Parameters:
+    - user_query (str): The query to answer.
+    - system_prompt (str): The system prompt of the coding assistant.
+    - executions (list): If given, filled with the (code blocks, result) of every code execution.
+
+    Returns:
+    - TaskResult: The messages of the conversation.
+    """
     from autogen_ext.models import AzureOpenAIChatCompletionClient
     from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 
     # Create the token provider
     client = get_llm_chat_openai()
 
-    async with DockerCommandLineCodeExecutor(work_dir="/Users/akshat/Desktop/Akshat/research/repos/llm-sensemaking/",
-                                             image="sensemaking-code", auto_remove=False,
-                                             stop_container=False) as code_executor:
+    # A warm worker with the imports of generated code loaded, kept for every code round of the request
+    async with get_code_executor_pool().worker() as code_executor:
         code_executor_agent = CodeExecutorAgent("code_executor", code_executor=code_executor)
         coding_assistant_agent = CodingAssistantAgent(
             "coding_assistant", model_client=client, system_message=system_prompt
@@ -49,10 +71,21 @@ async def coding_agent(user_query, system_prompt) -> TaskResult:
             task=user_query,
             termination_condition=StopMessageTermination(),
         )
+        if executions is not None:
+            executions.extend(code_executor.executions)
 
     return result  # Return result of async call
 
-def run_coding_agent(user_query, database, functions, include_statements, function_imports):
+async def run_coding_agent_async(user_query, database, functions, include_statements, function_imports,
+                                 executions=None):
     system_prompt = generate_code_generation_prompt(req_databases=database, functions=functions, include_statements=include_statements, function_imports=function_imports)
-    results = asyncio.run(coding_agent(user_query, system_prompt))
+    return await coding_agent(user_query, system_prompt, executions)
+
+
+def run_coding_agent(user_query, database, functions, include_statements, function_imports, executions=None):
+    # Runs on the shared event loop rather than creating a new loop for every call
+    future = asyncio.run_coroutine_threadsafe(
+        run_coding_agent_async(user_query, database, functions, include_statements, function_imports, executions),
+        get_shared_loop())
+    results = future.result()
     return results
@@ -4,3 +4,32 @@ ONLY_CODE_FUNCTIONS = True
 VERBOSE = True
 DOCKER_NAME = "gloss-sensemaking-code"
 USE_CSV = True
+DAILY_SUMMARY_WORKERS = 4
+GEOCODE_CACHE_PATH = "../cache/geocode_cache.sqlite"
+GEOCODE_CACHE_RADIUS_METERS = 25
+GEOCODE_CACHE_TTL_DAYS = 90
+GEOCODE_GAZETTEER_PATH = None
+PLACE_TOP_K = 5
+MAP_POINT_BUDGET = 2000
+MAP_SIMPLIFY_TOLERANCE_METERS = 10
+PLOT_MAX_POINTS = 2000
+LLM_CACHE_ENABLED = False
+LLM_CACHE_PATH = "../cache/llm_cache.sqlite"
+LLM_CACHE_MAX_ENTRIES = 10000
+LLM_CACHE_MAX_MB = 512
+FUNCTION_CALL_WORKERS = 4
+MEMORY_TOKEN_BUDGET = 4000
+MEMORY_KEEP_RECENT = 2
+MULTI_REQUEST_SEEKING = False
+MAX_PARALLEL_REQUESTS = 3
+CODE_EXECUTOR_POOL_SIZE = 2
+CODE_EXECUTOR_MAX_USES = 20
+CODE_EXECUTOR_TIMEOUT = 60
+# "docker", or "local" to run generated code on the host without filesystem isolation, or "auto" for Docker when it
+# is installed and local otherwise
+CODE_EXECUTOR_BACKEND = "docker"
+CODE_EXECUTOR_MEMORY_MB = 4096
+CODE_EXECUTOR_ALLOW_NETWORK = False  # Needed by generated code reading MongoDB (USE_CSV = False) or geocoding
+CODE_CACHE_ENABLED = False
+CODE_CACHE_PATH = "../cache/code_cache.sqlite"
+CODE_CACHE_MAX_ENTRIES = 1000
@@ -5,7 +5,11 @@ Contains functions to run data extraction functions based on a given dictionary
 import os
 import sys
 
+import asyncio
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -22,6 +26,8 @@ import data_streams.app_usage_data as app_usage_data
 import data_streams.battery_data as battery_data
 import data_streams.call_log as call_log
 import models.stress_prediction_model as stress
+from agents.config import FUNCTION_CALL_WORKERS
+from agents.database_registry import prepare_function_call
 
 all_functions = {**activity_data.functions, **location_data.functions, **phone_steps_data.functions,
                  **heart_rate_data.functions, **lock_unlock_data.functions, **garmin_steps_data.functions,
@@ -29,37 +35,14 @@ all_functions = {**activity_data.functions, **location_data.functions, **phone_s
                  **stress.functions}
 
 
-def run_function_from_dict(function_name, params, type):
+def run_function_from_dict(function_name, params, type=None):
     try:
-        # Access the function from the module's namespace
-        if type == 'activity':
-            func = getattr(activity_data, function_name)
-        if type == 'location':
-            func = getattr(location_data, function_name)
-        if type == 'phone_steps':
-            func = getattr(phone_steps_data, function_name)
-        if type == 'heart_rate':
-            func = getattr(heart_rate_data, function_name)
-        if type == 'lock_unlock':
-            func = getattr(lock_unlock_data, function_name)
-        if type == 'garmin_steps':
-            func = getattr(garmin_steps_data, function_name)
-        if type == 'wifi':
-            func = getattr(wifi_data, function_name)
-        if type == 'app_usage':
-            func = getattr(app_usage_data, function_name)
-        if type == 'phone_battery':
-            func = getattr(battery_data, function_name)
-        if type == 'call_log':
-            func = getattr(call_log, function_name)
-        if type == 'stress':
-            func = getattr(stress, function_name)
+        # Look up, validate and coerce the call through the registry dispatch table
+        func, params = prepare_function_call(function_name, params)
 
         output = func(**params)
         return output
 
-    except AttributeError as e:
-        print(f"Function {function_name} not found in module: {e}")
     except Exception as e:
         print(f"An error occurred: {e}")
 
@@ -89,48 +72,197 @@ def extract_data(chain_output, data_type):
     return final_results
 
 
-def extract_data_multiple_type(chain_output, coding_function=None):
-    final_results = []
-    chain_output = chain_output.content
-    dict_output = json_to_dict(chain_output)
-    for d in dict_output:
-        func_name = dict_output[d]['name']
-        function_id = d
-        data_type = ""
-        if "STRESS" in function_id:
-            data_type = 'stress'
-        if "LOC" in function_id:
-            data_type = 'location'
-        if "ACT" in function_id:
-            data_type = 'activity'
-        if "PHONE" in function_id:
-            data_type = 'phone_steps'
-        if "GARMINHR" in function_id:
-            data_type = 'heart_rate'
-        if "UL" in function_id:
-            data_type = 'lock_unlock'
-        if "WIFI" in function_id:
-            data_type = 'wifi'
-        if "GARMINSTEP" in function_id:
-            data_type = 'garmin_steps'
-        if "APP" in function_id:
-            data_type = 'app_usage'
-        if "BATTERY" in function_id:
-            data_type = 'phone_battery'
-        if "CALLLOG" in function_id:
-            data_type = 'call_log'
-        if "BRIGHTNESS" in function_id:
-            data_type = 'brightness'
-        if "CODING" in function_id:
-            if coding_function:
-                params = dict_output[d]['params']
-                query = params['user_query']
-                final_results.append({"func": dict_output[d], "result": coding_function(query), "func_id": d})
-                continue
+def function_call_result(function_id, call, start, result, error):
+    if error is not None:
+        print(f"An error occurred in {function_id} ({call.get('name')}): {error}")
+    return {"func": call, "result": result, "func_id": function_id, "latency": time.perf_counter() - start,
+            "error": error}
 
-        res = run_function_from_dict(func_name, dict_output[d]['params'], data_type)
-        final_results.append({"func": dict_output[d], "result": res, "func_id": d})
-    return final_results
+
+def run_function_call(function_id, call, coding_function=None):
+    """
+    Run one function call of the LLM and time it.
+
+    Parameters:
+    - function_id (str): The function ID, e.g. 'LOC2' or 'CODING1'.
+    - call (dict): The call, with the function 'name' and its 'params'.
+    - coding_function (callable): Function answering CODING calls from their 'user_query' param.
+
+    Returns:
+    - dict: The call ('func'), its 'result', 'func_id', 'latency' in seconds and 'error' (None if it succeeded).
+    """
+    start = time.perf_counter()
+    result, error = None, None
+    try:
+        if "CODING" in function_id and coding_function:
+            result = coding_function(call['params']['user_query'])
+        else:
+            func, params = prepare_function_call(call.get('name'), call.get('params', {}), function_id)
+            result = func(**params)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return function_call_result(function_id, call, start, result, error)
+
+
+async def run_coding_call_async(function_id, call, coding_function):
+    """Run a CODING call with an async coding function and time it, like run_function_call."""
+    start = time.perf_counter()
+    result, error = None, None
+    try:
+        result = await coding_function(call['params']['user_query'])
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return function_call_result(function_id, call, start, result, error)
+
+
+class FunctionCallMemo:
+    """
+    Session-scoped memo of function call results, keyed by function name and canonical params, so calls the LLM
+    repeats across sensemaking iterations are answered without running the function again.
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            return self.results.get(key)
+
+    def put(self, key, name, params, result):
+        with self.lock:
+            self.results[key] = result
+            self.calls[key] = {"name": name, "params": params, "status": "already fetched"}
+
+    def fetched_calls(self):
+        """Return the calls whose results are memoized, to show the LLM what has already been fetched."""
+        with self.lock:
+            return list(self.calls.values())
+
+
+def function_call_key(function_id, call, coding_function=None, coding_scope=None):
+    """
+    Build the memo key of a function call from the function name and its canonical params.
+
+    Data function params are validated and coerced first, so calls differing only in param order or types share a
+    key. CODING calls are keyed by their whitespace-normalized query and the databases the code can use.
+
+    Returns:
+    - tuple: (key, name, params), or None if the call is invalid.
+    """
+    if "CODING" in function_id and coding_function:
+        name = "get_results_through_data_computation"
+        params = {"user_query": " ".join(str(call.get('params', {}).get('user_query', '')).split()),
+                  "databases": sorted(coding_scope or [])}
+    else:
+        try:
+            func, params = prepare_function_call(call.get('name'), call.get('params', {}), function_id)
+        except ValueError:
+            return None
+        name = func.__name__
+    return name + json.dumps(params, sort_keys=True, default=str), name, params
+
+
+def extract_data_multiple_type(chain_output, coding_function=None, max_workers=FUNCTION_CALL_WORKERS, memo=None,
+                               coding_scope=None):
+    """
+    Run the function calls chosen by the LLM concurrently.
+
+    Data function calls run in a pool of max_workers threads, and CODING calls run one at a time on their own
+    worker so a slow code generation does not hold up the data calls. Calls found in the memo are answered from it,
+    and identical calls of the same batch run once.
+
+    Parameters:
+    - chain_output (AIMessage): LLM output whose content is a JSON dict of {function ID: {"name", "params"}}.
+    - coding_function (callable): Function answering CODING calls from their 'user_query' param.
+    - max_workers (int): Number of threads running data function calls.
+    - memo (FunctionCallMemo): Session memo of earlier results, updated with the successful calls.
+    - coding_scope (list): Databases available to coding_function, part of the memo key of CODING calls.
+
+    Returns:
+    - list: The results of run_function_call, in the order of the calls, with 'cached' set for memo hits.
+    """
+    calls, call_keys, keys, results, owners = plan_function_calls(chain_output, coding_function, memo, coding_scope)
+    with ThreadPoolExecutor(max_workers=max_workers) as data_pool, ThreadPoolExecutor(max_workers=1) as coding_pool:
+        futures = {}
+        for key, i in owners.items():
+            function_id, call = calls[i]
+            pool = coding_pool if "CODING" in function_id and coding_function else data_pool
+            futures[key] = pool.submit(run_function_call, function_id, call, coding_function)
+        owner_results = {key: future.result() for key, future in futures.items()}
+    return collect_function_results(calls, call_keys, keys, results, owners, owner_results, memo)
+
+
+async def extract_data_multiple_type_async(chain_output, coding_function=None, max_workers=FUNCTION_CALL_WORKERS,
+                                           memo=None, coding_scope=None):
+    """
+    Asynchronous variant of extract_data_multiple_type. CODING calls await the async coding_function on the running
+    event loop, and data function calls run in threads, at most max_workers at a time.
+
+    Parameters:
+    - chain_output (AIMessage): LLM output whose content is a JSON dict of {function ID: {"name", "params"}}.
+    - coding_function (coroutine function): Async function answering CODING calls from their 'user_query' param.
+    - max_workers (int): Number of data function calls running at once.
+    - memo (FunctionCallMemo): Session memo of earlier results, updated with the successful calls.
+    - coding_scope (list): Databases available to coding_function, part of the memo key of CODING calls.
+
+    Returns:
+    - list: The results of run_function_call, in the order of the calls, with 'cached' set for memo hits.
+    """
+    calls, call_keys, keys, results, owners = plan_function_calls(chain_output, coding_function, memo, coding_scope)
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def run(function_id, call):
+        if "CODING" in function_id and coding_function:
+            return await run_coding_call_async(function_id, call, coding_function)
+        async with semaphore:
+            return await asyncio.to_thread(run_function_call, function_id, call)
+
+    owner_results = await asyncio.gather(*[run(*calls[i]) for i in owners.values()])
+    owner_results = dict(zip(owners.keys(), owner_results))
+    return collect_function_results(calls, call_keys, keys, results, owners, owner_results, memo)
+
+
+def plan_function_calls(chain_output, coding_function, memo, coding_scope):
+    """
+    Parse the function calls of the LLM, answer the ones found in the memo and pick the calls to run.
+
+    Returns:
+    - tuple: (calls, call_keys, keys, results, owners) where results holds the memo hits and owners maps the key of
+      every call to run to the index of its first occurrence.
+    """
+    calls = list(json_to_dict(chain_output.content).items())
+    call_keys = [function_call_key(function_id, call, coding_function, coding_scope) if memo is not None else None
+                 for function_id, call in calls]
+    # Calls without a memo key are keyed by their position so they always run
+    keys = [call_key[0] if call_key else i for i, call_key in enumerate(call_keys)]
+
+    results = [None] * len(calls)
+    owners = {}
+    for i, (function_id, call) in enumerate(calls):
+        cached = memo.get(keys[i]) if call_keys[i] else None
+        if cached is not None:
+            results[i] = dict(cached, func=call, func_id=function_id, latency=0.0, cached=True)
+        elif keys[i] not in owners:
+            owners[keys[i]] = i
+    return calls, call_keys, keys, results, owners
+
+
+def collect_function_results(calls, call_keys, keys, results, owners, owner_results, memo):
+    """Fill the results of the calls that ran, memoizing the successful ones, in the order of the calls."""
+    for i, (function_id, call) in enumerate(calls):
+        if results[i] is not None:
+            continue
+        result = owner_results[keys[i]]
+        if owners[keys[i]] == i:
+            results[i] = dict(result, cached=False)
+            if call_keys[i] and result['error'] is None:
+                memo.put(*call_keys[i], results[i])
+        else:
+            # A repeated call of the batch shares the result of its first occurrence
+            results[i] = dict(result, func=call, func_id=function_id, latency=0.0, cached=True)
+    return results
 
 
 if __name__ == "__main__":
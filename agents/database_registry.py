@@ -6,6 +6,7 @@ import os
 import sys
 import importlib
 import inspect
+import json
 from typing import Dict, List, Any, Callable
 from dataclasses import dataclass
 
@@ -20,11 +21,58 @@ class DatabaseInfo:
     function_refs: Dict[str, Callable] = None     # Actual function references
     module_path: str = ""
 
+@dataclass
+class FunctionEntry:
+    """A callable data function with the metadata used to validate its calls"""
+    function_id: str
+    name: str
+    function: Callable
+    params: Dict[str, Dict[str, Any]]
+    signature: inspect.Signature
+    database: str
+
+def _coerce_param(name: str, value: Any, param_type: str) -> Any:
+    """Coerce a parameter value of an LLM function call to the type declared in the function metadata"""
+    if param_type in ('str', 'string'):
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise ValueError(f"Parameter '{name}' should be a string, got {value!r}")
+        return str(value)
+    if param_type == 'int':
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, str) and value.strip().lstrip('+-').isdigit():
+            return int(value)
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise ValueError(f"Parameter '{name}' should be an integer, got {value!r}")
+        return value
+    if param_type == 'float':
+        if isinstance(value, bool):
+            raise ValueError(f"Parameter '{name}' should be a number, got {value!r}")
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Parameter '{name}' should be a number, got {value!r}")
+    if param_type in ('list', 'dict'):
+        expected = list if param_type == 'list' else dict
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except json.JSONDecodeError:
+                raise ValueError(f"Parameter '{name}' should be a {param_type}, got {value!r}")
+        if isinstance(value, tuple) and expected is list:
+            value = list(value)
+        if not isinstance(value, expected):
+            raise ValueError(f"Parameter '{name}' should be a {param_type}, got {value!r}")
+        return value
+    return value
+
 class DatabaseRegistry:
     """Centralized registry for all databases and their functions"""
     
     def __init__(self):
         self.databases: Dict[str, DatabaseInfo] = {}
+        # Dispatch table of function IDs and names to their FunctionEntry, filled as databases are registered
+        self.dispatch_table: Dict[str, FunctionEntry] = {}
         self._load_databases()
     
     def _load_databases(self):
@@ -119,6 +167,75 @@ class DatabaseRegistry:
             function_refs=function_refs or {},
             module_path=module_path
         )
+        self._add_to_dispatch_table(self.databases[name])
+
+    def _add_to_dispatch_table(self, db: DatabaseInfo):
+        """Resolve the callable of every function of a database and add it to the dispatch table by ID and name"""
+        module = None
+        for function_id, metadata in db.functions.items():
+            name = metadata.get('name')
+            function = db.function_refs.get(name)
+            if function is None and db.module_path:
+                # Databases without function_refs are dispatched to the functions of their module
+                if module is None:
+                    module = importlib.import_module(db.module_path)
+                function = getattr(module, name, None)
+            if function is None:
+                continue
+            entry = FunctionEntry(function_id=function_id, name=name, function=function,
+                                  params=metadata.get('params', {}), signature=inspect.signature(function),
+                                  database=db.name)
+            # The first database registering a function ID or name keeps it
+            self.dispatch_table.setdefault(function_id, entry)
+            self.dispatch_table.setdefault(name, entry)
+
+    def get_function_entry(self, name: str, function_id: str = None) -> FunctionEntry:
+        """Get the dispatch entry of a function by name, falling back to its function ID"""
+        entry = self.dispatch_table.get(name)
+        if entry is None and function_id is not None:
+            entry = self.dispatch_table.get(function_id)
+        if entry is None:
+            raise ValueError(f"Unknown function '{name}' ({function_id})")
+        return entry
+
+    def prepare_function_call(self, name: str, params: Dict[str, Any], function_id: str = None):
+        """
+        Validate an LLM function call against the function metadata and signature, coercing the parameters to
+        their declared types.
+
+        Parameters:
+        - name (str): The function name.
+        - params (dict): The parameters of the call.
+        - function_id (str): The function ID, used when the name is unknown.
+
+        Returns:
+        - tuple: (function, params) ready to be called as function(**params).
+
+        Raises:
+        - ValueError: If the function is unknown, a parameter is missing or unexpected, or has the wrong type.
+        """
+        entry = self.get_function_entry(name, function_id)
+        if not isinstance(params, dict):
+            raise ValueError(f"Parameters of '{entry.name}' should be a dict, got {params!r}")
+
+        accepts_any = any(p.kind == p.VAR_KEYWORD for p in entry.signature.parameters.values())
+        arguments = {p.name: p for p in entry.signature.parameters.values()
+                     if p.kind not in (p.VAR_POSITIONAL, p.VAR_KEYWORD)}
+        unexpected = [key for key in params if key not in arguments]
+        if unexpected and not accepts_any:
+            raise ValueError(f"Unexpected parameters for '{entry.name}': {unexpected}")
+        missing = [key for key, p in arguments.items() if p.default is p.empty and key not in params]
+        if missing:
+            raise ValueError(f"Missing parameters for '{entry.name}': {missing}")
+
+        coerced = {}
+        for key, value in params.items():
+            if value is None and key in arguments and arguments[key].default is None:
+                # Explicitly passing an optional parameter's None default
+                coerced[key] = value
+            else:
+                coerced[key] = _coerce_param(key, value, entry.params.get(key, {}).get('type'))
+        return entry.function, coerced
     
     def get_database(self, name: str) -> DatabaseInfo:
         """Get database by name"""
@@ -198,3 +315,11 @@ def get_all_functions() -> Dict[str, Dict[str, Any]]:
 def get_all_function_refs() -> Dict[str, Callable]:
     """Get all actual function references from all databases"""
     return registry.get_all_function_refs()
+
+def get_function_entry(name: str, function_id: str = None) -> FunctionEntry:
+    """Get the dispatch entry of a function by name, falling back to its function ID"""
+    return registry.get_function_entry(name, function_id)
+
+def prepare_function_call(name: str, params: Dict[str, Any], function_id: str = None):
+    """Validate and coerce an LLM function call, returning (function, params)"""
+    return registry.prepare_function_call(name, params, function_id)
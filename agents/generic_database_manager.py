@@ -11,13 +11,14 @@ from data_streams.generic_coding_functions import GenericCodingFunctions
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from agents.data_driver import run_function_from_dict, json_to_dict, extract_data_multiple_type
+from agents.data_driver import run_function_from_dict, json_to_dict, extract_data_multiple_type, \
+    extract_data_multiple_type_async, FunctionCallMemo
 from agent_utils import generate_function_calling_prompt
 from agents.llm_factory import get_llmchat
 from agents.database_registry import get_all_databases, get_functions_for_database, get_database
 from agents.config import ONLY_CODE_FUNCTIONS
 
-llmchat = get_llmchat()
+llmchat = get_llmchat("generic_database_manager")
 
 '''This module defines a generic database manager agent that take a information request and requried databases. 
 It then passes all helper functions to the Coding Agent to generate the code that can answer the question.'''
@@ -27,8 +28,45 @@ class GenericDatabaseManager:
         self.database_chain = self.database_agent()
         self.function_call_history = []
         self.coding_function = None
+        self.coding_databases = []
+        # Results of the calls made during this session, reused when the LLM repeats a call
+        self.memo = FunctionCallMemo()
 
     def invoke(self, input_params):
+        request = self.prepare_request(input_params)
+        if "NOT POSSIBLE" in request:
+            return request
+
+        database_chain = self.database_agent(request['coding_function'], request['databases'])
+        info_chain = database_chain.invoke(
+            {'user_query': input_params['user_query'], 'function_call_history': request['function_call_history'],
+             'prompt': request['prompt']})
+
+        return info_chain
+
+    async def ainvoke(self, input_params):
+        """Asynchronous invoke, awaiting the LLM and the function calls it chooses"""
+        request = self.prepare_request(input_params)
+        if "NOT POSSIBLE" in request:
+            return request
+
+        chain_output = await self.request_chain().ainvoke(
+            {'user_query': input_params['user_query'], 'function_call_history': request['function_call_history'],
+             'prompt': request['prompt']})
+        calls = json.loads(chain_output.content)
+        if ("NOT POSSIBLE" in calls or "TERMINATE" in calls):
+            return calls
+        return await extract_data_multiple_type_async(chain_output, request['coding_function_async'],
+                                                      memo=self.memo, coding_scope=request['databases'])
+
+    def prepare_request(self, input_params):
+        """
+        Build the function calling prompt for the requested databases.
+
+        Returns:
+        - dict: The 'prompt', the 'coding_function' (and its 'coding_function_async' variant) bound to the requested
+          'databases', and the 'function_call_history', or {"NOT POSSIBLE": reason} if no functions are available.
+        """
         req_databases = input_params["databases"]
         
         # Normalize database names (add " database" suffix if missing)
@@ -73,7 +111,13 @@ class GenericDatabaseManager:
         else:
             cfs = calling_functions
 
-        self.coding_function = coding_functions_obj.get_results_through_data_computation
+        # The coding function and its databases are returned with the prompt and bound to this call's chain, so
+        # concurrent requests do not run each other's coding functions
+        coding_function = coding_functions_obj.get_results_through_data_computation
+        self.coding_function = coding_function
+        self.coding_databases = normalized_databases
+        function_call_history = self.memo.fetched_calls()
+        self.function_call_history = function_call_history
 
         # Create prompt with database and function information
         input_instructions = f"""You are manager for following databases: \n{database_info}
@@ -98,19 +142,25 @@ class GenericDatabaseManager:
         '''
 
         prompt = generate_function_calling_prompt(input_instructions, cfs, output_instructions)
-        info_chain = self.database_chain.invoke(
-            {'user_query': input_params['user_query'], 'function_call_history': self.function_call_history,
-             'prompt': prompt})
+        return {'prompt': prompt, 'coding_function': coding_function,
+                'coding_function_async': coding_functions_obj.get_results_through_data_computation_async,
+                'databases': normalized_databases, 'function_call_history': function_call_history}
 
-        return info_chain
-
-    def extract_data_step(self, chain_output):
+    def extract_data_step(self, chain_output, coding_function=None, coding_databases=None):
         calls = json.loads(chain_output.content)
         if ("NOT POSSIBLE" in calls or "TERMINATE" in calls):
             return calls
-        return extract_data_multiple_type(chain_output, self.coding_function)
+        if coding_function is None:
+            coding_function, coding_databases = self.coding_function, self.coding_databases
+        return extract_data_multiple_type(chain_output, coding_function, memo=self.memo,
+                                          coding_scope=coding_databases)
+
+    def database_agent(self, coding_function=None, coding_databases=None):
+        chain = (self.request_chain() |
+                 (lambda chain_output: self.extract_data_step(chain_output, coding_function, coding_databases)))
+        return chain
 
-    def database_agent(self):
+    def request_chain(self):
         prompt = """{prompt}"""
 
         template = ChatPromptTemplate.from_messages(
@@ -120,7 +170,7 @@ class GenericDatabaseManager:
             ]
         )
 
-        chain = (template | llmchat | self.extract_data_step)
+        chain = (template | llmchat)
         return chain
 
 
@@ -9,7 +9,7 @@ from langchain_core.runnables import RunnablePassthrough
 from pydantic import BaseModel, Field
 from agents.llm_factory import get_llmchat
 
-llmchat = get_llmchat()
+llmchat = get_llmchat("heartrate_summarizer")
 
 
 class Output(BaseModel):
@@ -11,8 +11,9 @@ from pydantic import BaseModel, Field
 from langchain_core.output_parsers import JsonOutputParser
 from agents.llm_factory import get_llmchat
 from agents.database_registry import get_all_databases
+from agents.config import MAX_PARALLEL_REQUESTS
 
-llmchat = get_llmchat()
+llmchat = get_llmchat("information_seeking_agent")
 
 
 class Output(BaseModel):
@@ -20,11 +21,32 @@ class Output(BaseModel):
     request: str = Field(description="data request made to the databases")
 
 
+class OutputMultiple(BaseModel):
+    requests: list[Output] = Field(description="independent data requests made to the databases")
+
+
 class InformationSeekingAgent:
     def __init__(self):
         self.information_chain = self.information_agent()
+        self.multiple_information_chain = self.information_agent(max_requests=MAX_PARALLEL_REQUESTS)
 
     def invoke(self, input_params):
+        return self.invoke_chain(self.information_chain, input_params)
+
+    def invoke_multiple(self, input_params):
+        """Ask for up to MAX_PARALLEL_REQUESTS independent requests, returned as {"requests": [...]}"""
+        return self.invoke_chain(self.multiple_information_chain, input_params)
+
+    async def ainvoke(self, input_params):
+        return await self.information_chain.ainvoke(self.chain_inputs(input_params))
+
+    async def ainvoke_multiple(self, input_params):
+        return await self.multiple_information_chain.ainvoke(self.chain_inputs(input_params))
+
+    def invoke_chain(self, chain, input_params):
+        return chain.invoke(self.chain_inputs(input_params))
+
+    def chain_inputs(self, input_params):
         # Get databases from registry
         databases = get_all_databases()
 
@@ -35,15 +57,29 @@ class InformationSeekingAgent:
             for idx, (db_name, db_info) in enumerate(databases.items())
         )
 
-        info_chain = self.information_chain.invoke({'understanding': input_params['understanding'],
-                                                    'user_query': input_params['user_query'],
-                                                    'action_plan': input_params['action_plan'],
-                                                    'memory': input_params['memory'],
-                                                    'databases_section': databases_section})
-
-        return info_chain
+        return {'understanding': input_params['understanding'],
+                'user_query': input_params['user_query'],
+                'action_plan': input_params['action_plan'],
+                'memory': input_params['memory'],
+                'databases_section': databases_section}
 
-    def information_agent(self):
+    def information_agent(self, max_requests=None):
+        """
+        Create the information seeking chain, returning one request, or up to max_requests independent requests
+        when max_requests is set.
+        """
+        if max_requests:
+            output_format = f"""
+   output format: {{{{"requests": [{{{{"database": "databases needed", "request": request made to the databases}}}}, ...]}}}}
+   example: {{{{"requests": [{{{{"database": "database1", "request": "summarize data for user_id 1234"}}}}, {{{{"database": "database2, database3", "request": "total steps for user_id 1234"}}}}]}}}}
+
+   you can make up to {max_requests} requests at once. only make several requests when they are independent, i.e. none of them needs the answer of another one, as they are answered at the same time.
+   """
+        else:
+            output_format = """
+   output format: {{"database": "databases needed", "request": request made to the databases}}
+   example: {{"database": "database1, database2", "request": "summarize data for user_id 1234"}}
+   """
         prompt = """
     Task: Your role is to create a very specific information request to the databases to answer the QUESTION based on the UNDERSTANDING and ACTION PLAN and MEMORY. 
     UNDERSTANDING might contain partial answer to user query and might have information on what additional data is needed. ACTION PLAN can also help in deciding what data is needed. MEMORY contains all the data already fetched from the databases. 
@@ -71,10 +107,7 @@ class InformationSeekingAgent:
     
         
    {databases_section}
-   
-   output format: {{"database": "databases needed", "request": request made to the databases}}
-   example: {{"database": "database1, database2", "request": "summarize data for user_id 1234"}}
-   
+   """ + output_format + """
    database name should be taken from information above
    
    your request should be specific having specific time, date, user_id, and other details:
@@ -106,7 +139,7 @@ class InformationSeekingAgent:
         10. Make you request in lowercase. Do not capitalize any words in your request.     
         11. If understanding says it does not contain a particular kind of data trust it.          
         """
-        parser = JsonOutputParser(pydantic_object=Output)
+        parser = JsonOutputParser(pydantic_object=OutputMultiple if max_requests else Output)
 
         prompt = PromptTemplate(
             template=prompt + '\n {format_instructions}',
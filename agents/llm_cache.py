@@ -0,0 +1,109 @@
+"""
+Persistent cache of LLM responses.
+
+Responses are stored in SQLite keyed by the hash of the model configuration and the whitespace-normalized prompt,
+so re-running a query or replaying a benchmark answers identical calls from disk. The cache is bounded by a number
+of entries and a size in megabytes; the least recently used entries are evicted first. Hits and misses are counted
+per agent.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+from agents.config import LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_MB
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def normalize_prompt(prompt):
+    """
+    Collapse whitespace runs so prompts differing only in indentation or line breaks share an entry. Chat prompts
+    are serialized as JSON, so escaped whitespace is collapsed as well, and dropped at the ends of strings.
+    """
+    prompt = re.sub(r'(?:\s|\\[ntr])+', ' ', prompt)
+    return re.sub(r' ?" ?', '"', prompt).strip()
+
+
+def cache_key(prompt, llm_string):
+    return hashlib.sha256((llm_string + '\x00' + normalize_prompt(prompt)).encode('utf-8')).hexdigest()
+
+
+def get_cache_stats():
+    """Return the hits and misses of the LLM cache per agent."""
+    with _stats_lock:
+        return {name: dict(stats) for name, stats in _stats.items()}
+
+
+class SQLiteLLMCache(BaseCache):
+    """LangChain cache storing the responses of an agent's chat model in SQLite."""
+
+    def __init__(self, agent_name="default", cache_path=LLM_CACHE_PATH, max_entries=LLM_CACHE_MAX_ENTRIES,
+                 max_mb=LLM_CACHE_MAX_MB):
+        self.agent_name = agent_name
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.max_bytes = max_mb * 1024 * 1024
+        with _stats_lock:
+            _stats.setdefault(agent_name, {'hits': 0, 'misses': 0})
+
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, llm_string TEXT, "
+                               "value TEXT, size INTEGER, created_at REAL, last_used REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
+
+    def _connect(self):
+        return sqlite3.connect(self.cache_path, timeout=30)
+
+    def _count(self, outcome):
+        with _stats_lock:
+            _stats[self.agent_name][outcome] += 1
+
+    def lookup(self, prompt, llm_string):
+        key = cache_key(prompt, llm_string)
+        with self._connect() as connection:
+            row = connection.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        if row is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return loads(row[0], allowed_objects='core')
+
+    def update(self, prompt, llm_string, return_val):
+        value = dumps(return_val)
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?)",
+                               (cache_key(prompt, llm_string), llm_string, value, len(value.encode('utf-8')), now,
+                                now))
+            self.evict(connection)
+
+    def evict(self, connection):
+        """Delete the least recently used entries until the cache is within its entry and size limits."""
+        num_entries, total_size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if num_entries <= self.max_entries and total_size <= self.max_bytes:
+            return
+        rows = connection.execute("SELECT key, size FROM llm_cache ORDER BY last_used").fetchall()
+        evicted = []
+        for key, size in rows:
+            if num_entries <= self.max_entries and total_size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            num_entries -= 1
+            total_size -= size
+        connection.executemany("DELETE FROM llm_cache WHERE key = ?", evicted)
+
+    def clear(self, **kwargs):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM llm_cache")
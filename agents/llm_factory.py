@@ -8,20 +8,25 @@ import langchain_openai as lcai
 from autogen_ext.models._openai._openai_client import OpenAIChatCompletionClient
 from langchain_openai import ChatOpenAI
 
-from agents.config import USE_AZURE, USE_GPT5
+from agents.config import USE_AZURE, USE_GPT5, LLM_CACHE_ENABLED
+from agents.llm_cache import SQLiteLLMCache
 
 
-def get_llmchat():
+def get_llmchat(agent_name="default"):
     """Return a configured chat LLM instance based on config flags.
 
+    When LLM_CACHE_ENABLED is set, responses are cached on disk and the cache hits and misses are counted under
+    agent_name.
+
     Priority:
     - If USE_GPT_OSS: return GPTOSSChatModel
     - Else if USE_GPT5: return OpenAI gpt-5
     - Else if USE_AZURE: return AzureChatOpenAI gpt-4o
     - Else: return OpenAI gpt-4o
     """
+    cache = SQLiteLLMCache(agent_name) if LLM_CACHE_ENABLED else None
     if USE_GPT5:
-        return ChatOpenAI(openai_api_key=os.getenv("OPENAI_API_KEY"), model_name="gpt-5")
+        return ChatOpenAI(openai_api_key=os.getenv("OPENAI_API_KEY"), model_name="gpt-5", cache=cache)
     if USE_AZURE:
         return lcai.AzureChatOpenAI(
             openai_api_key=os.getenv("AZURE_OPENAI_API_KEY"),
@@ -30,8 +35,9 @@ def get_llmchat():
             openai_api_version="",
             model_name="gpt-4o",
             temperature=0,
+            cache=cache,
         )
-    return ChatOpenAI(openai_api_key=os.getenv("OPENAI_API_KEY"), model_name="gpt-4o", temperature=0)
+    return ChatOpenAI(openai_api_key=os.getenv("OPENAI_API_KEY"), model_name="gpt-4o", temperature=0, cache=cache)
 
 
 def get_llm_chat_openai(model_name: str = "gpt-4o", temperature: float = 0):
@@ -0,0 +1,146 @@
+"""
+This file contains the MemoryManager class, which keeps the memory of a sensemaking run within a token budget.
+
+Memory entries are stored with their question, databases and answer. The most recent entries are kept verbatim, and
+when the memory exceeds its token budget the oldest verbatim entries are folded into a running summary by the LLM.
+"""
+import os
+import sys
+
+from langchain_core.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from agents.llm_factory import get_llmchat
+from agents.config import MEMORY_TOKEN_BUDGET, MEMORY_KEEP_RECENT
+
+llmchat = get_llmchat("memory_manager")
+
+# Marker of requests that cannot be answered, which has to survive compression
+NOT_POSSIBLE_MARKER = "CODE-999"
+
+_encoding = None
+
+
+def count_tokens(text):
+    """Count the tokens of a text with the gpt-4o tokenizer, or estimate them when it cannot be loaded."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # The tokenizer files are downloaded on first use, which fails offline
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def format_entry(entry):
+    if entry['question'] is None:
+        return entry['answer']
+    return f"Question: \n {entry['question']} \n\n Database: \n {entry['database']} \n\n Answer: \n {entry['answer']}\n\n"
+
+
+class MemoryManager:
+    def __init__(self, token_budget=MEMORY_TOKEN_BUDGET, keep_recent=MEMORY_KEEP_RECENT, summarize=None):
+        """
+        Parameters:
+        - token_budget (int): Largest number of tokens of the rendered memory before older entries are compressed.
+        - keep_recent (int): Number of most recent entries always kept verbatim.
+        - summarize (callable): Function (summary, text) -> new summary folding text into the summary, the LLM by
+          default.
+        """
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.summarize = summarize or self.summarize_with_llm
+        self.entries = []
+        self.summary = ''
+        self.num_compressed = 0
+        self.tokens_sent = 0
+        self.tokens_saved = 0
+        self.summary_chain = None
+
+    def add(self, answer, question=None, database=None):
+        """Add an entry to the memory, compressing older entries if the memory exceeds its token budget."""
+        self.entries.append({'question': question, 'database': database, 'answer': answer})
+        self.compact()
+
+    def verbatim_entries(self):
+        return self.entries[self.num_compressed:]
+
+    def render(self):
+        """Return the memory as sent to the agents: the summary of the older entries and the recent entries."""
+        memory = ''
+        if self.summary:
+            memory += f"\n\nSummary of earlier findings: \n {self.summary}"
+        for entry in self.verbatim_entries():
+            memory += "\n\n" + format_entry(entry)
+        return memory
+
+    def render_full(self):
+        """Return the memory with every entry verbatim."""
+        return ''.join("\n\n" + format_entry(entry) for entry in self.entries)
+
+    def compact(self):
+        """Fold the oldest verbatim entries into the summary until the memory fits the token budget."""
+        while count_tokens(self.render()) > self.token_budget and len(self.verbatim_entries()) > self.keep_recent:
+            # Compress the older half of the compressible entries at once to limit the LLM calls
+            num_compressible = len(self.verbatim_entries()) - self.keep_recent
+            batch = self.verbatim_entries()[:max(1, num_compressible // 2)]
+            text = ''.join(format_entry(entry) for entry in batch)
+            summary = self.summarize(self.summary, text)
+            if NOT_POSSIBLE_MARKER in text and NOT_POSSIBLE_MARKER not in summary:
+                summary += f"\n Some requests could not be answered using the available data. {NOT_POSSIBLE_MARKER}."
+            self.summary = summary
+            self.num_compressed += len(batch)
+
+    def for_prompt(self):
+        """Return the rendered memory for an agent prompt, counting the tokens it saves over the full memory."""
+        memory = self.render()
+        tokens = count_tokens(memory)
+        self.tokens_sent += tokens
+        self.tokens_saved += max(0, count_tokens(self.render_full()) - tokens)
+        return memory
+
+    def stats(self):
+        return {'entries': len(self.entries), 'compressed_entries': self.num_compressed,
+                'tokens_sent': self.tokens_sent, 'tokens_saved': self.tokens_saved}
+
+    def summarize_with_llm(self, summary, text):
+        if self.summary_chain is None:
+            self.summary_chain = self.memory_summary_agent()
+        try:
+            return self.summary_chain.invoke({'summary': summary, 'text': text}).strip()
+        except Exception as e:
+            # Keep the findings verbatim rather than losing them
+            print(f"Failed to summarize memory: {str(e)}")
+            return (summary + "\n" + text).strip()
+
+    def memory_summary_agent(self):
+        """Create the chain folding memory entries into the running summary"""
+        prompt = """
+            SUMMARY:
+            {summary}
+
+            NEW FINDINGS:
+            {text}
+
+            SUMMARY holds the findings gathered so far while answering a question from the data of a user.
+            NEW FINDINGS are questions asked to the databases and their answers.
+
+            Your task is to rewrite the SUMMARY so that it also includes the NEW FINDINGS.
+
+            Instructions:
+            1) Keep every number, date, time, location and database name that could be needed later.
+            2) Keep which data was requested but not found, and keep CODE-999 if it appears.
+            3) Be concise and drop repeated information.
+            4) Return only the rewritten summary as plain text.
+            """
+
+        prompt = PromptTemplate(template=prompt, input_variables=["summary", "text"])
+
+        chain = (prompt | llmchat | StrOutputParser())
+
+        return chain
@@ -15,7 +15,7 @@ from langchain_core.runnables import RunnablePassthrough
 from pydantic import BaseModel, Field
 from agents.llm_factory import get_llmchat
 
-llmchat = get_llmchat()
+llmchat = get_llmchat("next_step_agent")
 
 
 class OutputNextStep(BaseModel):
@@ -41,6 +41,15 @@ class NextStepAgent:
         """Alias for invoke_next_step for backward compatibility"""
         return self.invoke_next_step(input_params)
 
+    async def ainvoke_next_step(self, input_params):
+        """Asynchronously determine the next step in the sensemaking process"""
+        return await self.next_step_chain.ainvoke({
+            'user_query': input_params['user_query'],
+            'memory': input_params['memory'],
+            'understanding': input_params['understanding'],
+            'action_plan': input_params['action_plan']
+        })
+
     def next_step_agent(self):
         """Create the next step agent chain"""
         prompt = """
@@ -8,7 +8,7 @@ from pydantic import BaseModel, Field
 from langchain_core.output_parsers import JsonOutputParser
 from agents.llm_factory import get_llmchat
 
-llmchat = get_llmchat()
+llmchat = get_llmchat("presentation_agent")
 
 
 class Output(BaseModel):
@@ -26,6 +26,11 @@ class PresentationAgent:
 
         return presentation_chain
 
+    async def ainvoke(self, input_params):
+        return await self.presentation_chain.ainvoke(
+            {'user_query': input_params['user_query'], 'understanding': input_params['understanding'],
+             'instructions': input_params['instructions']})
+
     def presentation_chain(self):
         prompt = """    
         Task: Given the user query, the understanding of the query, and instructiosn, your role is to provide the answer to the user query according to the instructions provided.
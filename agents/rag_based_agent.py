@@ -25,7 +25,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from agents.rag_utils import get_data_to_narrative
 
-llmchat = get_llmchat()
+llmchat = get_llmchat("rag_based_agent")
 databases = get_all_databases()
 
 
@@ -17,7 +17,7 @@ from agents.data_driver import all_functions
 from agents.data_driver import run_function_from_dict, json_to_dict, get_function_description
 from agents.llm_factory import get_llmchat
 
-llmchat = get_llmchat()
+llmchat = get_llmchat("sensemaking_agent")
 
 
 class Output(BaseModel):
@@ -48,6 +48,17 @@ class SenseMakingAgent:
 
         return info_chain
 
+    async def ainvoke_local_sense(self, input_params):
+        prompt = self.generate_prompt_local_sense_making(input_params['results'], input_params['data_type'],
+                                                         input_params['user_query'])
+        return await self.sensemaking_chain.ainvoke({"prompt": prompt, "user_query": input_params['user_query']})
+
+    async def ainvoke_global_sense(self, input_params):
+        return await self.global_sensemaking_chain.ainvoke({'user_query': input_params['user_query'],
+                                                            'understanding': input_params['understanding'],
+                                                            'memory': input_params['memory'],
+                                                            'action_plan': input_params['action_plan']})
+
     def generate_prompt_local_sense_making(self, results, data_type, question):
         p = f"Your role is to make sense and summarize the {data_type} data based on user's query \n"
         p += f"User Query: {question} \n\n"
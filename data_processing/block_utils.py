@@ -0,0 +1,111 @@
+"""
+Utility functions for turning sorted state streams into contiguous blocks with NumPy.
+
+A block is a run of consecutive records with the same state. Runs are found with one vectorized comparison of
+every record against the previous one, and block boundaries are formatted in one pass at the end.
+"""
+import numpy as np
+import pandas as pd
+
+
+def to_state_array(states):
+    """
+    Convert states to a one-dimensional object array, keeping list states (e.g. activities) as single elements.
+
+    Parameters:
+    - states (list): One state per record.
+
+    Returns:
+    - np.ndarray: Object array with one element per record.
+    """
+    array = np.empty(len(states), dtype=object)
+    for i, state in enumerate(states):
+        array[i] = state
+    return array
+
+
+def find_run_starts(states):
+    """
+    Find the first index of every run of equal consecutive states.
+
+    States that are not equal to themselves (NaN) each start a run of their own.
+
+    Parameters:
+    - states (np.ndarray): One state per record.
+
+    Returns:
+    - np.ndarray: First index of each run, starting with 0 for non-empty input.
+    """
+    if len(states) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(([0], np.flatnonzero(states[1:] != states[:-1]) + 1))
+
+
+def run_length_blocks(timestamps, states, start=None, end=None):
+    """
+    Encode a sorted state stream as contiguous blocks.
+
+    Every block starts at the first record of its run and ends at the first record of the next run. The first block
+    starts at start and the last block ends at end when they are given, otherwise at the first and last record.
+
+    Parameters:
+    - timestamps (list): Sorted epoch seconds, one per record.
+    - states (list): One state per record.
+    - start (float): Epoch seconds the first block starts at.
+    - end (float): Epoch seconds the last block ends at.
+
+    Returns:
+    - dict: 'state', 'start', 'end' and 'duration' (seconds) arrays with one value per block, and 'first_index'
+      (index of the first record of each block).
+    """
+    timestamps = np.asarray(timestamps, dtype=float)
+    states = states if isinstance(states, np.ndarray) else to_state_array(states)
+
+    run_starts = find_run_starts(states)
+    if len(run_starts) == 0:
+        empty = np.zeros(0)
+        return {'state': states[:0], 'start': empty, 'end': empty, 'duration': empty, 'first_index': run_starts}
+
+    block_starts = timestamps[run_starts]
+    block_ends = np.append(timestamps[run_starts[1:]], timestamps[-1] if end is None else end)
+    if start is not None:
+        block_starts[0] = start
+
+    return {'state': states[run_starts], 'start': block_starts, 'end': block_ends,
+            'duration': block_ends - block_starts, 'first_index': run_starts}
+
+
+def to_microseconds(timestamps):
+    """Round epoch seconds to whole microseconds the way datetime.fromtimestamp does."""
+    return np.round(np.asarray(timestamps, dtype=float) * 1e6).astype(np.int64)
+
+
+def format_timestamps(timestamps, timezone):
+    """
+    Format epoch seconds as '%Y-%m-%d %H:%M:%S' strings in a timezone.
+
+    Parameters:
+    - timestamps (list): Epoch seconds.
+    - timezone (pytz.timezone): Timezone to format the times in.
+
+    Returns:
+    - list: One formatted string per timestamp.
+    """
+    if len(timestamps) == 0:
+        return []
+    local_times = pd.to_datetime(to_microseconds(timestamps), unit='us', utc=True).tz_convert(timezone)
+    return list(local_times.strftime('%Y-%m-%d %H:%M:%S'))
+
+
+def whole_second_durations(start_timestamps, end_timestamps):
+    """
+    Durations between formatted block boundaries, which are truncated to whole seconds.
+
+    Parameters:
+    - start_timestamps (np.ndarray): Epoch seconds of the block starts.
+    - end_timestamps (np.ndarray): Epoch seconds of the block ends.
+
+    Returns:
+    - np.ndarray: Durations in seconds.
+    """
+    return ((to_microseconds(end_timestamps) // 1000000) - (to_microseconds(start_timestamps) // 1000000)).astype(float)
@@ -4,10 +4,28 @@ Utility functions for data processing with MongoDB.
 from pymongo import MongoClient
 from datetime import datetime
 from data_processing import db_config
+import pandas as pd
 import pymongo
 from typing import List, Dict, Any
 import os
 
+from agents.config import USE_CSV
+
+
+def get_csv_path(collection_name: str) -> str:
+    """
+    Get the path of the CSV file backing a collection in the sample_data folder.
+
+    Parameters:
+    - collection_name (str): The name of the collection.
+
+    Returns:
+    - str: Path of the CSV file.
+    """
+    if os.getenv("RUNNING_IN_DOCKER") == "true":
+        return f"/workspace/sample_data/{collection_name}.csv"
+    return f"../sample_data/{collection_name}.csv"
+
 def fetch_documents_between_timestamps(uid: str, start_timestamp: int, end_timestamp: int,
                                        collection_name: str) -> List[Dict[str, Any]]:
     """
@@ -27,10 +45,7 @@ def fetch_documents_between_timestamps(uid: str, start_timestamp: int, end_times
     if USE_CSV:
         try:
             # Read CSV file from sample_data folder
-            if os.getenv("RUNNING_IN_DOCKER") == "true":
-                csv_filename = f"/workspace/sample_data/{collection_name}.csv"
-            else:
-                csv_filename = f"../sample_data/{collection_name}.csv"
+            csv_filename = get_csv_path(collection_name)
             df = pd.read_csv(csv_filename)
 
             # Filter by uid
@@ -155,6 +170,171 @@ def fetch_first_and_last_document(uid, collection_name):
         return None, None  # Return None if no documents are found
 
 
+def filter_frame(df, query):
+    """
+    Filter a DataFrame with a MongoDB style query supporting equality, $lt, $lte, $gt, $gte, $in and $exists.
+    A field exists when the CSV file has a column for it.
+    """
+    mask = pd.Series(True, index=df.index)
+    for field, condition in query.items():
+        if field not in df.columns:
+            if isinstance(condition, dict) and condition.get('$exists') is False:
+                continue
+            return df.iloc[0:0]
+        column = df[field]
+        if isinstance(condition, dict):
+            for operator, value in condition.items():
+                if operator == '$lt':
+                    mask &= column < value
+                elif operator == '$lte':
+                    mask &= column <= value
+                elif operator == '$gt':
+                    mask &= column > value
+                elif operator == '$gte':
+                    mask &= column >= value
+                elif operator == '$in':
+                    mask &= column.isin(value)
+                elif operator == '$exists':
+                    if not value:
+                        mask &= False
+                else:
+                    raise ValueError(f"Unsupported query operator: {operator}")
+        else:
+            mask &= column == condition
+    return df[mask]
+
+
+def find_documents(collection_name: str, query: Dict[str, Any], sort_field: str = None, descending: bool = False,
+                   limit: int = None) -> List[Dict[str, Any]]:
+    """
+    Fetch documents matching a query from a MongoDB collection or CSV file.
+
+    Parameters:
+    - collection_name (str): The name of the collection/CSV file to query.
+    - query (dict): MongoDB style query (equality, $lt, $lte, $gt, $gte, $in and $exists are supported for CSV).
+    - sort_field (str): Field to sort the documents by.
+    - descending (bool): Sort in descending order.
+    - limit (int): Maximum number of documents to return.
+
+    Returns:
+    - list: The matching documents.
+    """
+    if USE_CSV:
+        try:
+            df = filter_frame(pd.read_csv(get_csv_path(collection_name)), query)
+        except FileNotFoundError:
+            return []
+        if sort_field is not None and sort_field in df.columns:
+            df = df.sort_values(by=sort_field, ascending=not descending, kind='stable')
+        if limit is not None:
+            df = df.head(limit)
+        return df.to_dict('records')
+
+    cursor = db_config.DbConfig().getDb()[collection_name].find(query)
+    if sort_field is not None:
+        cursor = cursor.sort(sort_field, pymongo.DESCENDING if descending else pymongo.ASCENDING)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    return list(cursor)
+
+
+def insert_documents(collection_name: str, documents: List[Dict[str, Any]]):
+    """
+    Insert documents into a MongoDB collection or append them to a CSV file.
+
+    Parameters:
+    - collection_name (str): The name of the collection/CSV file.
+    - documents (list): The documents to insert.
+    """
+    if not documents:
+        return
+    if USE_CSV:
+        csv_filename = get_csv_path(collection_name)
+        new_df = pd.DataFrame(documents)
+        if os.path.exists(csv_filename):
+            new_df = pd.concat([pd.read_csv(csv_filename), new_df], ignore_index=True)
+        new_df.to_csv(csv_filename, index=False)
+        return
+    db_config.DbConfig().getDb()[collection_name].insert_many([dict(d) for d in documents])
+
+
+def delete_documents(collection_name: str, query: Dict[str, Any]):
+    """
+    Delete documents matching a query from a MongoDB collection or CSV file.
+
+    Parameters:
+    - collection_name (str): The name of the collection/CSV file.
+    - query (dict): MongoDB style query selecting the documents to delete.
+    """
+    if USE_CSV:
+        csv_filename = get_csv_path(collection_name)
+        if not os.path.exists(csv_filename):
+            return
+        df = pd.read_csv(csv_filename)
+        df.drop(index=filter_frame(df, query).index).to_csv(csv_filename, index=False)
+        return
+    db_config.DbConfig().getDb()[collection_name].delete_many(query)
+
+
+def key_frames(df: pd.DataFrame, new_df: pd.DataFrame, key_fields: List[str]):
+    """
+    Return the key columns of stored and new records in comparable types: numbers when both sides hold numbers, so
+    a timestamp read back from a CSV as 1756353694.0 matches a new 1756353694, and strings otherwise.
+    """
+    existing_keys, new_keys = df[key_fields].copy(), new_df[key_fields].copy()
+    for field in key_fields:
+        existing_numbers = pd.to_numeric(existing_keys[field], errors='coerce')
+        new_numbers = pd.to_numeric(new_keys[field], errors='coerce')
+        if existing_numbers.notna().all() and new_numbers.notna().all():
+            existing_keys[field], new_keys[field] = existing_numbers.astype(float), new_numbers.astype(float)
+        else:
+            existing_keys[field], new_keys[field] = existing_keys[field].astype(str), new_keys[field].astype(str)
+    return existing_keys, new_keys
+
+
+def upsert_documents(collection_name: str, documents: List[Dict[str, Any]], key_fields: List[str]):
+    """
+    Insert documents into a MongoDB collection or CSV file, replacing existing documents with the same key.
+
+    Parameters:
+    - collection_name (str): The name of the collection/CSV file.
+    - documents (list): The documents to write.
+    - key_fields (list): Fields that together identify a document, e.g. ['uid', 'date'].
+    """
+    if not documents:
+        return
+    if USE_CSV:
+        csv_filename = get_csv_path(collection_name)
+        new_df = pd.DataFrame(documents)
+        if os.path.exists(csv_filename):
+            df = pd.read_csv(csv_filename)
+            if all(field in df.columns for field in key_fields):
+                existing_keys, new_keys = key_frames(df, new_df, key_fields)
+                df = df[~pd.MultiIndex.from_frame(existing_keys).isin(pd.MultiIndex.from_frame(new_keys))]
+            new_df = pd.concat([df, new_df], ignore_index=True)
+        new_df.to_csv(csv_filename, index=False)
+        return
+    collection = db_config.DbConfig().getDb()[collection_name]
+    collection.bulk_write([pymongo.ReplaceOne({field: d[field] for field in key_fields}, dict(d), upsert=True)
+                           for d in documents])
+
+
+def ensure_indexes(collection_name: str, indexes: List[List[str]], unique: bool = False):
+    """
+    Create ascending compound indexes on a MongoDB collection. CSV files are scanned in memory and need none.
+
+    Parameters:
+    - collection_name (str): The name of the collection.
+    - indexes (list): Each entry is the list of fields of one compound index.
+    - unique (bool): Reject documents duplicating the fields of an index.
+    """
+    if USE_CSV:
+        return
+    collection = db_config.DbConfig().getDb()[collection_name]
+    for fields in indexes:
+        collection.create_index([(field, pymongo.ASCENDING) for field in fields], unique=unique)
+
+
 # Example usage
 if __name__ == "__main__":
     start_datetime = datetime(2024, 7, 1, 0, 0, 0)
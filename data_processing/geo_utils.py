@@ -0,0 +1,164 @@
+"""
+Utility functions for spatial keys and distances of GPS coordinates.
+"""
+import math
+
+import numpy as np
+
+EARTH_RADIUS_METERS = 6371008.8
+METERS_PER_DEGREE = 111320.0
+# Largest relative difference between the haversine and the WGS-84 geodesic distance
+HAVERSINE_TOLERANCE = 0.006
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode_geohash(latitude, longitude, precision=9):
+    """
+    Encode a coordinate as a geohash.
+
+    Parameters:
+    - latitude (float): Latitude in degrees.
+    - longitude (float): Longitude in degrees.
+    - precision (int): Number of characters of the geohash.
+
+    Returns:
+    - str: The geohash.
+    """
+    latitude_range = [-90.0, 90.0]
+    longitude_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        value, interval = (longitude, longitude_range) if even else (latitude, latitude_range)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(geohash)
+
+
+def geohash_cell_size(precision):
+    """Return the (latitude, longitude) size in degrees of a geohash cell."""
+    longitude_bits = math.ceil(5 * precision / 2)
+    latitude_bits = 5 * precision - longitude_bits
+    return 180.0 / 2 ** latitude_bits, 360.0 / 2 ** longitude_bits
+
+
+def geohash_precision_for_radius(latitude, radius_meters, max_precision=9):
+    """
+    Find the longest geohash whose cells are at least radius_meters wide and tall at a latitude, so every point
+    within the radius of a coordinate lies in the cell of the coordinate or one of its 8 neighbours.
+    """
+    for precision in range(max_precision, 0, -1):
+        latitude_size, longitude_size = geohash_cell_size(precision)
+        height = latitude_size * METERS_PER_DEGREE
+        width = longitude_size * METERS_PER_DEGREE * math.cos(math.radians(latitude))
+        if min(height, width) >= radius_meters:
+            return precision
+    return 1
+
+
+def geohash_neighbourhood(latitude, longitude, precision):
+    """Return the geohash of the cell of a coordinate and of its 8 neighbouring cells."""
+    latitude_size, longitude_size = geohash_cell_size(precision)
+    cells = set()
+    for latitude_step in (-1, 0, 1):
+        for longitude_step in (-1, 0, 1):
+            neighbour_latitude = min(max(latitude + latitude_step * latitude_size, -90.0), 90.0)
+            neighbour_longitude = (longitude + longitude_step * longitude_size + 180.0) % 360.0 - 180.0
+            cells.add(encode_geohash(neighbour_latitude, neighbour_longitude, precision))
+    return sorted(cells)
+
+
+def haversine_distance(latitudes, longitudes, latitude, longitude):
+    """
+    Great-circle distance in meters from coordinates to a single point.
+
+    Parameters:
+    - latitudes (np.ndarray): Latitudes in degrees.
+    - longitudes (np.ndarray): Longitudes in degrees.
+    - latitude (float): Latitude of the point in degrees.
+    - longitude (float): Longitude of the point in degrees.
+
+    Returns:
+    - np.ndarray: Distances in meters.
+    """
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    latitude, longitude = np.radians(latitude), np.radians(longitude)
+    a = np.sin((latitudes - latitude) / 2) ** 2 + \
+        np.cos(latitudes) * np.cos(latitude) * np.sin((longitudes - longitude) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def within_geodesic_distance(latitudes, longitudes, latitude, longitude, radius_meters):
+    """
+    Find the coordinates closer than a radius to a point by WGS-84 geodesic distance (geopy's default distance).
+
+    Distances are computed with haversine, which is within HAVERSINE_TOLERANCE of the geodesic distance, and only
+    the coordinates that are ambiguous at that tolerance are measured with geopy.
+
+    Parameters:
+    - latitudes (np.ndarray): Latitudes in degrees.
+    - longitudes (np.ndarray): Longitudes in degrees.
+    - latitude (float): Latitude of the point in degrees.
+    - longitude (float): Longitude of the point in degrees.
+    - radius_meters (float): The radius.
+
+    Returns:
+    - np.ndarray: Boolean mask of the coordinates closer than the radius.
+    """
+    from geopy import distance
+
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    distances = haversine_distance(latitudes, longitudes, latitude, longitude)
+    within = distances < radius_meters * (1 - HAVERSINE_TOLERANCE)
+    for i in np.flatnonzero(~within & (distances < radius_meters * (1 + HAVERSINE_TOLERANCE))):
+        within[i] = distance.distance((latitude, longitude), (latitudes[i], longitudes[i])).m < radius_meters
+    return within
+
+
+def step_distances(latitudes, longitudes, threshold_meters=None):
+    """
+    Distances in meters between consecutive coordinates.
+
+    Distances are computed with haversine. When threshold_meters is given, the distances that are within
+    HAVERSINE_TOLERANCE of it are measured with geopy instead, so comparing them to the threshold gives the same
+    result as comparing WGS-84 geodesic distances.
+
+    Parameters:
+    - latitudes (np.ndarray): Latitudes in degrees.
+    - longitudes (np.ndarray): Longitudes in degrees.
+    - threshold_meters (float): Distance the steps are compared to.
+
+    Returns:
+    - np.ndarray: One distance less than the number of coordinates.
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    if len(latitudes) < 2:
+        return np.zeros(0)
+    latitudes_radians, longitudes_radians = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin(np.diff(latitudes_radians) / 2) ** 2 + \
+        np.cos(latitudes_radians[:-1]) * np.cos(latitudes_radians[1:]) * np.sin(np.diff(longitudes_radians) / 2) ** 2
+    distances = 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+    if threshold_meters is not None:
+        from geopy import distance
+
+        ambiguous = np.abs(distances - threshold_meters) <= threshold_meters * HAVERSINE_TOLERANCE
+        for i in np.flatnonzero(ambiguous):
+            distances[i] = distance.distance((latitudes[i], longitudes[i]), (latitudes[i + 1], longitudes[i + 1])).m
+    return distances
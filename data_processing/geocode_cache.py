@@ -0,0 +1,184 @@
+"""
+Persistent reverse-geocoding cache.
+
+Addresses are stored in SQLite keyed by the geohash of the looked up coordinate. A lookup reuses the closest cached
+address within a radius, so nearby points (e.g. GPS jitter around the same building) share one provider call.
+Entries older than the TTL are evicted. Providers are the Google and Nominatim geocoders or, for offline use and
+tests, a local gazetteer CSV file.
+"""
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_processing.geo_utils import encode_geohash, geohash_precision_for_radius, geohash_neighbourhood, \
+    haversine_distance
+from agents.config import GEOCODE_CACHE_PATH, GEOCODE_CACHE_RADIUS_METERS, GEOCODE_CACHE_TTL_DAYS, \
+    GEOCODE_GAZETTEER_PATH
+
+# Precision of the stored geohashes, about 5 meters
+GEOHASH_PRECISION = 9
+
+_geocoders = {}
+
+
+def google_provider(api_key):
+    from geopy.geocoders import GoogleV3
+    geolocator = GoogleV3(api_key=api_key)
+
+    def reverse(latitude, longitude):
+        location = geolocator.reverse((latitude, longitude), exactly_one=True)
+        return location.address if location else ""
+    return reverse
+
+
+def nominatim_provider(user_agent="phone_sensing"):
+    from geopy.geocoders import Nominatim
+    geolocator = Nominatim(user_agent=user_agent)
+
+    def reverse(latitude, longitude):
+        location = geolocator.reverse((latitude, longitude))
+        return location.address if location else ""
+    return reverse
+
+
+def gazetteer_provider(path):
+    """
+    Reverse geocode offline to the nearest place of a gazetteer CSV file with 'latitude', 'longitude' and
+    'address' columns.
+    """
+    gazetteer = pd.read_csv(path)
+    latitudes = gazetteer['latitude'].to_numpy(dtype=float)
+    longitudes = gazetteer['longitude'].to_numpy(dtype=float)
+    addresses = gazetteer['address'].astype(str).to_numpy()
+
+    def reverse(latitude, longitude):
+        if len(addresses) == 0:
+            return ""
+        return addresses[int(np.argmin(haversine_distance(latitudes, longitudes, latitude, longitude)))]
+    return reverse
+
+
+class ReverseGeocodeCache:
+    """Reverse geocoder that caches the addresses of a provider in SQLite."""
+
+    def __init__(self, provider, provider_name, cache_path=GEOCODE_CACHE_PATH,
+                 radius_meters=GEOCODE_CACHE_RADIUS_METERS, ttl_seconds=GEOCODE_CACHE_TTL_DAYS * 24 * 60 * 60):
+        self.provider = provider
+        self.provider_name = provider_name
+        self.cache_path = cache_path
+        self.radius_meters = radius_meters
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS geocode_cache (provider TEXT, geohash TEXT, latitude REAL, "
+                               "longitude REAL, address TEXT, created_at REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS geocode_cache_geohash ON geocode_cache (provider, geohash)")
+
+    def _connect(self):
+        return sqlite3.connect(self.cache_path, timeout=30)
+
+    def evict_expired(self):
+        """Delete the cached addresses older than the TTL."""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM geocode_cache WHERE provider = ? AND created_at < ?",
+                               (self.provider_name, time.time() - self.ttl_seconds))
+
+    def lookup(self, latitude, longitude):
+        """Return the closest unexpired cached address within the radius of a coordinate, or None."""
+        precision = min(geohash_precision_for_radius(latitude, self.radius_meters), GEOHASH_PRECISION)
+        cells = geohash_neighbourhood(latitude, longitude, precision)
+
+        query = "SELECT latitude, longitude, address FROM geocode_cache WHERE provider = ? AND created_at >= ? AND (" + \
+                " OR ".join(["(geohash >= ? AND geohash < ?)"] * len(cells)) + ")"
+        params = [self.provider_name, time.time() - self.ttl_seconds]
+        for cell in cells:
+            params += [cell, cell + '~']
+        with self._connect() as connection:
+            rows = connection.execute(query, params).fetchall()
+        if not rows:
+            return None
+
+        distances = haversine_distance(np.array([r[0] for r in rows]), np.array([r[1] for r in rows]), latitude,
+                                       longitude)
+        closest = int(np.argmin(distances))
+        return rows[closest][2] if distances[closest] <= self.radius_meters else None
+
+    def store(self, latitude, longitude, address):
+        with self._connect() as connection:
+            connection.execute("INSERT INTO geocode_cache VALUES (?, ?, ?, ?, ?, ?)",
+                               (self.provider_name, encode_geohash(latitude, longitude, GEOHASH_PRECISION), latitude,
+                                longitude, address, time.time()))
+
+    def reverse(self, latitude, longitude):
+        """
+        Get the address of a coordinate, calling the provider only when no cached address is within the radius.
+
+        Parameters:
+        - latitude (float): Latitude in degrees.
+        - longitude (float): Longitude in degrees.
+
+        Returns:
+        - str: The address, or an empty string if the provider has none.
+        """
+        latitude, longitude = float(latitude), float(longitude)
+        address = self.lookup(latitude, longitude)
+        if address is not None:
+            self.hits += 1
+            return address
+
+        self.misses += 1
+        address = self.provider(latitude, longitude) or ""
+        self.store(latitude, longitude, address)
+        return address
+
+    def reverse_many(self, coordinates):
+        """
+        Get the addresses of many coordinates. Identical coordinates are looked up once, and each provider call
+        is cached before the next lookup so coordinates near an earlier one reuse its address.
+
+        Parameters:
+        - coordinates (list): (latitude, longitude) pairs.
+
+        Returns:
+        - list: One address per coordinate.
+        """
+        self.evict_expired()
+        addresses = {}
+        for latitude, longitude in coordinates:
+            key = (round(float(latitude), 6), round(float(longitude), 6))
+            if key not in addresses:
+                addresses[key] = self.reverse(*key)
+        return [addresses[(round(float(latitude), 6), round(float(longitude), 6))]
+                for latitude, longitude in coordinates]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+def get_geocoder(provider_name):
+    """
+    Get the cached reverse geocoder of a provider ('google' or 'nominatim'). When GEOCODE_GAZETTEER_PATH is set
+    every provider is answered offline from the gazetteer file instead.
+    """
+    if GEOCODE_GAZETTEER_PATH:
+        provider_name = 'gazetteer'
+    if provider_name not in _geocoders:
+        if provider_name == 'gazetteer':
+            provider = gazetteer_provider(GEOCODE_GAZETTEER_PATH)
+        elif provider_name == 'google':
+            from data_streams.constants import GOOGLE_API_KEY
+            provider = google_provider(GOOGLE_API_KEY)
+        elif provider_name == 'nominatim':
+            provider = nominatim_provider()
+        else:
+            raise ValueError(f"Unknown geocoding provider: {provider_name}")
+        _geocoders[provider_name] = ReverseGeocodeCache(provider, provider_name)
+    return _geocoders[provider_name]
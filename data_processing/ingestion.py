@@ -0,0 +1,93 @@
+"""
+Ingestion of sensor records with de-duplication of repeated uploads.
+
+Phones and watches upload the same step interval again when a sync is retried. Collections listed in UNIQUE_KEYS
+keep one document per key: records are de-duplicated within a batch and upserted, so the last write of a key wins
+and queries never see duplicates.
+
+The step functions no longer de-duplicate records themselves, so data stored before uploads went through
+ingest_documents has to be migrated once with:
+
+    cd data_processing && python ingestion.py
+"""
+import os
+import sys
+from typing import List, Dict, Any
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_processing import db_config
+from data_processing.data_processing_utils import get_csv_path, insert_documents, upsert_documents, ensure_indexes
+from data_streams.constants import IOS_STEPS, GARMIN_STEPS
+from agents.config import USE_CSV
+
+# Fields identifying a record of each de-duplicated collection
+UNIQUE_KEYS = {
+    IOS_STEPS: ['uid', 'start_timestamp'],
+    GARMIN_STEPS: ['uid', 'start_timestamp'],
+}
+
+
+def deduplicate_batch(documents: List[Dict[str, Any]], key_fields: List[str]) -> List[Dict[str, Any]]:
+    """Keep the last document of every key of a batch, in the order the keys first appear."""
+    unique_documents = {tuple(d[field] for field in key_fields): d for d in documents}
+    return list(unique_documents.values())
+
+
+def ingest_documents(collection_name: str, documents: List[Dict[str, Any]]):
+    """
+    Store uploaded records, replacing stored records with the same key for de-duplicated collections.
+
+    Parameters:
+    - collection_name (str): The name of the collection/CSV file.
+    - documents (list): The uploaded records.
+    """
+    key_fields = UNIQUE_KEYS.get(collection_name)
+    if key_fields is None:
+        insert_documents(collection_name, documents)
+        return
+    upsert_documents(collection_name, deduplicate_batch(documents, key_fields), key_fields)
+
+
+def deduplicate_collection(collection_name: str) -> int:
+    """
+    Remove the duplicates already stored in a de-duplicated collection, keeping the last written record of every
+    key, and add a unique index on the key so later uploads cannot duplicate it again.
+
+    Parameters:
+    - collection_name (str): The name of the collection/CSV file.
+
+    Returns:
+    - int: Number of records removed.
+    """
+    key_fields = UNIQUE_KEYS[collection_name]
+    if USE_CSV:
+        csv_filename = get_csv_path(collection_name)
+        df = pd.read_csv(csv_filename)
+        duplicated = df.duplicated(subset=key_fields, keep='last')
+        if duplicated.any():
+            df[~duplicated].to_csv(csv_filename, index=False)
+        return int(duplicated.sum())
+
+    collection = db_config.DbConfig().getDb()[collection_name]
+    # ObjectIds increase with insertion time, so the largest one of a key is its last write
+    groups = collection.aggregate([
+        {'$group': {'_id': {field: f'${field}' for field in key_fields}, 'ids': {'$push': '$_id'},
+                    'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+    ], allowDiskUse=True)
+    duplicate_ids = []
+    for group in groups:
+        duplicate_ids += sorted(group['ids'])[:-1]
+    if duplicate_ids:
+        collection.delete_many({'_id': {'$in': duplicate_ids}})
+    ensure_indexes(collection_name, [key_fields], unique=True)
+    return len(duplicate_ids)
+
+
+if __name__ == "__main__":
+    # One-off migration of the records stored before de-duplication at ingestion
+    for collection_name in UNIQUE_KEYS:
+        print(f"{collection_name}: removed {deduplicate_collection(collection_name)} duplicate records")
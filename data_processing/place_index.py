@@ -0,0 +1,219 @@
+"""
+Inference and lookup of each user's home and significant places.
+
+A batch job detects stay points in the location stream (periods of at least STAY_MIN_DURATION within
+STAY_RADIUS_METERS of where they started), clusters them into places and ranks the places by the time spent there.
+The place with the most night-time stay is the home. Places are persisted in the PLACES collection and loaded once
+per user at query time, so home lookups do not recompute any clustering.
+"""
+from datetime import datetime, timedelta
+import time
+
+import numpy as np
+import pytz
+from sklearn.cluster import DBSCAN
+
+from data_processing.data_processing_utils import fetch_documents_between_timestamps, find_documents, \
+    insert_documents, delete_documents, ensure_indexes
+from data_processing.geo_utils import EARTH_RADIUS_METERS, haversine_distance
+from data_processing.spatial_index import PlaceIndex
+from data_streams.constants import IOS_LOCATION, PLACES, home_locations, time_zone_dict
+from agents.config import PLACE_TOP_K
+
+STAY_RADIUS_METERS = 50
+STAY_MIN_DURATION = 10 * 60
+# A gap longer than this between two records ends a stay
+STAY_MAX_GAP = 6 * 60 * 60
+# Stay points closer than this belong to the same place
+PLACE_RADIUS_METERS = 50
+# Local hours counted as night-time, from NIGHT_START_HOUR to NIGHT_END_HOUR the next day
+NIGHT_START_HOUR = 22
+NIGHT_END_HOUR = 6
+
+_places_cache = {}
+_place_index_cache = {}
+_inferred_homes = set()
+
+
+def get_timezone(uid):
+    user_timezone = time_zone_dict.get(uid, "est")
+    return pytz.timezone("America/New_York") if user_timezone == "est" else pytz.timezone(user_timezone)
+
+
+def find_stay_points(timestamps, latitudes, longitudes):
+    """
+    Detect stay points in a sorted location trace.
+
+    A stay starts at a record and lasts while the following records are within STAY_RADIUS_METERS of it and no
+    more than STAY_MAX_GAP apart. Stays shorter than STAY_MIN_DURATION are dropped.
+
+    Parameters:
+    - timestamps (np.ndarray): Sorted epoch seconds.
+    - latitudes (np.ndarray): Latitudes in degrees.
+    - longitudes (np.ndarray): Longitudes in degrees.
+
+    Returns:
+    - list: Dictionaries with the 'latitude', 'longitude' (mean of the stay), 'arrival' and 'departure' of each stay.
+    """
+    num_records = len(timestamps)
+    # Index of the first record after each record's gap, bounding how far a stay can extend
+    gap_ends = np.append(np.flatnonzero(np.diff(timestamps) > STAY_MAX_GAP) + 1, num_records)
+
+    stays = []
+    i = 0
+    while i < num_records:
+        segment_end = gap_ends[np.searchsorted(gap_ends, i, side='right')]
+
+        # Search for the first record leaving the radius in windows of doubling size
+        j = segment_end
+        window_start, window_size = i, 64
+        while window_start < segment_end:
+            window_end = min(window_start + window_size, segment_end)
+            distances = haversine_distance(latitudes[window_start:window_end], longitudes[window_start:window_end],
+                                           latitudes[i], longitudes[i])
+            departures = np.flatnonzero(distances > STAY_RADIUS_METERS)
+            if len(departures):
+                j = window_start + departures[0]
+                break
+            window_start, window_size = window_end, window_size * 2
+
+        if timestamps[j - 1] - timestamps[i] >= STAY_MIN_DURATION:
+            stays.append({'latitude': float(np.mean(latitudes[i:j])), 'longitude': float(np.mean(longitudes[i:j])),
+                          'arrival': float(timestamps[i]), 'departure': float(timestamps[j - 1])})
+            i = j
+        else:
+            i += 1
+    return stays
+
+
+def get_night_duration(arrival, departure, timezone):
+    """Seconds of [arrival, departure] that fall in the local night-time hours."""
+    night_duration = 0
+    day = datetime.fromtimestamp(arrival, timezone).date() - timedelta(days=1)
+    last_day = datetime.fromtimestamp(departure, timezone).date()
+    while day <= last_day:
+        night_start = timezone.localize(datetime(day.year, day.month, day.day, NIGHT_START_HOUR)).timestamp()
+        next_day = day + timedelta(days=1)
+        night_end = timezone.localize(datetime(next_day.year, next_day.month, next_day.day, NIGHT_END_HOUR)).timestamp()
+        night_duration += max(0.0, min(departure, night_end) - max(arrival, night_start))
+        day = next_day
+    return night_duration
+
+
+def infer_places(uid, start_date, end_date, top_k=PLACE_TOP_K):
+    """
+    Infer the home and top significant places of a user from the location stream.
+
+    Parameters:
+    - uid (str): The user identifier.
+    - start_date (str): The first day, formatted as '%Y-%m-%d'.
+    - end_date (str): The last day (inclusive), formatted as '%Y-%m-%d'.
+    - top_k (int): Number of places to keep besides the home.
+
+    Returns:
+    - list: Place documents ranked by time spent, with the home (if any) first.
+    """
+    timezone = get_timezone(uid)
+    start = timezone.localize(datetime.strptime(start_date, '%Y-%m-%d')).timestamp()
+    end = timezone.localize(datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).timestamp()
+
+    records = [r for r in fetch_documents_between_timestamps(uid, start, end, IOS_LOCATION) if r['accuracy'] < 100]
+    if not records:
+        return []
+    records.sort(key=lambda r: r['timestamp'])
+    stays = find_stay_points(np.array([r['timestamp'] for r in records], dtype=float),
+                             np.array([r['latitude'] for r in records], dtype=float),
+                             np.array([r['longitude'] for r in records], dtype=float))
+    if not stays:
+        return []
+
+    coordinates = np.radians([[s['latitude'], s['longitude']] for s in stays])
+    labels = DBSCAN(eps=PLACE_RADIUS_METERS / EARTH_RADIUS_METERS, min_samples=1, algorithm='ball_tree',
+                    metric='haversine').fit(coordinates).labels_
+
+    durations = np.array([s['departure'] - s['arrival'] for s in stays])
+    night_durations = np.array([get_night_duration(s['arrival'], s['departure'], timezone) for s in stays])
+    places = []
+    for label in np.unique(labels):
+        members = labels == label
+        # Stays without duration still count towards the position of the place
+        weights = durations[members] + 1
+        places.append({
+            'latitude': float(np.average([s['latitude'] for s, m in zip(stays, members) if m], weights=weights)),
+            'longitude': float(np.average([s['longitude'] for s, m in zip(stays, members) if m], weights=weights)),
+            'dwell_minutes': float(durations[members].sum() / 60),
+            'night_minutes': float(night_durations[members].sum() / 60),
+            'visits': int(members.sum()),
+        })
+
+    home = max(places, key=lambda p: p['night_minutes'])
+    if home['night_minutes'] == 0:
+        home = None
+    others = sorted([p for p in places if p is not home], key=lambda p: p['dwell_minutes'], reverse=True)[:top_k]
+
+    computed_at = time.time()
+    ranked = ([home] if home is not None else []) + others
+    return [dict(place, uid=uid, place_id=i, label='home' if place is home else 'place', computed_at=computed_at)
+            for i, place in enumerate(ranked)]
+
+
+def update_place_index(uids, start_date, end_date, top_k=PLACE_TOP_K):
+    """
+    Infer and persist the places of several users, replacing their previously inferred places.
+
+    Parameters:
+    - uids (list): The user identifiers.
+    - start_date (str): The first day of location data to use, formatted as '%Y-%m-%d'.
+    - end_date (str): The last day (inclusive), formatted as '%Y-%m-%d'.
+    - top_k (int): Number of places to keep per user besides the home.
+
+    Returns:
+    - int: Number of places written.
+    """
+    ensure_indexes(PLACES, [['uid', 'place_id']])
+    num_places = 0
+    for uid in uids:
+        places = infer_places(uid, start_date, end_date, top_k)
+        delete_documents(PLACES, {'uid': uid})
+        insert_documents(PLACES, places)
+        _places_cache.pop(uid, None)
+        _place_index_cache.pop(uid, None)
+        if uid in _inferred_homes:
+            home_locations.pop(uid)
+            _inferred_homes.discard(uid)
+        num_places += len(places)
+    return num_places
+
+
+def get_places(uid):
+    """Return the persisted places of a user, loading them from the place index on first use."""
+    if uid not in _places_cache:
+        places = find_documents(PLACES, {'uid': uid}, sort_field='place_id')
+        for place in places:
+            place.pop('_id', None)
+        _places_cache[uid] = places
+    return _places_cache[uid]
+
+
+def get_place_index(uid):
+    """Return a PlaceIndex over the persisted places of a user, in the order of get_places."""
+    if uid not in _place_index_cache:
+        places = get_places(uid)
+        _place_index_cache[uid] = PlaceIndex([p['latitude'] for p in places], [p['longitude'] for p in places],
+                                             PLACE_RADIUS_METERS)
+    return _place_index_cache[uid]
+
+
+def get_home_location(uid):
+    """
+    Get the [latitude, longitude] of a user's home, or None if it is unknown.
+
+    Homes configured in home_locations take precedence; otherwise the inferred home is added to home_locations.
+    """
+    if uid not in home_locations:
+        homes = [p for p in get_places(uid) if p['label'] == 'home']
+        if not homes:
+            return None
+        home_locations[uid] = {'centroid': [homes[0]['latitude'], homes[0]['longitude']]}
+        _inferred_homes.add(uid)
+    return home_locations[uid]['centroid']
@@ -1,43 +1,181 @@
+import io
+
 from matplotlib import pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from datetime import datetime
 import matplotlib.dates as mdates
+import numpy as np
+
+from agents.config import PLOT_MAX_POINTS
+
+OUTPUT_FORMATS = ('png', 'svg')
+
 
-def plot_blocks(blocks, name):
+def lttb(x, y, threshold):
+    """
+    Downsample a line series with the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and last points are kept, and the points in between are split into threshold - 2 buckets. From each
+    bucket the point forming the largest triangle with the point kept from the previous bucket and the mean of the
+    next bucket is kept, which preserves the visual peaks and troughs of the series.
+
+    Parameters:
+    - x (np.ndarray): Sorted x values (e.g. epoch seconds).
+    - y (np.ndarray): y values.
+    - threshold (int): Number of points to keep.
+
+    Returns:
+    - np.ndarray: Sorted indices of the points kept.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    num_points = len(x)
+    if threshold >= num_points or threshold < 3:
+        return np.arange(num_points)
+
+    # Bucket edges over the points between the first and the last one
+    edges = np.floor(np.linspace(1, num_points - 1, threshold - 1)).astype(int)
+    kept = np.zeros(threshold, dtype=int)
+    kept[-1] = num_points - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else num_points
+        next_x, next_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def to_epoch(time):
+    if isinstance(time, str):
+        return datetime.strptime(time, '%Y-%m-%d %H:%M:%S').timestamp()
+    return float(time)
+
+
+def downsample_series(timestamps, values, max_points=PLOT_MAX_POINTS):
+    """
+    Downsample a time series for plotting with LTTB, dropping NaN values.
+
+    Parameters:
+    - timestamps (list): Epoch seconds or '%Y-%m-%d %H:%M:%S' strings.
+    - values (list): One value per timestamp.
+    - max_points (int): Largest number of points to keep.
+
+    Returns:
+    - tuple: (timestamps, values) arrays, with timestamps in epoch seconds.
+    """
+    timestamps = np.array([to_epoch(t) for t in timestamps], dtype=float)
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    timestamps, values = timestamps[valid], values[valid]
+    kept = lttb(timestamps, values, max_points)
+    return timestamps[kept], values[kept]
+
+
+def to_datetimes(timestamps):
+    return [datetime.fromtimestamp(t) for t in timestamps]
+
+
+def create_figure(output_format=None, figsize=None):
+    """
+    Create a figure. Figures rendered to bytes are created without pyplot, so they need no display and are not
+    kept by pyplot.
+
+    Parameters:
+    - output_format (str): 'png' or 'svg' to render the figure to bytes, None to show it with pyplot.
+    - figsize (tuple): Figure size in inches.
+
+    Returns:
+    - tuple: (figure, axes)
+    """
+    if output_format is None:
+        return plt.subplots(figsize=figsize)
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format}, expected one of {OUTPUT_FORMATS}")
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def finish_figure(fig, output_format=None):
+    """
+    Show a figure with pyplot, or render it to PNG or SVG bytes.
+
+    Parameters:
+    - fig (Figure): The figure created by create_figure.
+    - output_format (str): 'png' or 'svg' to render the figure to bytes, None to show it.
+
+    Returns:
+    - bytes: The rendered figure, or None if it was shown.
+    """
+    if output_format is None:
+        plt.show()
+        return None
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=output_format, bbox_inches='tight')
+    return buffer.getvalue()
+
+
+def normalize_blocks(blocks):
+    """
+    Convert blocks to (type, start, end) tuples with epoch seconds.
+
+    Blocks are either (type, start, end) tuples with epoch seconds, or dictionaries with 'start_time' and 'end_time'
+    ('%Y-%m-%d %H:%M:%S' strings or epoch seconds) whose type is their first other field, e.g. 'activity'.
+    """
+    normalized = []
+    for block in blocks:
+        if isinstance(block, dict):
+            type_field = next(key for key in block if key not in ('start_time', 'end_time', 'duration'))
+            normalized.append((block[type_field], to_epoch(block['start_time']), to_epoch(block['end_time'])))
+        else:
+            normalized.append((block[0], to_epoch(block[1]), to_epoch(block[2])))
+    return normalized
+
+
+def plot_blocks(blocks, name, output_format=None):
     """
     Plots the  blocks on a timeline with different colors for different activities.
 
     Parameters:
     - blocks: List of blocks, each defined by an type, start time, and end time.
+    - name (str): Name of the blocks, used in the title.
+    - output_format (str): 'png' or 'svg' to return the plot as bytes instead of showing it.
+
+    Returns:
+    - bytes: The rendered plot if output_format is set, otherwise None.
     """
     color_list = ['red', 'green', 'blue', 'yellow', 'orange', 'purple', 'brown', 'pink', 'gray', 'cyan']
 
+    blocks = normalize_blocks(blocks)
+
     # Create a mapping of activities to colors
-    types = list(set(block[0] for block in blocks))
+    types = list(dict.fromkeys(str(block[0]) for block in blocks))
     colors = {block: color for block, color in zip(types, color_list)}
 
-    fig, ax = plt.subplots()
+    fig, ax = create_figure(output_format)
 
-    # Convert timestamps to datetime objects for plotting
-    for block in blocks:
-        type = block[0]
-        start_time = datetime.fromtimestamp(block[1])
-        end_time = datetime.fromtimestamp(block[2])
-        color = colors.get(type, 'black')  # Default to black if  not found
-
-        # Plotting each  block
-        plt.plot([start_time, end_time], [1, 1], color=color, linewidth=10, solid_capstyle='butt')
+    # One bar collection per type, with matplotlib dates as x values
+    for type in types:
+        spans = np.array([(block[1], block[2]) for block in blocks if str(block[0]) == type])
+        starts = mdates.date2num(to_datetimes(spans[:, 0]))
+        ends = mdates.date2num(to_datetimes(spans[:, 1]))
+        ax.broken_barh(list(zip(starts, ends - starts)), (0.9, 0.2), facecolors=colors.get(type, 'black'), label=type)
 
     # Improve the x-axis with date formatting
-    ax.xaxis.set_major_locator(mdates.DayLocator())
-    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-
-    plt.yticks([])  # Hide y-axis ticks
-    plt.title(f'{name} Timeline')
-    plt.xlabel('Time')
+    ax.xaxis_date()
+    ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d %H:%M'))
+    fig.autofmt_xdate()
 
-    # Creating a custom legend
-    custom_lines = [plt.Line2D([0], [0], color=color, lw=4) for color in color_list[:len(types)]]
-    plt.legend(custom_lines, types)
+    ax.set_yticks([])  # Hide y-axis ticks
+    ax.set_title(f'{name} Timeline')
+    ax.set_xlabel('Time')
+    ax.legend()
 
-    plt.tight_layout()
-    plt.show()
+    fig.tight_layout()
+    return finish_figure(fig, output_format)
@@ -0,0 +1,193 @@
+"""
+Utility functions for resampling time series data streams with NumPy.
+
+Records are grouped into buckets either on a fixed grid (integer division of epoch seconds by the granularity)
+or anchored at the first record of each bucket, and every bucket is then reduced in one vectorized pass.
+"""
+import numpy as np
+
+AGGREGATIONS = ('count', 'sum', 'mean', 'std', 'min', 'max', 'first', 'last')
+
+
+def to_epoch_seconds(timestamps):
+    """
+    Convert timestamps to an array of float seconds.
+
+    Parameters:
+    - timestamps (list): Epoch seconds or strings formatted as '%Y-%m-%d %H:%M:%S'.
+
+    Returns:
+    - np.ndarray: Float seconds. Strings are parsed as naive wall-clock times, so only differences between
+      the returned values are meaningful for them.
+    """
+    timestamps = np.asarray(timestamps)
+    if timestamps.size == 0:
+        return np.zeros(0, dtype=float)
+    if timestamps.dtype.kind in 'iuf':
+        return timestamps.astype(float)
+    return timestamps.astype('datetime64[s]').astype(np.int64).astype(float)
+
+
+def fixed_bucket_starts(epochs, granularity_seconds, origin=0):
+    """
+    Find the first index of every non-empty bucket on a fixed grid.
+
+    Parameters:
+    - epochs (np.ndarray): Sorted epoch seconds.
+    - granularity_seconds (float): Width of a bucket in seconds.
+    - origin (float): Epoch seconds the grid is aligned to.
+
+    Returns:
+    - tuple: (first index of each bucket, bucket ids relative to origin).
+    """
+    bucket_ids = np.floor_divide(epochs - origin, granularity_seconds).astype(np.int64)
+    starts = np.concatenate(([0], np.flatnonzero(bucket_ids[1:] != bucket_ids[:-1]) + 1))
+    return starts, bucket_ids[starts]
+
+
+def anchored_bucket_starts(epochs, granularity_seconds):
+    """
+    Find the first index of every bucket when each bucket is anchored at its first record.
+
+    A record belongs to the current bucket while it is less than granularity_seconds after the bucket's
+    first record, otherwise it starts a new bucket. This is the interval logic the stream aggregation
+    functions have always used.
+
+    Parameters:
+    - epochs (np.ndarray): Sorted epoch seconds.
+    - granularity_seconds (float): Width of a bucket in seconds.
+
+    Returns:
+    - np.ndarray: First index of each bucket.
+    """
+    starts = []
+    i = 0
+    n = len(epochs)
+    while i < n:
+        starts.append(i)
+        i = int(np.searchsorted(epochs, epochs[i] + granularity_seconds, side='left'))
+    return np.asarray(starts, dtype=np.int64)
+
+
+def reduce_buckets(values, starts, aggregations=('mean',)):
+    """
+    Reduce contiguous buckets of values.
+
+    Parameters:
+    - values (np.ndarray): Values ordered so that every bucket is contiguous.
+    - starts (np.ndarray): First index of each bucket.
+    - aggregations (tuple): Any of 'count', 'sum', 'mean', 'std', 'min', 'max', 'first', 'last'.
+
+    Returns:
+    - dict: Aggregation name mapped to an array with one value per bucket.
+    """
+    unknown = set(aggregations) - set(AGGREGATIONS)
+    if unknown:
+        raise ValueError(f"Unknown aggregations: {sorted(unknown)}")
+
+    values = np.asarray(values, dtype=float)
+    if len(starts) == 0:
+        return {aggregation: np.zeros(0) for aggregation in aggregations}
+
+    counts = np.diff(np.append(starts, len(values)))
+    sums = np.add.reduceat(values, starts)
+    means = sums / counts
+
+    results = {}
+    for aggregation in aggregations:
+        if aggregation == 'count':
+            results['count'] = counts
+        elif aggregation == 'sum':
+            results['sum'] = sums
+        elif aggregation == 'mean':
+            results['mean'] = means
+        elif aggregation == 'std':
+            deviations = values - np.repeat(means, counts)
+            results['std'] = np.sqrt(np.add.reduceat(deviations * deviations, starts) / counts)
+        elif aggregation == 'min':
+            results['min'] = np.minimum.reduceat(values, starts)
+        elif aggregation == 'max':
+            results['max'] = np.maximum.reduceat(values, starts)
+        elif aggregation == 'first':
+            results['first'] = values[starts]
+        elif aggregation == 'last':
+            results['last'] = values[np.append(starts[1:], len(values)) - 1]
+    return results
+
+
+def resample(timestamps, values, granularity_seconds, aggregations=('mean',), anchored=False, origin=0):
+    """
+    Resample a stream into buckets and aggregate the values of each bucket.
+
+    Parameters:
+    - timestamps (list): Epoch seconds or '%Y-%m-%d %H:%M:%S' strings, one per value.
+    - values (list): Numeric values to aggregate.
+    - granularity_seconds (float): Width of a bucket in seconds.
+    - aggregations (tuple): Any of 'count', 'sum', 'mean', 'std', 'min', 'max', 'first', 'last'.
+    - anchored (bool): Anchor buckets at their first record instead of the fixed grid.
+    - origin (float): Epoch seconds the fixed grid is aligned to (ignored when anchored).
+
+    Returns:
+    - dict: 'bucket_start' (start of each bucket in the units of timestamps), 'first_index' (index into the
+      input of the first record of each bucket) and one array per requested aggregation.
+    """
+    epochs = to_epoch_seconds(timestamps)
+    values = np.asarray(values, dtype=float)
+
+    order = np.argsort(epochs, kind='stable')
+    epochs = epochs[order]
+    values = values[order]
+
+    if len(epochs) == 0:
+        starts = np.zeros(0, dtype=np.int64)
+        bucket_start = np.zeros(0)
+    elif anchored:
+        starts = anchored_bucket_starts(epochs, granularity_seconds)
+        bucket_start = epochs[starts]
+    else:
+        starts, bucket_ids = fixed_bucket_starts(epochs, granularity_seconds, origin)
+        bucket_start = bucket_ids * granularity_seconds + origin
+
+    results = reduce_buckets(values, starts, aggregations)
+    results['bucket_start'] = bucket_start
+    results['first_index'] = order[starts]
+    return results
+
+
+def resample_to_grid(timestamps, values, start, end, granularity_seconds, aggregations=('mean',)):
+    """
+    Resample a stream onto a dense fixed grid covering [start, end).
+
+    Parameters:
+    - timestamps (list): Epoch seconds, one per value.
+    - values (list): Numeric values to aggregate.
+    - start (float): Epoch seconds of the first bucket.
+    - end (float): Epoch seconds where the grid ends (exclusive).
+    - granularity_seconds (float): Width of a bucket in seconds.
+    - aggregations (tuple): Any of 'count', 'sum', 'mean', 'std', 'min', 'max', 'first', 'last'.
+
+    Returns:
+    - dict: 'bucket_start' for every bucket of the grid and one array per requested aggregation. Empty
+      buckets hold 0 for 'count' and 'sum' and NaN otherwise.
+    """
+    num_buckets = max(int(np.ceil((end - start) / granularity_seconds)), 0)
+    epochs = to_epoch_seconds(timestamps)
+    values = np.asarray(values, dtype=float)
+
+    bucket_ids = np.floor_divide(epochs - start, granularity_seconds).astype(np.int64)
+    in_grid = (bucket_ids >= 0) & (bucket_ids < num_buckets)
+
+    sparse = resample(epochs[in_grid], values[in_grid], granularity_seconds, aggregations, origin=start)
+    occupied = np.floor_divide(sparse['bucket_start'] - start, granularity_seconds).astype(np.int64)
+
+    results = {'bucket_start': start + np.arange(num_buckets) * granularity_seconds}
+    for aggregation in aggregations:
+        if aggregation == 'count':
+            results['count'] = np.bincount(bucket_ids[in_grid], minlength=num_buckets)
+        elif aggregation == 'sum':
+            results['sum'] = np.bincount(bucket_ids[in_grid], weights=values[in_grid], minlength=num_buckets)
+        else:
+            dense = np.full(num_buckets, np.nan)
+            dense[occupied] = sparse[aggregation]
+            results[aggregation] = dense
+    return results
@@ -0,0 +1,155 @@
+"""
+Grid spatial indexes for radius and place-membership queries on GPS coordinates.
+
+Coordinates are bucketed into the cells of a geohash precision, addressed by their integer (row, column) on the
+geohash grid so whole traces are bucketed with NumPy. A cell is at least as large as the query radius, so all the
+points within the radius of a coordinate lie in its cell or one of the 8 neighbouring cells, and only those are
+compared exactly.
+"""
+import math
+
+import numpy as np
+
+from data_processing.geo_utils import METERS_PER_DEGREE, geohash_cell_size, geohash_precision_for_radius, \
+    haversine_distance
+
+
+def grid_cells(latitudes, longitudes, precision):
+    """
+    Find the geohash grid cell of coordinates.
+
+    Parameters:
+    - latitudes (np.ndarray): Latitudes in degrees.
+    - longitudes (np.ndarray): Longitudes in degrees.
+    - precision (int): Geohash precision of the grid.
+
+    Returns:
+    - tuple: (rows, columns) integer arrays.
+    """
+    latitude_size, longitude_size = geohash_cell_size(precision)
+    num_rows, num_columns = round(180.0 / latitude_size), round(360.0 / longitude_size)
+    rows = np.clip(np.floor((np.asarray(latitudes, dtype=float) + 90.0) / latitude_size), 0, num_rows - 1)
+    columns = np.floor((np.asarray(longitudes, dtype=float) + 180.0) / longitude_size) % num_columns
+    return rows.astype(np.int64), columns.astype(np.int64)
+
+
+def grid_precision(latitudes, radius_meters):
+    """Longest geohash precision whose cells are at least radius_meters wide at all the given latitudes."""
+    if len(latitudes) == 0:
+        return geohash_precision_for_radius(0.0, radius_meters)
+    return geohash_precision_for_radius(float(np.max(np.abs(latitudes))), radius_meters)
+
+
+class SpatialIndex:
+    """Index of points answering "all points within a radius of a coordinate"."""
+
+    def __init__(self, latitudes, longitudes, radius_meters=50):
+        self.latitudes = np.asarray(latitudes, dtype=float)
+        self.longitudes = np.asarray(longitudes, dtype=float)
+        self.radius_meters = radius_meters
+        self.precision = grid_precision(self.latitudes, radius_meters)
+
+        rows, columns = grid_cells(self.latitudes, self.longitudes, self.precision)
+        self.num_columns = round(360.0 / geohash_cell_size(self.precision)[1])
+        # Points sorted by cell so the points of a cell are one slice
+        keys = rows * self.num_columns + columns
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def candidates(self, latitude, longitude, radius_meters):
+        """Indices of the points in the cells that may hold points within radius_meters of a coordinate."""
+        latitude_size, longitude_size = geohash_cell_size(self.precision)
+        row, column = (int(c[0]) for c in grid_cells([latitude], [longitude], self.precision))
+        # Radii larger than the cells reach further than the neighbouring cells
+        row_steps = math.ceil(radius_meters / (latitude_size * METERS_PER_DEGREE))
+        column_steps = math.ceil(radius_meters / (longitude_size * METERS_PER_DEGREE *
+                                                  max(math.cos(math.radians(abs(latitude) + latitude_size)), 1e-6)))
+        column_steps = min(column_steps, self.num_columns // 2)
+
+        slices = []
+        for r in range(row - row_steps, row + row_steps + 1):
+            for c in range(column - column_steps, column + column_steps + 1):
+                key = r * self.num_columns + c % self.num_columns
+                left, right = np.searchsorted(self.keys, [key, key + 1])
+                if right > left:
+                    slices.append(self.order[left:right])
+        return np.sort(np.concatenate(slices)) if slices else np.zeros(0, dtype=np.int64)
+
+    def query_radius(self, latitude, longitude, radius_meters=None):
+        """
+        Find the points within a radius of a coordinate.
+
+        Parameters:
+        - latitude (float): Latitude of the coordinate in degrees.
+        - longitude (float): Longitude of the coordinate in degrees.
+        - radius_meters (float): Search radius, the radius of the index by default.
+
+        Returns:
+        - np.ndarray: Sorted indices of the points closer than the radius (haversine distance).
+        """
+        radius_meters = self.radius_meters if radius_meters is None else radius_meters
+        indices = self.candidates(latitude, longitude, radius_meters)
+        distances = haversine_distance(self.latitudes[indices], self.longitudes[indices], latitude, longitude)
+        return indices[distances < radius_meters]
+
+
+class PlaceIndex:
+    """Index of places answering "which place contains this coordinate" for single coordinates and whole traces."""
+
+    def __init__(self, latitudes, longitudes, radius_meters=50):
+        self.latitudes = np.asarray(latitudes, dtype=float)
+        self.longitudes = np.asarray(longitudes, dtype=float)
+        self.radius_meters = radius_meters
+        self.precision = grid_precision(self.latitudes, radius_meters)
+        self.num_columns = round(360.0 / geohash_cell_size(self.precision)[1])
+
+        # Every place is registered in its cell and the 8 neighbouring cells
+        self.cells = {}
+        rows, columns = grid_cells(self.latitudes, self.longitudes, self.precision)
+        for place, (row, column) in enumerate(zip(rows, columns)):
+            for r in (row - 1, row, row + 1):
+                for c in (column - 1, column, column + 1):
+                    self.cells.setdefault(r * self.num_columns + c % self.num_columns, []).append(place)
+        self.cells = {key: np.array(places) for key, places in self.cells.items()}
+
+    def locate(self, latitude, longitude):
+        """Return the index of the closest place within the radius of a coordinate, or -1."""
+        return int(self.assign([latitude], [longitude])[0])
+
+    def assign(self, latitudes, longitudes):
+        """
+        Assign every coordinate of a trace to the closest place within the radius.
+
+        Parameters:
+        - latitudes (np.ndarray): Latitudes in degrees.
+        - longitudes (np.ndarray): Longitudes in degrees.
+
+        Returns:
+        - np.ndarray: Index of the place of each coordinate, -1 where no place is within the radius.
+        """
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        assignments = np.full(len(latitudes), -1, dtype=np.int64)
+        if len(latitudes) == 0 or len(self.latitudes) == 0:
+            return assignments
+
+        rows, columns = grid_cells(latitudes, longitudes, self.precision)
+        point_keys = rows * self.num_columns + columns
+        order = np.argsort(point_keys, kind='stable')
+        keys, cell_starts = np.unique(point_keys[order], return_index=True)
+        cell_ends = np.append(cell_starts[1:], len(order))
+        for key, cell_start, cell_end in zip(keys, cell_starts, cell_ends):
+            places = self.cells.get(key)
+            if places is None:
+                continue
+            points = order[cell_start:cell_end]
+            # Distance of every point of the cell to every candidate place
+            distances = haversine_distance(latitudes[points, None], longitudes[points, None],
+                                           self.latitudes[None, places], self.longitudes[None, places])
+            closest = np.argmin(distances, axis=1)
+            inside = distances[np.arange(len(points)), closest] < self.radius_meters
+            assignments[points[inside]] = places[closest[inside]]
+        return assignments
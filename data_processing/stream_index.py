@@ -0,0 +1,196 @@
+"""
+As-of (point-in-time) lookups on the per-user data streams.
+
+Every stream is indexed per user on its sorted timestamps, so the record in effect at a given time is found with a
+binary search instead of fetching and scanning a window around it. In CSV mode the sorted index of a user is built
+once per version of the file and cached; in MongoDB mode each lookup is a single query on the (uid, timestamp) index.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pymongo
+
+from data_processing import db_config
+from data_processing.data_processing_utils import get_csv_path, filter_frame
+from agents.config import USE_CSV
+
+DIRECTIONS = ('backward', 'forward', 'nearest')
+
+_stream_index_cache = {}
+
+
+def get_timestamp_field(collection_name):
+    return 'start_timestamp' if collection_name == 'ios_steps' else 'timestamp'
+
+
+class StreamIndex:
+    """Records of one user's stream sorted by timestamp."""
+
+    def __init__(self, timestamps, records):
+        self.timestamps = np.asarray(timestamps, dtype=float)
+        self.records = records
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def asof_indices(self, timestamps, tolerance=None, direction='backward', allow_exact_matches=True):
+        """
+        Find the index of the record in effect at each of the given times.
+
+        Parameters:
+        - timestamps (list): Epoch seconds to look up.
+        - tolerance (float): Maximum distance in seconds between a time and its record, None for no limit.
+        - direction (str): 'backward' for the last record at or before a time, 'forward' for the first record at
+          or after it and 'nearest' for the closest of both (the earlier one on ties).
+        - allow_exact_matches (bool): Whether a record exactly at a time matches it.
+
+        Returns:
+        - np.ndarray: Index into the records for each time, -1 where no record matches.
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown direction: {direction}")
+
+        targets = np.atleast_1d(np.asarray(timestamps, dtype=float))
+        num_records = len(self.timestamps)
+
+        backward = np.searchsorted(self.timestamps, targets, side='right' if allow_exact_matches else 'left') - 1
+        forward = np.searchsorted(self.timestamps, targets, side='left' if allow_exact_matches else 'right')
+
+        backward_distance = np.full(len(targets), np.inf)
+        has_backward = backward >= 0
+        backward_distance[has_backward] = targets[has_backward] - self.timestamps[backward[has_backward]]
+
+        forward_distance = np.full(len(targets), np.inf)
+        has_forward = forward < num_records
+        forward_distance[has_forward] = self.timestamps[forward[has_forward]] - targets[has_forward]
+
+        if direction == 'backward':
+            forward_distance[:] = np.inf
+        elif direction == 'forward':
+            backward_distance[:] = np.inf
+
+        use_backward = backward_distance <= forward_distance
+        indices = np.where(use_backward, backward, forward)
+        distances = np.where(use_backward, backward_distance, forward_distance)
+
+        limit = np.inf if tolerance is None else tolerance
+        return np.where(np.isfinite(distances) & (distances <= limit), indices, -1)
+
+    def asof_many(self, timestamps, tolerance=None, direction='backward', allow_exact_matches=True):
+        """Return the record in effect at each of the given epoch seconds, None where there is none."""
+        indices = self.asof_indices(timestamps, tolerance, direction, allow_exact_matches)
+        return [self.records[index] if index >= 0 else None for index in indices]
+
+    def asof(self, timestamp, tolerance=None, direction='backward', allow_exact_matches=True):
+        """Return the record in effect at the given epoch seconds, or None. See asof_indices for the parameters."""
+        index = self.asof_indices([timestamp], tolerance, direction, allow_exact_matches)[0]
+        return self.records[index] if index >= 0 else None
+
+
+def build_stream_index(records, timestamp_field='timestamp'):
+    """
+    Index already fetched records of a stream.
+
+    Parameters:
+    - records (list): Records sorted by timestamp.
+    - timestamp_field (str): Field holding the epoch seconds of a record.
+
+    Returns:
+    - StreamIndex: Index over the records.
+    """
+    return StreamIndex([r[timestamp_field] for r in records], records)
+
+
+def get_stream_index(uid, collection_name, query=None):
+    """
+    Get the sorted index of a user's stream from its CSV file, rebuilding it only when the file has changed.
+
+    Parameters:
+    - uid (str): User identifier.
+    - collection_name (str): The name of the collection/CSV file.
+    - query (dict): Additional MongoDB style filter on the records, e.g. {'accuracy': {'$lt': 100}}.
+
+    Returns:
+    - StreamIndex: The user's records sorted by timestamp.
+    """
+    csv_filename = get_csv_path(collection_name)
+    try:
+        version = os.path.getmtime(csv_filename)
+    except OSError:
+        return StreamIndex([], [])
+
+    key = (collection_name, uid, repr(sorted((query or {}).items())))
+    cached = _stream_index_cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    timestamp_field = get_timestamp_field(collection_name)
+    df = filter_frame(pd.read_csv(csv_filename), dict(query or {}, uid=uid))
+    if timestamp_field in df.columns:
+        df = df.sort_values(by=timestamp_field, kind='stable')
+        index = StreamIndex(df[timestamp_field].to_numpy(dtype=float), df.to_dict('records'))
+    else:
+        index = StreamIndex([], [])
+
+    _stream_index_cache[key] = (version, index)
+    return index
+
+
+def _fetch_nearest_document(collection, query, timestamp_field, timestamp, tolerance, forward, allow_exact_matches):
+    if forward:
+        bounds = {'$gte' if allow_exact_matches else '$gt': timestamp}
+        if tolerance is not None:
+            bounds['$lte'] = timestamp + tolerance
+    else:
+        bounds = {'$lte' if allow_exact_matches else '$lt': timestamp}
+        if tolerance is not None:
+            bounds['$gte'] = timestamp - tolerance
+    order = pymongo.ASCENDING if forward else pymongo.DESCENDING
+    documents = list(collection.find(dict(query, **{timestamp_field: bounds})).sort(timestamp_field, order).limit(1))
+    return documents[0] if documents else None
+
+
+def fetch_document_asof(uid, timestamp, collection_name, tolerance=None, direction='backward',
+                        allow_exact_matches=True, query=None):
+    """
+    Fetch the record of a user's stream in effect at a given time.
+
+    Parameters:
+    - uid (str): User identifier.
+    - timestamp (float): Epoch seconds to look up.
+    - collection_name (str): The name of the collection/CSV file to query.
+    - tolerance (float): Maximum distance in seconds between the time and the record, None for no limit.
+    - direction (str): 'backward' for the last record at or before the time, 'forward' for the first record at or
+      after it and 'nearest' for the closest of both (the earlier one on ties).
+    - allow_exact_matches (bool): Whether a record exactly at the time matches it.
+    - query (dict): Additional MongoDB style filter on the records, e.g. {'accuracy': {'$lt': 100}}.
+
+    Returns:
+    - dict: The matching record, or None if there is none.
+    """
+    if USE_CSV:
+        return get_stream_index(uid, collection_name, query).asof(timestamp, tolerance, direction,
+                                                                  allow_exact_matches)
+
+    if direction not in DIRECTIONS:
+        raise ValueError(f"Unknown direction: {direction}")
+
+    timestamp_field = get_timestamp_field(collection_name)
+    collection = db_config.DbConfig().getDb()[collection_name]
+    query = dict(query or {}, uid=uid)
+
+    backward = None
+    if direction in ('backward', 'nearest'):
+        backward = _fetch_nearest_document(collection, query, timestamp_field, timestamp, tolerance, False,
+                                           allow_exact_matches)
+    forward = None
+    if direction in ('forward', 'nearest'):
+        forward = _fetch_nearest_document(collection, query, timestamp_field, timestamp, tolerance, True,
+                                          allow_exact_matches)
+
+    if backward is None or forward is None:
+        return backward if backward is not None else forward
+    if timestamp - backward[timestamp_field] <= forward[timestamp_field] - timestamp:
+        return backward
+    return forward
@@ -0,0 +1,157 @@
+"""
+Utility functions for reducing GPS traces to a bounded number of points for maps.
+
+Trajectories are simplified with Douglas-Peucker, which drops the points within a tolerance of the simplified
+line, followed by Visvalingam-Whyatt, which removes the points spanning the smallest triangle areas until a point
+budget is met. Point clouds are thinned by merging the points of the same geohash grid cell.
+"""
+import heapq
+
+import numpy as np
+
+from data_processing.geo_utils import METERS_PER_DEGREE
+from data_processing.spatial_index import grid_cells
+
+
+def to_local_meters(latitudes, longitudes):
+    """Project coordinates to planar (x, y) meters with an equirectangular projection around their mean latitude."""
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    scale = np.cos(np.radians(np.mean(latitudes))) if len(latitudes) else 1.0
+    return longitudes * METERS_PER_DEGREE * scale, latitudes * METERS_PER_DEGREE
+
+
+def douglas_peucker(latitudes, longitudes, tolerance_meters):
+    """
+    Simplify a trajectory with the Douglas-Peucker algorithm.
+
+    Parameters:
+    - latitudes (np.ndarray): Latitudes in degrees.
+    - longitudes (np.ndarray): Longitudes in degrees.
+    - tolerance_meters (float): Largest distance of a dropped point from the simplified trajectory.
+
+    Returns:
+    - np.ndarray: Sorted indices of the points kept, always including the first and last point.
+    """
+    x, y = to_local_meters(latitudes, longitudes)
+    num_points = len(x)
+    if num_points <= 2:
+        return np.arange(num_points)
+
+    keep = np.zeros(num_points, dtype=bool)
+    keep[[0, -1]] = True
+    segments = [(0, num_points - 1)]
+    while segments:
+        first, last = segments.pop()
+        if last - first < 2:
+            continue
+        # Distance of the points between first and last to the segment joining them
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+        length_squared = dx * dx + dy * dy
+        if length_squared == 0:
+            distances = np.hypot(px, py)
+        else:
+            t = np.clip((px * dx + py * dy) / length_squared, 0, 1)
+            distances = np.hypot(px - t * dx, py - t * dy)
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_meters:
+            split = first + 1 + farthest
+            keep[split] = True
+            segments += [(first, split), (split, last)]
+    return np.flatnonzero(keep)
+
+
+def visvalingam_whyatt(latitudes, longitudes, max_points):
+    """
+    Simplify a trajectory to at most max_points points with the Visvalingam-Whyatt algorithm.
+
+    Parameters:
+    - latitudes (np.ndarray): Latitudes in degrees.
+    - longitudes (np.ndarray): Longitudes in degrees.
+    - max_points (int): Number of points to keep, at least 2.
+
+    Returns:
+    - np.ndarray: Sorted indices of the points kept, always including the first and last point.
+    """
+    x, y = to_local_meters(latitudes, longitudes)
+    num_points = len(x)
+    max_points = max(max_points, 2)
+    if num_points <= max_points:
+        return np.arange(num_points)
+
+    def area(previous, point, following):
+        return abs((x[point] - x[previous]) * (y[following] - y[previous]) -
+                   (x[following] - x[previous]) * (y[point] - y[previous])) / 2
+
+    previous_points = np.arange(-1, num_points - 1)
+    following_points = np.arange(1, num_points + 1)
+    areas = np.full(num_points, np.inf)
+    heap = []
+    for point in range(1, num_points - 1):
+        areas[point] = area(point - 1, point, point + 1)
+        heap.append((areas[point], point))
+    heapq.heapify(heap)
+
+    removed = np.zeros(num_points, dtype=bool)
+    num_kept = num_points
+    while num_kept > max_points:
+        point_area, point = heapq.heappop(heap)
+        # Skip heap entries of removed points and outdated areas
+        if removed[point] or point_area != areas[point]:
+            continue
+        removed[point] = True
+        num_kept -= 1
+        previous, following = previous_points[point], following_points[point]
+        following_points[previous], previous_points[following] = following, previous
+        for neighbour in (previous, following):
+            if 0 < neighbour < num_points - 1:
+                # A neighbour never becomes less significant than the point removed before it
+                areas[neighbour] = max(area(previous_points[neighbour], neighbour, following_points[neighbour]),
+                                       point_area)
+                heapq.heappush(heap, (areas[neighbour], neighbour))
+    return np.flatnonzero(~removed)
+
+
+def simplify_trajectory(latitudes, longitudes, max_points, tolerance_meters):
+    """
+    Simplify a trajectory with Douglas-Peucker at a tolerance, then with Visvalingam-Whyatt to a point budget.
+
+    Parameters:
+    - latitudes (np.ndarray): Latitudes in degrees.
+    - longitudes (np.ndarray): Longitudes in degrees.
+    - max_points (int): Largest number of points to keep.
+    - tolerance_meters (float): Douglas-Peucker tolerance.
+
+    Returns:
+    - np.ndarray: Sorted indices of the points kept.
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    kept = douglas_peucker(latitudes, longitudes, tolerance_meters)
+    return kept[visvalingam_whyatt(latitudes[kept], longitudes[kept], max_points)]
+
+
+def thin_points(latitudes, longitudes, max_points):
+    """
+    Merge points of the same grid cell, using the finest geohash grid that leaves at most max_points cells.
+
+    Parameters:
+    - latitudes (np.ndarray): Latitudes in degrees.
+    - longitudes (np.ndarray): Longitudes in degrees.
+    - max_points (int): Largest number of points to return.
+
+    Returns:
+    - tuple: (latitudes, longitudes, counts) arrays with the mean position and number of points of each cell.
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    for precision in range(9, 0, -1):
+        rows, columns = grid_cells(latitudes, longitudes, precision)
+        _, cells, counts = np.unique(np.stack([rows, columns], axis=1), axis=0, return_inverse=True,
+                                     return_counts=True)
+        if len(counts) <= max_points or precision == 1:
+            break
+    cells = cells.ravel()
+    return (np.bincount(cells, weights=latitudes) / counts, np.bincount(cells, weights=longitudes) / counts,
+            counts)
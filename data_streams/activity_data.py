@@ -10,6 +10,8 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../agen
 
 from datetime import datetime, timedelta
 from data_processing.data_processing_utils import fetch_documents_between_timestamps
+from data_processing.stream_index import fetch_document_asof
+from data_processing.block_utils import run_length_blocks, format_timestamps, whole_second_durations
 
 from data_streams.constants import IOS_ACTIVITY, time_zone_dict
 import agents.generic_summarizer
@@ -84,6 +86,10 @@ functions = {
 
 
 def get_activity_records(uid, start_time, end_time):
+    return process_records(uid, fetch_activity_records(uid, start_time, end_time))
+
+
+def fetch_activity_records(uid, start_time, end_time):
     user_timezone = time_zone_dict.get(uid, "est")
     timezone = pytz.timezone("America/New_York") if user_timezone == "est" else pytz.timezone(user_timezone)
     if (not isinstance(start_time, float)):
@@ -93,8 +99,7 @@ def get_activity_records(uid, start_time, end_time):
         start_time = start_time.timestamp()
         end_time = end_time.timestamp()
 
-    activity_records = fetch_documents_between_timestamps(uid, start_time, end_time, IOS_ACTIVITY)
-    return process_records(uid, activity_records)
+    return fetch_documents_between_timestamps(uid, start_time, end_time, IOS_ACTIVITY)
 
 
 def process_records(uid, activity_records):
@@ -142,65 +147,39 @@ def get_activity_summary(uid, start_time, end_time, instructions):
 
 
 def get_activity_blocks(uid, start_time, end_time):
-    activity_records = get_activity_records(uid, start_time, end_time)
-    if activity_records:
-        start_activity = activity_records[0]['activity'][0]
-        start_time = activity_records[0]['timestamp']
-        activity_blocks = []
-
-        for i in range(1, len(activity_records)):
-            if activity_records[i]['activity'] != activity_records[i - 1]['activity']:
-                end_time = activity_records[i]['timestamp']
-                start_time_timestamp = datetime.strptime(start_time, '%Y-%m-%d %H:%M:%S').timestamp()
-                end_time_timestamp = datetime.strptime(end_time, '%Y-%m-%d %H:%M:%S').timestamp()
-                duration = end_time_timestamp - start_time_timestamp
-                activity_blocks.append(
-                    {
-                        "activity": start_activity,
-                        "start_time": start_time,
-                        "end_time": end_time,
-                        "duration": duration
-                    }
-                )
-                # Update for the new activity block
-                start_activity = activity_records[i]['activity'][0]
-                start_time = activity_records[i]['timestamp']
-
-        # Add the last activity block
-        end_time = activity_records[-1]['timestamp']
-
-        start_time_timestamp = datetime.strptime(start_time, '%Y-%m-%d %H:%M:%S').timestamp()
-        end_time_timestamp = datetime.strptime(end_time, '%Y-%m-%d %H:%M:%S').timestamp()
-        duration = end_time_timestamp - start_time_timestamp
-        activity_blocks.append(
-            {
-                "activity": start_activity,
-                "start_time": start_time,
-                "end_time": end_time,
-                "duration": duration
-            }
-        )
-        return activity_blocks
-    else:
+    activity_records = fetch_activity_records(uid, start_time, end_time)
+    if not activity_records:
         return []
 
+    uid_timezone = time_zone_dict.get(uid, 'est')  # Get UID-specific timezone or default to EST
+    timezone = pytz.timezone("America/New_York") if uid_timezone == "est" else pytz.utc
 
-def get_activity_at_given_time(uid, given_time):
-    # Parse the given time
-    given_time_ = datetime.strptime(given_time, "%Y-%m-%d %H:%M:%S")
+    # Each block runs until the next change of activity, the last one until the last record
+    blocks = run_length_blocks([r['timestamp'] for r in activity_records], [r['activity'] for r in activity_records])
+    start_times = format_timestamps(blocks['start'], timezone)
+    end_times = format_timestamps(blocks['end'], timezone)
+    durations = whole_second_durations(blocks['start'], blocks['end'])
 
-    # Define the start and end time with a 5-minute range
-    start_time = given_time_ - timedelta(minutes=5)
-    end_time = given_time_ + timedelta(minutes=5)
+    return [
+        {
+            "activity": activity[0],
+            "start_time": block_start,
+            "end_time": block_end,
+            "duration": float(duration)
+        }
+        for activity, block_start, block_end, duration in zip(blocks['state'], start_times, end_times, durations)
+    ]
 
-    # Fetch activity records for the user within the given time window
-    activity_records = get_activity_records(uid, start_time, end_time)
 
-    # Find the closest record by comparing the time difference
-    if not activity_records:
+def get_activity_at_given_time(uid, given_time):
+    user_timezone = time_zone_dict.get(uid, "est")
+    timezone = pytz.timezone("America/New_York") if user_timezone == "est" else pytz.timezone(user_timezone)
+    given_timestamp = timezone.localize(datetime.strptime(given_time, "%Y-%m-%d %H:%M:%S")).timestamp()
+
+    # Find the closest record within 5 minutes of the given time
+    closest_record = fetch_document_asof(uid, given_timestamp, IOS_ACTIVITY, tolerance=5 * 60, direction='nearest')
+    if closest_record is None:
         return {}
-    closest_record = min(activity_records, key=lambda record: abs(
-        datetime.strptime(record['timestamp'], "%Y-%m-%d %H:%M:%S") - given_time_))
 
     return {'activity': closest_record['activity'], 'timestamp': given_time}
 
@@ -234,8 +213,8 @@ def get_activity_metrics(uid, start_time, end_time):
     print(generate_total_activity(uid, start_time, end_time))
 
 
-def plot_activity(activity_blocks):
-    plot_blocks(activity_blocks, 'Activity')
+def plot_activity(activity_blocks, output_format=None):
+    return plot_blocks(activity_blocks, 'Activity', output_format)
 
 
 if __name__ == "__main__":
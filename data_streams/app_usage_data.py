@@ -1,6 +1,7 @@
 import math
 import sys
 import os
+import numpy as np
 import pytz
 
 from datetime import datetime, timedelta
@@ -13,10 +14,12 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../agen
 
 import matplotlib.pyplot as plt
 import agents.generic_summarizer
-from data_processing.data_processing_utils import fetch_documents_between_timestamps
+from data_processing.data_processing_utils import fetch_documents_between_timestamps, find_documents, \
+    insert_documents, delete_documents, ensure_indexes
 from data_streams.lock_unlock_data import get_lock_unlock_blocks
 
-from data_streams.constants import APP_USAGE_LOGS, IOS_LOCK_UNLOCK, time_zone_dict
+from data_streams.constants import APP_USAGE_LOGS, APP_SESSIONS, APP_SESSION_COVERAGE, IOS_LOCK_UNLOCK, \
+    time_zone_dict
 
 app_map = {
     "SNAP": "SnapChat",
@@ -107,7 +110,95 @@ def process_records(uid, app_records):
     return records
 
 
+def reconcile_app_events(event_timestamps, event_apps, event_statuses, block_starts, block_ends):
+    """
+    Reconcile app open/close events against phone lock/unlock blocks in a single sweep.
+
+    Missing open or close events are inserted so that every app session is closed before the next one opens,
+    using the bounds of the lock/unlock block the event falls in.
+
+    Parameters:
+    - event_timestamps (list): Sorted epoch seconds of the app events.
+    - event_apps (list): App name of each event.
+    - event_statuses (list): 'open' or 'close' for each event.
+    - block_starts (list): Epoch seconds at which each lock/unlock block starts.
+    - block_ends (list): Non-decreasing epoch seconds at which each lock/unlock block ends.
+
+    Returns:
+    - list: Corrected events as dictionaries with 'appName', 'timestamp' and 'status'.
+    """
+    num_events = len(event_timestamps)
+    num_blocks = len(block_ends)
+    if num_events == 0 or num_blocks == 0:
+        return []
+
+    # First block ending at or after each event; block ends are sorted so one search covers the whole stream
+    block_positions = np.searchsorted(np.asarray(block_ends, dtype=float),
+                                      np.asarray(event_timestamps, dtype=float), side='left')
+
+    def event(app, timestamp, status):
+        return {"appName": app, "timestamp": timestamp, "status": status}
+
+    updated_records = []
+    block_index = 0
+    for j in range(num_events):
+        timestamp = event_timestamps[j]
+        app = event_apps[j]
+        status = event_statuses[j]
+
+        # Events after the last block fall back to the last block
+        if block_positions[j] < num_blocks:
+            block_index = max(block_index, int(block_positions[j]))
+            i = block_index
+        else:
+            i = num_blocks - 1
+        block_start_time = block_starts[i]
+        block_end_time = block_ends[i]
+
+        if j == 0:
+            if status == "close":
+                updated_records.append(event(app, block_start_time, "open"))
+            updated_records.append(event(app, timestamp, status))
+            continue
+
+        if j == num_events - 1:
+            updated_records.append(event(app, timestamp, status))
+            if status == "open":
+                updated_records.append(event(app, block_end_time, "close"))
+            continue
+
+        previous = updated_records[-1]
+        if status == "close":
+            if previous['status'] == "open" and previous['appName'] == app:
+                updated_records.append(event(app, timestamp, status))
+            elif previous['status'] == "open":
+                # Close the other app at the end of the previous block if this event is in a later block
+                if block_start_time > previous['timestamp']:
+                    update_time = block_ends[i - 1]
+                else:
+                    update_time = timestamp
+                updated_records.append(event(previous['appName'], update_time, "close"))
+                updated_records.append(event(app, max(update_time, block_start_time), "open"))
+                updated_records.append(event(app, timestamp, status))
+            else:
+                updated_records.append(event(app, max(previous['timestamp'], block_start_time), "open"))
+                updated_records.append(event(app, timestamp, status))
+
+        if status == "open":
+            if previous['status'] == "close":
+                updated_records.append(event(app, timestamp, status))
+            else:
+                updated_records.append(event(event_apps[j - 1], min(timestamp, block_end_time), "close"))
+                updated_records.append(event(app, timestamp, status))
+
+    return updated_records
+
+
 def get_app_usage_records(uid, start_time, end_time, debug=False):
+    return process_records(uid, get_reconciled_app_events(uid, start_time, end_time, debug))
+
+
+def get_reconciled_app_events(uid, start_time, end_time, debug=False):
     start_time_orig = start_time
     end_time_orig =  end_time
 
@@ -139,136 +230,104 @@ def get_app_usage_records(uid, start_time, end_time, debug=False):
     if not lock_unlock_blocks:
         lock_unlock_blocks = [{"start_time": start_time_, "end_time": end_time_}]
 
-    block_index = 0
-
-    updated_app_usage_records = []
-
-    j = 0
-    while (j < len(app_usage_records)):
-        for i in range(block_index, len(lock_unlock_blocks)):
-            block_start_time = timezone.localize(
-                datetime.strptime(lock_unlock_blocks[i]['start_time'], "%Y-%m-%d %H:%M:%S")).astimezone(
-                pytz.UTC).timestamp()
-            block_end_time = timezone.localize(
-                datetime.strptime(lock_unlock_blocks[i]['end_time'], "%Y-%m-%d %H:%M:%S")).astimezone(
-                pytz.UTC).timestamp()
-
-            if (app_usage_records[j]['timestamp'] > block_end_time):
-                continue
-            block_index = i
-            break
+    # Convert every block bound once so the merge below only compares epoch seconds
+    block_starts = [timezone.localize(datetime.strptime(block['start_time'], "%Y-%m-%d %H:%M:%S")).astimezone(
+        pytz.UTC).timestamp() for block in lock_unlock_blocks]
+    block_ends = [timezone.localize(datetime.strptime(block['end_time'], "%Y-%m-%d %H:%M:%S")).astimezone(
+        pytz.UTC).timestamp() for block in lock_unlock_blocks]
 
-        if (j == 0):
-            if app_usage_records[j]['status'] == "close":
-                record = {"appName": app_usage_records[0]["appName"], "timestamp": block_start_time, "status": "open"}
-                if debug: print("Appending:", process_records(uid, [record]))
-                updated_app_usage_records.append(record)
-            if debug: print("Appending:", process_records(uid, [app_usage_records[j]]))
-            updated_app_usage_records.append(app_usage_records[j])
-            j += 1
-            continue
+    updated_app_usage_records = reconcile_app_events([r['timestamp'] for r in app_usage_records],
+                                                     [r['appName'] for r in app_usage_records],
+                                                     [r['status'] for r in app_usage_records],
+                                                     block_starts, block_ends)
+    if debug:
+        for p in process_records(uid, updated_app_usage_records):
+            print("Appending:", p)
 
-        if (j == len(app_usage_records) - 1):
-            if debug: print("Appending:", process_records(uid, [app_usage_records[j]]))
-            updated_app_usage_records.append(app_usage_records[j])
-            if app_usage_records[j]['status'] == "open":
-                record = {"appName": app_usage_records[j]["appName"], "timestamp": block_end_time, "status": "close"}
-                if debug: print("Appending:", process_records(uid,[record]))
-                updated_app_usage_records.append(record)
-            j += 1
-            continue
+    return updated_app_usage_records
 
-        if (app_usage_records[j]['status'] == "close"):
-            if j - 1 >= 0:
-                if updated_app_usage_records[-1]['status'] == "open":
-                    if updated_app_usage_records[-1]["appName"] == app_usage_records[j]['appName']:
-                        if debug: print("Appending:", process_records(uid, [app_usage_records[j]]))
-                        updated_app_usage_records.append(app_usage_records[j])
-                    else:
-                        previous_block_end = datetime.strptime(lock_unlock_blocks[i - 1]['end_time'],
-                                                               "%Y-%m-%d %H:%M:%S").timestamp()
-                        if (block_start_time > updated_app_usage_records[-1]['timestamp']):
-                            update_time = previous_block_end
-                        else:
-                            update_time = app_usage_records[j]['timestamp']
-                        record_close = {"appName": updated_app_usage_records[-1]["appName"], "timestamp": update_time,
-                                        "status": "close"}
-
-                        if debug: print("Appending:", process_records(uid, [record_close]))
-                        updated_app_usage_records.append(record_close)
-
-                        update_time = max(updated_app_usage_records[-1]['timestamp'], block_start_time)
-                        record_open = {"appName": app_usage_records[j]["appName"], "timestamp": update_time,
-                                       "status": "open"}
-                        if debug: print("Appending:", process_records(uid, [record_open]))
-                        updated_app_usage_records.append(record_open)
-                        if debug: print("Appending:", process_records(uid, [app_usage_records[j]]))
-                        updated_app_usage_records.append(app_usage_records[j])
 
-                else:
-                    update_time = max(updated_app_usage_records[-1]['timestamp'], block_start_time)
-                    record_open = {"appName": app_usage_records[j]["appName"], "timestamp": update_time,
-                                   "status": "open"}
-                    if debug: print("Appending:", process_records(uid, [record_open]))
-                    updated_app_usage_records.append(record_open)
-                    if debug: print("Appending:", process_records(uid, [app_usage_records[j]]))
-                    updated_app_usage_records.append(app_usage_records[j])
-
-        if (app_usage_records[j]['status'] == "open"):
-            if j - 1 < len(app_usage_records) and updated_app_usage_records[-1]['status'] == "close":
-                if debug: print("Appending:", process_records(uid, [app_usage_records[j]]))
-                updated_app_usage_records.append(app_usage_records[j])
-            else:
-                update_time = min(app_usage_records[j]['timestamp'], block_end_time)
-                record_close = {"appName": app_usage_records[j - 1]["appName"], "timestamp": update_time,
-                                "status": "close"}
-                if debug: print("Appending:", process_records(uid, [record_close]))
-                updated_app_usage_records.append(record_close)
-                if debug: print("Appending:", process_records(uid, [app_usage_records[j]]))
-                updated_app_usage_records.append(app_usage_records[j])
+def get_user_timezone(uid):
+    user_timezone = time_zone_dict.get(uid, "est")
+    return pytz.timezone("America/New_York") if user_timezone == "est" else pytz.timezone(user_timezone)
 
-        if debug: print(process_records(uid, updated_app_usage_records[-4:]))
-        j += 1
 
-    # print("adding fixed records:", len(updated_app_usage_records) - len(app_usage_records))
+def to_utc_timestamp(uid, given_time):
+    """Convert a local '%Y-%m-%d %H:%M:%S' string, datetime or epoch seconds to epoch seconds."""
+    if isinstance(given_time, str):
+        given_time = get_user_timezone(uid).localize(datetime.strptime(given_time, "%Y-%m-%d %H:%M:%S"))
+    if isinstance(given_time, datetime):
+        return given_time.timestamp()
+    return float(given_time)
 
-    app_usage_records.sort(key=lambda x: x['timestamp'])
 
-    return process_records(uid, updated_app_usage_records)
+def to_local_string(uid, timestamp):
+    return datetime.fromtimestamp(timestamp, pytz.utc).astimezone(get_user_timezone(uid)).strftime('%Y-%m-%d %H:%M:%S')
 
 
-def get_app_usage_blocks(uid, start_time, end_time):
-    app_usage_records = get_app_usage_records(uid, start_time, end_time)
+def pair_app_sessions(app_events):
+    """
+    Pair reconciled app open/close events into app sessions.
 
-    # for r in app_usage_records:
-    #     print(r)
+    Parameters:
+    - app_events (list): Reconciled events with 'appName', 'timestamp' (epoch seconds) and 'status'.
 
-    if not app_usage_records:
+    Returns:
+    - list: Sessions with 'app', 'open' and 'close' (epoch seconds) and 'duration' (seconds).
+    """
+    if len(app_events) < 2:
         return []
-    app_usage_blocks = []
-
-    for i in range(1, len(app_usage_records)):
-        # Convert timestamps to datetime objects
-        current_timestamp = datetime.strptime(app_usage_records[i]['timestamp'], "%Y-%m-%d %H:%M:%S")
-        previous_timestamp = datetime.strptime(app_usage_records[i - 1]['timestamp'], "%Y-%m-%d %H:%M:%S")
-
-        if app_usage_records[i]['appName'] != app_usage_records[i - 1]['appName']:
-            if app_usage_records[i - 1]['status'] == "open":
-                app_usage_blocks.append({
-                    "app": app_usage_records[i - 1]['appName'],
-                    "open": app_usage_records[i - 1]['timestamp'],
-                    "close": app_usage_records[i]['timestamp'],
-                    "duration": (current_timestamp - previous_timestamp).total_seconds()
-                })
-        else:
-            if (not (app_usage_records[i - 1]['status'] == "close" and app_usage_records[i]['status'] == "open")):
-                app_usage_blocks.append({
-                    "app": app_usage_records[i - 1]['appName'],
-                    "open": app_usage_records[i - 1]['timestamp'],
-                    "close": app_usage_records[i]['timestamp'],
-                    "duration": (current_timestamp - previous_timestamp).total_seconds()
-                })
-    return app_usage_blocks
+
+    apps = np.array([app_map.get(e['appName'], e['appName']) for e in app_events], dtype=object)
+    statuses = np.array([e['status'] for e in app_events], dtype=object)
+    timestamps = np.array([e['timestamp'] for e in app_events], dtype=float)
+
+    # A session spans an event and the next one unless a closed app is simply reopened
+    same_app = apps[1:] == apps[:-1]
+    previous_open = statuses[:-1] == "open"
+    reopened = (statuses[:-1] == "close") & (statuses[1:] == "open")
+    session_starts = np.flatnonzero(np.where(same_app, ~reopened, previous_open))
+
+    # Durations are whole seconds, matching the '%Y-%m-%d %H:%M:%S' timestamps they are reported with
+    whole_seconds = np.floor(timestamps)
+    return [{"app": apps[i], "open": timestamps[i], "close": timestamps[i + 1],
+             "duration": float(whole_seconds[i + 1] - whole_seconds[i])} for i in session_starts]
+
+
+def format_app_session(uid, session):
+    return {"app": session['app'], "open": to_local_string(uid, session['open']),
+            "close": to_local_string(uid, session['close']), "duration": session['duration']}
+
+
+def get_app_sessions(uid, start_time, end_time):
+    """
+    Get the app sessions of a user within a time range, from the session table when it covers the range.
+
+    Parameters:
+    - uid (str): The user identifier.
+    - start_time (str): Start of the range, in the format '%Y-%m-%d %H:%M:%S'.
+    - end_time (str): End of the range, in the format '%Y-%m-%d %H:%M:%S'.
+
+    Returns:
+    - list: Sessions with 'app', 'open' and 'close' (epoch seconds) and 'duration' (seconds).
+    """
+    start_timestamp = to_utc_timestamp(uid, start_time)
+    end_timestamp = to_utc_timestamp(uid, end_time)
+
+    if not is_app_session_table_covering(uid, start_timestamp, end_timestamp):
+        return pair_app_sessions(get_reconciled_app_events(uid, start_time, end_time))
+
+    sessions = []
+    for session in query_app_sessions(uid, start_timestamp, end_timestamp):
+        session_open = max(session['open'], start_timestamp)
+        session_close = min(session['close'], end_timestamp)
+        sessions.append({"app": session['app'], "open": session_open, "close": session_close,
+                         "duration": float(np.floor(session_close) - np.floor(session_open))})
+    return sessions
+
+
+def get_app_usage_blocks(uid, start_time, end_time):
+    return [format_app_session(uid, session) for session in get_app_sessions(uid, start_time, end_time)]
 
 
 def get_total_app_usage(uid, start_time, end_time):
@@ -294,7 +353,8 @@ def get_most_recent_app(uid, timestamp):
     start_time = (target_time - timedelta(hours=8)).strftime("%Y-%m-%d %H:%M:%S")
 
 
-    # Get app usage blocks within the last 8 hours
+    # Get app usage blocks within the last 8 hours, from the session table when it covers them. The session still
+    # in use at the given time is cut there
     app_usage_blocks = get_app_usage_blocks(uid, start_time, timestamp)
 
     # If there are no usage blocks, return None
@@ -313,6 +373,83 @@ def get_most_recent_app(uid, timestamp):
     return most_recent_block
 
 
+def get_app_session_coverage(uid):
+    """Return the {'uid', 'start', 'end'} range the persisted app session table covers for a user, if any."""
+    coverage = find_documents(APP_SESSION_COVERAGE, {'uid': uid}, limit=1)
+    return coverage[0] if coverage else None
+
+
+def is_app_session_table_covering(uid, start_timestamp, end_timestamp):
+    coverage = get_app_session_coverage(uid)
+    return coverage is not None and coverage['start'] <= start_timestamp and end_timestamp <= coverage['end']
+
+
+def query_app_sessions(uid, start_timestamp, end_timestamp):
+    """
+    Fetch persisted app sessions overlapping a time range.
+
+    Parameters:
+    - uid (str): The user identifier.
+    - start_timestamp (float): Start of the range in epoch seconds.
+    - end_timestamp (float): End of the range in epoch seconds.
+
+    Returns:
+    - list: Sessions sorted by open time.
+    """
+    return find_documents(APP_SESSIONS, {'uid': uid, 'open': {'$lte': end_timestamp},
+                                         'close': {'$gte': start_timestamp}}, sort_field='open')
+
+
+def update_app_session_table(uid, start_time, end_time):
+    """
+    Build or incrementally extend the persisted app session table of a user up to end_time.
+
+    When the table already covers start_time only the last stored session, which may have been cut at the end
+    of the previous run, and everything after it are rebuilt. Sessions are built over the whole range at once so
+    sessions crossing midnight are kept whole.
+
+    Parameters:
+    - uid (str): The user identifier.
+    - start_time (str): Start of the range to build, in the format '%Y-%m-%d %H:%M:%S'.
+    - end_time (str): End of the range to build, in the format '%Y-%m-%d %H:%M:%S'.
+
+    Returns:
+    - int: Number of sessions written.
+    """
+    ensure_indexes(APP_SESSIONS, [['uid', 'open'], ['uid', 'close']])
+
+    start_timestamp = to_utc_timestamp(uid, start_time)
+    end_timestamp = to_utc_timestamp(uid, end_time)
+
+    coverage = get_app_session_coverage(uid)
+    if coverage is not None and coverage['start'] <= start_timestamp <= coverage['end']:
+        if end_timestamp <= coverage['end']:
+            return 0
+        latest = find_documents(APP_SESSIONS, {'uid': uid}, sort_field='open', descending=True, limit=1)
+        rebuild_from = min(latest[0]['open'], coverage['end']) if latest else coverage['end']
+        start_timestamp = coverage['start']
+    else:
+        rebuild_from = start_timestamp
+        delete_documents(APP_SESSIONS, {'uid': uid})
+
+    # Timestamps are rebuilt from whole seconds, which is the resolution of the range passed to the stream
+    rebuild_from = float(np.floor(rebuild_from))
+    app_events = get_reconciled_app_events(uid, to_local_string(uid, rebuild_from), to_local_string(uid, end_timestamp))
+    sessions = [dict(session, uid=uid) for session in pair_app_sessions(app_events) if session['open'] >= rebuild_from]
+
+    delete_documents(APP_SESSIONS, {'uid': uid, 'open': {'$gte': rebuild_from}})
+    insert_documents(APP_SESSIONS, sessions)
+
+    delete_documents(APP_SESSION_COVERAGE, {'uid': uid})
+    insert_documents(APP_SESSION_COVERAGE, [{'uid': uid, 'start': start_timestamp, 'end': end_timestamp}])
+    return len(sessions)
+
+
+def update_app_session_tables(uids, start_time, end_time):
+    """Run the app sessionization job for several users."""
+    return {uid: update_app_session_table(uid, start_time, end_time) for uid in uids}
+
+
 def get_app_usage_summary(uid, start_time, end_time, instructions):
     start_time = datetime.strptime(start_time, '%Y-%m-%d %H:%M:%S')
     end_time = datetime.strptime(end_time, '%Y-%m-%d %H:%M:%S')
@@ -348,36 +485,38 @@ def get_app_usage_summary(uid, start_time, end_time, instructions):
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from datetime import datetime
+from data_processing.plotting_utils import create_figure, finish_figure
 
 
-def plot_app_durations(data):
+def plot_app_durations(data, output_format=None):
     # Convert timestamps to datetime and prepare durations and app names
-    times = [datetime.strptime(entry['open'], "%Y-%m-%d %H:%M:%S") for entry in data]
-    durations = [entry['duration'] for entry in data]
-    apps = [entry['app'] for entry in data]
+    times = np.array(mdates.date2num([datetime.strptime(entry['open'], "%Y-%m-%d %H:%M:%S") for entry in data]))
+    durations = np.array([entry['duration'] for entry in data], dtype=float)
+    apps = np.array([entry['app'] for entry in data], dtype=object)
 
     # Assign a unique color to each app
-    unique_apps = set(apps)
+    unique_apps = list(dict.fromkeys(apps))
     colors = plt.colormaps['tab10'](range(len(unique_apps)))
     app_colors = {app: colors[i] for i, app in enumerate(unique_apps)}
 
-    # Plot each app's durations using scatter plot and draw dashed lines to x-axis
-    plt.figure(figsize=(12, 6))
-    for i in range(len(data)):
-        plt.scatter(times[i], durations[i], color=app_colors[apps[i]], s=50,
-                    label=apps[i] if i == 0 or apps[i] != apps[i - 1] else "")
-        plt.vlines(times[i], 0, durations[i], color=app_colors[apps[i]], linestyles='dashed')
+    # Plot each app's durations using one scatter plot and one set of dashed lines to the x-axis per app
+    fig, ax = create_figure(output_format, figsize=(12, 6))
+    for app in unique_apps:
+        app_times, app_durations = times[apps == app], durations[apps == app]
+        ax.scatter(app_times, app_durations, color=app_colors[app], s=50, label=app)
+        ax.vlines(app_times, 0, app_durations, color=app_colors[app], linestyles='dashed')
 
     # Formatting the plot
-    plt.xlabel('Time')
-    plt.ylabel('Duration (seconds)')
-    plt.title('App Usage Duration Over Time')
-    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
-    plt.gcf().autofmt_xdate()
-    plt.legend(title="Apps")
-    plt.ylim(0)
-
-    plt.show()
+    ax.set_xlabel('Time')
+    ax.set_ylabel('Duration (seconds)')
+    ax.set_title('App Usage Duration Over Time')
+    ax.xaxis_date()
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M:%S'))
+    fig.autofmt_xdate()
+    ax.legend(title="Apps")
+    ax.set_ylim(0)
+
+    return finish_figure(fig, output_format)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,6 @@
 import sys
 import os
+import numpy as np
 import pandas as pd
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -7,8 +8,11 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'd
 
 from datetime import datetime
 from data_processing.data_processing_utils import fetch_documents_between_timestamps
+from data_processing.block_utils import run_length_blocks, format_timestamps, to_microseconds
 from data_streams.constants import IOS_BATTERY, time_zone_dict
-import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+from data_processing.plotting_utils import downsample_series, to_datetimes, create_figure, finish_figure, \
+    normalize_blocks
 from agents.coding_agent import run_coding_agent
 import pytz
 
@@ -41,9 +45,27 @@ functions = {
         "returns": "A list of charging discharging event within given time range.",
         "example": "[{'start_time': '2024-07-09 12:00:00', 'end_time': '2024-07-09 14:30:15', 'battery_state': 'discharging', 'duration': 150.25}, {'start_time': '2024-07-09 14:30:15', 'end_time': '2024-07-09 14:30:33', 'battery_state': 'charging', 'duration': 0.3}]"
     },
+    "BATTERY3": {
+        "name": "get_battery_drain_stats",
+        "usecase": ["function_calling", "code_generation"],
+        "description": "Calculates how fast the phone battery drains and charges for a specific user within a given time range, from the changes of the battery level.",
+        "params": {
+            "uid": {"type": "str",
+                    "description": "The unique identifier for the user whose battery data is to be analyzed."},
+            "start_time": {"type": "str",
+                           "description": "The start of the time range for which battery data is required."},
+            "end_time": {"type": "str",
+                         "description": "The end of the time range for which battery data is required."},
+        },
+        "returns": "A dictionary with 'mean_drain_rate' (average battery percentage lost per hour while discharging), 'median_drain_rate' and 'max_drain_rate' (over discharging phases), 'mean_charge_rate' (percentage gained per hour while charging), 'discharging_hours', 'charging_hours', 'num_discharging_phases', 'num_charging_phases' and 'estimated_hours_full_to_empty'. Values are NaN when there is no such phase.",
+        "example": "{'mean_drain_rate': 4.8, 'median_drain_rate': 4.1, 'max_drain_rate': 12.5, 'mean_charge_rate': 35.2, 'discharging_hours': 30.5, 'charging_hours': 3.2, 'num_discharging_phases': 3, 'num_charging_phases': 2, 'estimated_hours_full_to_empty': 20.8}"
+    },
 
 }
 
+# Level phases shorter than this are merged into the phase before them
+MIN_PHASE_DURATION = 10 * 60
+
 
 def process_records(uid, battery_records):
     records = []
@@ -68,6 +90,10 @@ def get_battery_records(uid, start_time, end_time):
 
 
 def get_battery_records_all(uid, start_time, end_time):
+    return process_records(uid, fetch_battery_records(uid, start_time, end_time))
+
+
+def fetch_battery_records(uid, start_time, end_time):
     user_timezone = time_zone_dict.get(uid, "est")
     timezone = pytz.timezone("America/New_York") if user_timezone == "est" else pytz.timezone(user_timezone)
 
@@ -78,61 +104,184 @@ def get_battery_records_all(uid, start_time, end_time):
         start_time = start_time.timestamp()
         end_time = end_time.timestamp()
 
-    battery_records = fetch_documents_between_timestamps(uid, start_time, end_time, IOS_BATTERY)
-    return process_records(uid, battery_records)
+    return fetch_documents_between_timestamps(uid, start_time, end_time, IOS_BATTERY)
 
 
 def get_discharging_charging_events(uid, start_time, end_time):
-    battery_records = get_battery_records_all(uid, start_time, end_time)
-    charging_events = []
-    prev_battery_state = -1
-    for b in battery_records:
-        if 'battery_state' in b:
-            if (prev_battery_state != b['battery_state']):
-                state = "charging" if b['battery_state'] == 1 else "discharging"
-                duration = (datetime.strptime(b['timestamp'], "%Y-%m-%d %H:%M:%S").timestamp() - datetime.strptime(
-                    start_time, "%Y-%m-%d %H:%M:%S").timestamp()) / 60
-                charging_events.append({"start_time": start_time, "end_time": b['timestamp'], "battery_state": state,
-                                        "duration": duration})
-                prev_battery_state = b['battery_state']
-                start_time = b['timestamp']
-
-    state = "charging" if prev_battery_state == 2 else "discharging"
-    duration = (datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S").timestamp() - datetime.strptime(start_time,
-                                                                                                       "%Y-%m-%d %H:%M:%S").timestamp()) / 60
-    charging_events.append(
-        {"start_time": start_time, "end_time": end_time, "battery_state": state, "duration": duration})
-    return charging_events
-
-
-def plot_battery(battery_records, charging_events):
+    battery_records = [b for b in fetch_battery_records(uid, start_time, end_time) if 'battery_state' in b]
+
+    user_timezone = time_zone_dict.get(uid, "est")
+    timezone = pytz.timezone("America/New_York") if user_timezone == "est" else pytz.timezone(user_timezone)
+    start_timestamp = timezone.localize(datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S")).timestamp()
+    end_timestamp = timezone.localize(datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S")).timestamp()
+
+    uid_timezone = time_zone_dict.get(uid, 'est')  # Get UID-specific timezone or default to EST
+    record_timezone = pytz.timezone("America/New_York") if uid_timezone == "est" else pytz.utc
+
+    # Every change of battery state closes the period before it, labelled with the state it changes to
+    blocks = run_length_blocks([b['timestamp'] for b in battery_records],
+                               [b['battery_state'] for b in battery_records])
+    change_times = (to_microseconds(blocks['start']) // 1000000).astype(float)
+    change_labels = format_timestamps(blocks['start'], record_timezone)
+
+    period_starts = np.concatenate(([start_timestamp], change_times))
+    period_labels = [start_time] + change_labels
+    period_ends = np.append(change_times, end_timestamp)
+    durations = (period_ends - period_starts) / 60
+
+    states = ["charging" if state == 1 else "discharging" for state in blocks['state']]
+    last_state = blocks['state'][-1] if len(blocks['state']) else -1
+    states.append("charging" if last_state == 2 else "discharging")
+
+    return [
+        {"start_time": period_start, "end_time": period_end, "battery_state": state, "duration": float(duration)}
+        for period_start, period_end, state, duration in zip(period_labels, change_labels + [end_time], states,
+                                                              durations)
+    ]
+
+
+def detect_battery_phases(timestamps, levels, min_duration=MIN_PHASE_DURATION):
+    """
+    Segment battery level readings into charging and discharging phases.
+
+    Every step between consecutive readings is rising or falling; steps without change continue the phase before
+    them. Runs of steps with the same direction form phases, and phases shorter than min_duration are merged as in
+    merge_short_phases, so noisy readings follow the trend of the level.
+
+    Parameters:
+    - timestamps (list): Sorted epoch seconds of the readings.
+    - levels (list): Battery percentage of each reading.
+    - min_duration (float): Shortest phase in seconds.
+
+    Returns:
+    - dict: 'phase' ('charging' or 'discharging'), 'start', 'end' (epoch seconds), 'start_level', 'end_level',
+      'duration' (seconds) and 'rate' (percentage per hour, negative while discharging) arrays with one value per
+      phase.
+    """
+    timestamps = np.asarray(timestamps, dtype=float)
+    levels = np.asarray(levels, dtype=float)
+    valid = ~np.isnan(levels)
+    timestamps, levels = timestamps[valid], levels[valid]
+    if len(levels) < 2:
+        empty = np.zeros(0)
+        return {'phase': np.zeros(0, dtype=object), 'start': empty, 'end': empty, 'start_level': empty,
+                'end_level': empty, 'duration': empty, 'rate': empty}
+
+    directions = pd.Series(np.sign(np.diff(levels))).replace(0, np.nan).ffill().bfill().fillna(-1).to_numpy()
+    blocks = run_length_blocks(timestamps[:-1], directions, end=timestamps[-1])
+    first_index, directions = blocks['first_index'], blocks['state'].astype(float)
+    if min_duration > 0:
+        first_index, directions = merge_short_phases(timestamps, levels, first_index, directions, min_duration)
+
+    last_index = np.append(first_index[1:], len(levels) - 1)
+    starts, ends = timestamps[first_index], timestamps[last_index]
+    start_levels, end_levels = levels[first_index], levels[last_index]
+    durations = ends - starts
+    rates = np.divide((end_levels - start_levels) * 3600, durations, out=np.zeros(len(start_levels)),
+                      where=durations > 0)
+    return {'phase': np.where(directions > 0, 'charging', 'discharging').astype(object),
+            'start': starts, 'end': ends, 'start_level': start_levels, 'end_level': end_levels,
+            'duration': durations, 'rate': rates}
+
+
+def merge_short_phases(timestamps, levels, first_index, directions, min_duration):
+    """
+    Merge phases shorter than min_duration, shortest first, into their shorter neighbour until every phase lasts at
+    least min_duration. A merged phase takes the direction of its net level change and is joined with neighbours of
+    the same direction, so a stretch of short alternating phases becomes the phase its levels trend to.
+
+    Parameters:
+    - timestamps (np.ndarray): Sorted epoch seconds of the readings.
+    - levels (np.ndarray): Battery percentage of each reading.
+    - first_index (np.ndarray): Index of the first reading of each phase.
+    - directions (np.ndarray): 1 for charging and -1 for discharging phases.
+    - min_duration (float): Shortest phase in seconds.
+
+    Returns:
+    - tuple: (first_index, directions) arrays of the merged phases.
+    """
+    first_index, directions = list(first_index), list(directions)
+    last = len(levels) - 1
+    while len(first_index) > 1:
+        bounds = np.append(first_index, last)
+        durations = timestamps[bounds[1:]] - timestamps[bounds[:-1]]
+        shortest = int(np.argmin(durations))
+        if durations[shortest] >= min_duration:
+            break
+        # Merge with the shorter neighbour, the phase before it on ties
+        if shortest == 0 or (shortest < len(durations) - 1 and durations[shortest + 1] < durations[shortest - 1]):
+            merged = shortest
+        else:
+            merged = shortest - 1
+        del first_index[merged + 1], directions[merged + 1]
+
+        end = first_index[merged + 1] if merged + 1 < len(first_index) else last
+        change = np.sign(levels[end] - levels[first_index[merged]])
+        if change != 0:
+            directions[merged] = change
+        if merged + 1 < len(first_index) and directions[merged + 1] == directions[merged]:
+            del first_index[merged + 1], directions[merged + 1]
+        if merged > 0 and directions[merged - 1] == directions[merged]:
+            del first_index[merged], directions[merged]
+    return np.array(first_index, dtype=int), np.array(directions, dtype=float)
+
+
+def get_battery_drain_stats(uid, start_time, end_time):
+    records = [r for r in fetch_battery_records(uid, start_time, end_time) if 'battery_left' in r]
+    phases = detect_battery_phases([r['timestamp'] for r in records], [r['battery_left'] for r in records])
+
+    discharging = phases['phase'] == 'discharging'
+    charging = phases['phase'] == 'charging'
+    drain_rates, drain_durations = -phases['rate'][discharging], phases['duration'][discharging]
+    charge_rates, charge_durations = phases['rate'][charging], phases['duration'][charging]
+
+    # Time-weighted average rates
+    mean_drain_rate = float(np.average(drain_rates, weights=drain_durations)) if drain_durations.sum() > 0 else np.nan
+    mean_charge_rate = float(np.average(charge_rates, weights=charge_durations)) \
+        if charge_durations.sum() > 0 else np.nan
+    return {
+        'mean_drain_rate': mean_drain_rate,
+        'median_drain_rate': float(np.median(drain_rates)) if len(drain_rates) else np.nan,
+        'max_drain_rate': float(np.max(drain_rates)) if len(drain_rates) else np.nan,
+        'mean_charge_rate': mean_charge_rate,
+        'discharging_hours': float(drain_durations.sum() / 3600),
+        'charging_hours': float(charge_durations.sum() / 3600),
+        'num_discharging_phases': int(discharging.sum()),
+        'num_charging_phases': int(charging.sum()),
+        'estimated_hours_full_to_empty': 100 / mean_drain_rate if mean_drain_rate > 0 else np.nan,
+    }
+
+
+def plot_battery(battery_records, charging_events, output_format=None):
     # Parse battery records to get battery levels and timestamps
     battery_left = []
     timestamps = []
     for entry in battery_records:
         if "battery_left" in entry:
             battery_left.append(entry['battery_left'])
-            timestamps.append(datetime.fromtimestamp(entry['timestamp']))
+            timestamps.append(entry['timestamp'])
+    timestamps, battery_left = downsample_series(timestamps, battery_left)
 
     # Create a plot
-    fig, ax = plt.subplots()
+    fig, ax = create_figure(output_format)
 
     # Plot the battery levels
-    ax.plot(timestamps, battery_left, marker='o', linestyle='-', color='blue', label='Battery Level')
-
-    # Highlight charging and discharging phases
-    for event in charging_events:
-        start_time = datetime.fromtimestamp(event[0])
-        end_time = datetime.fromtimestamp(event[1])
-        phase = event[2]
-
-        if phase == 'charging':
-            ax.axvspan(start_time, end_time, color='green', alpha=0.3,
-                       label='Charging Phase' if 'Charging Phase' not in [text.get_text() for text in ax.texts] else "")
-        elif phase == 'discharging':
-            ax.axvspan(start_time, end_time, color='red', alpha=0.3,
-                       label='Discharging Phase' if 'Discharging Phase' not in [text.get_text() for text in
-                                                                                ax.texts] else "")
+    ax.plot(to_datetimes(timestamps), battery_left, marker='o' if len(timestamps) <= 200 else None, linestyle='-',
+            color='blue', label='Battery Level')
+
+    # Charging events are (start, end, phase) tuples or dictionaries as returned by get_discharging_charging_events
+    phases = normalize_blocks([(event['battery_state'], event['start_time'], event['end_time'])
+                               if isinstance(event, dict) else (event[2], event[0], event[1])
+                               for event in charging_events])
+
+    # Highlight charging and discharging phases with one collection per phase spanning the full height
+    for phase, color, label in (('charging', 'green', 'Charging Phase'), ('discharging', 'red', 'Discharging Phase')):
+        spans = np.array([(start, end) for state, start, end in phases if state == phase]).reshape(-1, 2)
+        if len(spans):
+            starts = mdates.date2num(to_datetimes(spans[:, 0]))
+            ends = mdates.date2num(to_datetimes(spans[:, 1]))
+            ax.broken_barh(list(zip(starts, ends - starts)), (0, 1), transform=ax.get_xaxis_transform(),
+                           facecolors=color, alpha=0.3, label=label)
     # Set plot labels and legend
     ax.set_xlabel('Time')
     ax.set_ylabel('Battery Level (%)')
@@ -142,8 +291,8 @@ def plot_battery(battery_records, charging_events):
     # Format x-axis to show readable date and time
     fig.autofmt_xdate()
 
-    # Show plot
-    plt.show()
+    # Show or render plot
+    return finish_figure(fig, output_format)
 
 
 
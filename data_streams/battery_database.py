@@ -18,7 +18,8 @@ from data_streams.battery_data import functions
 from data_streams.battery_data import (
     get_battery_records,
     get_battery_records_all,
-    get_discharging_charging_events
+    get_discharging_charging_events,
+    get_battery_drain_stats
 )
 
 # Database metadata for registry
@@ -33,7 +34,8 @@ database_info = {
 function_refs = {
     "get_battery_records": get_battery_records,
     "get_battery_records_all": get_battery_records_all,
-    "get_discharging_charging_events": get_discharging_charging_events
+    "get_discharging_charging_events": get_discharging_charging_events,
+    "get_battery_drain_stats": get_battery_drain_stats
 }
 
 # Optional: Custom registration function
@@ -7,8 +7,9 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'd
 
 from datetime import datetime, timedelta
 from data_processing.data_processing_utils import fetch_documents_between_timestamps
+from data_processing.stream_index import fetch_document_asof
 from data_streams.constants import IOS_BRIGHTNESS, time_zone_dict
-import matplotlib.pyplot as plt
+from data_processing.plotting_utils import downsample_series, to_datetimes, create_figure, finish_figure
 from agents.coding_agent import run_coding_agent
 import pytz
 
@@ -59,18 +60,17 @@ def get_brightness_records(uid, start_time, end_time):
     return process_records(uid, brightness_records)
 
 def get_brightness_at_time(uid, given_time):
+    user_timezone = time_zone_dict.get(uid, "est")
+    timezone = pytz.timezone("America/New_York") if user_timezone == "est" else pytz.timezone(user_timezone)
+    given_timestamp = timezone.localize(datetime.strptime(given_time, "%Y-%m-%d %H:%M:%S")).timestamp()
 
-    given_time_ = datetime.strptime(given_time, "%Y-%m-%d %H:%M:%S")
-
-    # Define the start and end time with a 5-minute range
-    start_time = given_time_ - timedelta(minutes=10)
-    end_time = given_time_ + timedelta(minutes=10)
-
-    brightness_records = get_brightness_records(uid, start_time, end_time)
-
-    closest_record = min(brightness_records, key=lambda record: abs(
-        datetime.strptime(record['timestamp'], "%Y-%m-%d %H:%M:%S") - given_time_))
+    # Find the closest record within 10 minutes of the given time
+    closest_record = fetch_document_asof(uid, given_timestamp, IOS_BRIGHTNESS, tolerance=10 * 60,
+                                         direction='nearest')
+    if closest_record is None:
+        return {}
 
+    closest_record = process_records(uid, [closest_record])[0]
     return {'brightness': closest_record['brightness'], 'timestamp': closest_record['timestamp']}
 
 
@@ -89,19 +89,19 @@ def process_records(uid, brightness_records):
 
 
 
-def plot_brightness(brightness_records):
-    brightness = [entry['brightness'] for entry in brightness_records]
-    timestamps = [datetime.fromtimestamp(entry['timestamp']) for entry in brightness_records]
-    print(timestamps)
+def plot_brightness(brightness_records, output_format=None):
+    timestamps, brightness = downsample_series([entry['timestamp'] for entry in brightness_records],
+                                               [entry['brightness'] for entry in brightness_records])
 
     # Plot
-    plt.figure(figsize=(10, 5))
-    plt.step(timestamps, brightness, where='post', marker='o', linestyle='-', color='b')
-    plt.xlabel('Time')
-    plt.ylabel('Brightness')
-    plt.title('Brightness vs Time (Step Plot)')
-    plt.grid(True)
-    plt.show()
+    fig, ax = create_figure(output_format, figsize=(10, 5))
+    ax.step(to_datetimes(timestamps), brightness, where='post', marker='o' if len(timestamps) <= 200 else None,
+            linestyle='-', color='b')
+    ax.set_xlabel('Time')
+    ax.set_ylabel('Brightness')
+    ax.set_title('Brightness vs Time (Step Plot)')
+    ax.grid(True)
+    return finish_figure(fig, output_format)
 
 if __name__ == "__main__":
     start_datetime = datetime(2024, 7, 9, 12, 0, 0)
@@ -6,6 +6,9 @@ GARMIN_HR = 'garmin_hr'
 GARMIN_STRESS = 'garmin_stress'
 EMA_RESPONSE = "ema_response"
 APP_USAGE_LOGS = "app_usage_logs"
+APP_SESSIONS = "app_sessions"
+APP_SESSION_COVERAGE = "app_session_coverage"
+PLACES = "places"
 EMA_STATUS_EVENTS = "ema_status_events"
 
 IOS_BRIGHTNESS = 'ios_brightness'
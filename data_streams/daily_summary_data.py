@@ -0,0 +1,196 @@
+import sys
+import os
+import json
+import time
+import pytz
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data_processing')))
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import numpy as np
+
+from data_processing.data_processing_utils import find_documents, upsert_documents, ensure_indexes
+from data_processing.block_utils import run_length_blocks
+from data_streams.constants import DAILY_SUMMARY, time_zone_dict
+from data_streams.phone_steps_data import get_phone_steps_stats
+from data_streams.garmin_steps_data import get_total_garmin_steps
+from data_streams.garmin_hr_data import get_garmin_hr
+from data_streams.lock_unlock_data import get_total_lock_unlock_duration
+from data_streams.app_usage_data import get_total_app_usage
+from data_streams.call_log import get_call_log_stats
+from data_streams.location_data import get_location_statistical_metrics
+from data_streams.battery_data import fetch_battery_records
+from agents.config import DAILY_SUMMARY_WORKERS
+
+functions = {
+    "DAILY1": {
+        "name": "get_daily_summaries",
+        "description": "Retrieves precomputed daily summaries for a user, one per day, for multi-day questions. Each summary has the day's total steps, heart rate, screen time, app usage, calls, location variability, stress and battery charging.",
+        "function_call_instructions": "Prefer this function over the individual databases for questions spanning several days.",
+        "usecase": ["code_generation", "function_calling"],
+        "params": {
+            "uid": {"type": "str", "description": "The unique identifier for the user."},
+            "start_date": {"type": "str", "description": "The first day, formatted as '%Y-%m-%d'."},
+            "end_date": {"type": "str", "description": "The last day (inclusive), formatted as '%Y-%m-%d'."}
+        },
+        "returns": "A list of dictionaries, one per summarized day, containing: 'date', 'phone_steps', 'garmin_steps', 'hr_mean', 'hr_std', 'screen_on_minutes' (minutes unlocked), 'app_minutes' (dict of minutes per app), 'app_minutes_total', 'calls_total', 'calls_incoming', 'calls_outgoing', 'call_minutes', 'location_entropy', 'radius_of_gyration' (meters), 'num_loc_visited', 'stress_mean', 'stress_std', 'battery_charging_sessions' and 'battery_min_level'. Missing values are NaN.",
+        "example": "[{'date': '2024-07-10', 'phone_steps': 5321.0, 'garmin_steps': 6012.0, 'hr_mean': 78.4, 'hr_std': 9.1, 'screen_on_minutes': 212.5, 'app_minutes': {'Instagram': 48.2, 'Whatsapp': 12.0}, 'app_minutes_total': 60.2, 'calls_total': 2, 'calls_incoming': 1, 'calls_outgoing': 1, 'call_minutes': 4.5, 'location_entropy': 0.82, 'radius_of_gyration': 1530.2, 'num_loc_visited': 3, 'stress_mean': 0.41, 'stress_std': 0.12, 'battery_charging_sessions': 1, 'battery_min_level': 20.0}]"
+    },
+}
+
+# Fields identifying a daily summary
+DAILY_SUMMARY_KEY = ['uid', 'date']
+
+
+def get_day_bounds(uid, date):
+    """Return the local '%Y-%m-%d %H:%M:%S' start and end of a '%Y-%m-%d' day and the epoch seconds of its end."""
+    day_start = datetime.strptime(date, '%Y-%m-%d')
+    day_end = day_start + timedelta(days=1)
+    user_timezone = time_zone_dict.get(uid, "est")
+    timezone = pytz.timezone("America/New_York") if user_timezone == "est" else pytz.timezone(user_timezone)
+    return (day_start.strftime('%Y-%m-%d %H:%M:%S'), day_end.strftime('%Y-%m-%d %H:%M:%S'),
+            timezone.localize(day_end).timestamp())
+
+
+def get_heart_rate_features(uid, start_time, end_time):
+    heart_rates = [r['heart_rate'] for r in get_garmin_hr(uid, start_time, end_time)]
+    if not heart_rates:
+        return {'hr_mean': np.nan, 'hr_std': np.nan}
+    return {'hr_mean': float(np.mean(heart_rates)), 'hr_std': float(np.std(heart_rates))}
+
+
+def get_app_features(uid, start_time, end_time):
+    app_minutes = {app: usage['total_duration'] / 60
+                   for app, usage in get_total_app_usage(uid, start_time, end_time).items()}
+    return {'app_minutes': json.dumps(app_minutes), 'app_minutes_total': float(sum(app_minutes.values()))}
+
+
+def get_call_features(uid, start_time, end_time):
+    stats = get_call_log_stats(uid, start_time, end_time)
+    return {'calls_total': stats['total_calls'], 'calls_incoming': stats['total_calls_incoming'],
+            'calls_outgoing': stats['total_calls_outgoing'], 'call_minutes': stats['total_time'] / 60}
+
+
+def get_location_features(uid, start_time, end_time):
+    metrics = get_location_statistical_metrics(uid, start_time, end_time)
+    return {'location_entropy': metrics['location_entropy'], 'radius_of_gyration': metrics['radius_of_gyration'],
+            'num_loc_visited': metrics['num_loc_visited']}
+
+
+def get_stress_features(uid, start_time, end_time):
+    try:
+        from models.stress_prediction_model import get_stress_predictions
+    except ImportError as e:
+        print(f"Warning: stress predictions are not available: {e}")
+        return {'stress_mean': np.nan, 'stress_std': np.nan}
+
+    stress_levels = [r['stress_probability'] for r in get_stress_predictions(uid, start_time, end_time)]
+    if not stress_levels:
+        return {'stress_mean': np.nan, 'stress_std': np.nan}
+    return {'stress_mean': float(np.mean(stress_levels)), 'stress_std': float(np.std(stress_levels))}
+
+
+def get_battery_features(uid, start_time, end_time):
+    records = fetch_battery_records(uid, start_time, end_time)
+    levels = [r['battery_left'] for r in records if 'battery_left' in r and not np.isnan(r['battery_left'])]
+    states = [r for r in records if 'battery_state' in r and not np.isnan(r['battery_state'])]
+
+    # A charging session is a run of records reporting the charging state (2)
+    blocks = run_length_blocks([r['timestamp'] for r in states], [r['battery_state'] for r in states])
+    return {'battery_charging_sessions': int(np.sum(blocks['state'] == 2)),
+            'battery_min_level': float(min(levels)) if levels else np.nan}
+
+
+def compute_daily_summary(uid, date):
+    """
+    Compute the summary row of one user for one day.
+
+    Parameters:
+    - uid (str): The user identifier.
+    - date (str): The day, formatted as '%Y-%m-%d'.
+
+    Returns:
+    - dict: The daily summary document.
+    """
+    start_time, end_time, _ = get_day_bounds(uid, date)
+
+    summary = {'uid': uid, 'date': date, 'computed_at': time.time()}
+    summary['phone_steps'] = float(get_phone_steps_stats(uid, start_time, end_time)['total_steps'])
+    summary['garmin_steps'] = float(get_total_garmin_steps(uid, start_time, end_time)['total_steps'])
+    summary.update(get_heart_rate_features(uid, start_time, end_time))
+    summary['screen_on_minutes'] = get_total_lock_unlock_duration(uid, start_time, end_time).get('unlocked', 0) * 60
+    summary.update(get_app_features(uid, start_time, end_time))
+    summary.update(get_call_features(uid, start_time, end_time))
+    summary.update(get_location_features(uid, start_time, end_time))
+    summary.update(get_stress_features(uid, start_time, end_time))
+    summary.update(get_battery_features(uid, start_time, end_time))
+    return summary
+
+
+def get_days_to_update(uid, dates):
+    """
+    Find the days of a user that have no summary yet, or whose summary was computed before the day ended.
+
+    Parameters:
+    - uid (str): The user identifier.
+    - dates (list): Days formatted as '%Y-%m-%d'.
+
+    Returns:
+    - list: The days to (re)compute.
+    """
+    existing = find_documents(DAILY_SUMMARY, {'uid': uid, 'date': {'$in': dates}})
+    complete = {d['date'] for d in existing if d['computed_at'] >= get_day_bounds(uid, d['date'])[2]}
+    return [date for date in dates if date not in complete]
+
+
+def update_daily_summaries(uids, start_date, end_date, recompute=False, max_workers=DAILY_SUMMARY_WORKERS):
+    """
+    Materialize the daily summaries of several users, computing days in parallel across a process pool.
+
+    Only days without a complete summary are computed unless recompute is set.
+
+    Parameters:
+    - uids (list): The user identifiers.
+    - start_date (str): The first day, formatted as '%Y-%m-%d'.
+    - end_date (str): The last day (inclusive), formatted as '%Y-%m-%d'.
+    - recompute (bool): Recompute days that already have a complete summary.
+    - max_workers (int): Number of worker processes.
+
+    Returns:
+    - int: Number of daily summaries written.
+    """
+    ensure_indexes(DAILY_SUMMARY, [DAILY_SUMMARY_KEY])
+
+    first_day = datetime.strptime(start_date, '%Y-%m-%d')
+    num_days = (datetime.strptime(end_date, '%Y-%m-%d') - first_day).days + 1
+    dates = [(first_day + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(num_days)]
+
+    tasks = []
+    for uid in uids:
+        tasks += [(uid, date) for date in (dates if recompute else get_days_to_update(uid, dates))]
+    if not tasks:
+        return 0
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        summaries = list(executor.map(compute_daily_summary, *zip(*tasks)))
+
+    upsert_documents(DAILY_SUMMARY, summaries, DAILY_SUMMARY_KEY)
+    return len(summaries)
+
+
+def get_daily_summaries(uid, start_date, end_date):
+    summaries = find_documents(DAILY_SUMMARY, {'uid': uid, 'date': {'$gte': start_date, '$lte': end_date}},
+                               sort_field='date')
+    for summary in summaries:
+        summary.pop('_id', None)
+        summary.pop('computed_at', None)
+        if isinstance(summary.get('app_minutes'), str):
+            summary['app_minutes'] = json.loads(summary['app_minutes'])
+    return summaries
+
+
+if __name__ == "__main__":
+    print(update_daily_summaries(["test004"], "2025-08-27", "2025-08-29"))
+    print(get_daily_summaries("test004", "2025-08-27", "2025-08-29"))
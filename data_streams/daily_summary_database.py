@@ -0,0 +1,47 @@
+"""
+Daily Summary Database - Precomputed per-user daily features
+Uses the database registry system
+"""
+
+import sys
+import os
+from typing import Dict, Any, Callable
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data_processing')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../agents')))
+
+# Import function metadata from daily_summary_data.py
+from data_streams.daily_summary_data import functions
+
+# Import all the actual function implementations from daily_summary_data.py
+from data_streams.daily_summary_data import (
+    get_daily_summaries
+)
+
+# Database metadata for registry
+database_info = {
+    "name": "daily summary database",
+    "info": "Contains precomputed daily summaries per user: total phone and Garmin steps, heart rate mean and standard deviation, screen-on time, app usage minutes per app, call counts, location entropy and radius of gyration, stress summary and battery charging sessions.",
+    "device": "Phone and Garmin Smartwatch",
+    "additional_instructions": "Use the daily summary database for questions spanning several days, e.g. trends or comparisons between days. Use the individual databases for questions about times within a day."
+}
+
+# Create function references mapping (function name -> actual function)
+function_refs = {
+    "get_daily_summaries": get_daily_summaries
+}
+
+# Optional: Custom registration function
+def register_database(registry):
+    """Register this database with the registry"""
+    from agents.database_registry import DatabaseRegistry
+    registry.register_database(
+        name=database_info["name"],
+        info=database_info["info"],
+        device=database_info["device"],
+        additional_instructions=database_info["additional_instructions"],
+        functions=functions,  # Function metadata/definitions for LLMs
+        function_refs=function_refs,  # Actual function references
+        module_path="data_streams.daily_summary_database"
+    )
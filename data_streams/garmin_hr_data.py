@@ -1,13 +1,14 @@
 import sys
 import os
 from datetime import datetime
-import matplotlib.pyplot as plt
 import pytz
 import agents.heartrate_summarizer
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data_processing')))
 
 from data_processing.data_processing_utils import fetch_documents_between_timestamps
+from data_processing.resampling_utils import resample
+from data_processing.plotting_utils import downsample_series, to_datetimes, create_figure, finish_figure
 from data_streams.constants import GARMIN_HR, time_zone_dict
 import numpy as np
 from datetime import datetime, timedelta
@@ -146,64 +147,18 @@ def heart_rate_aggregation(uid, start_time, end_time, granularity=1):
     if (hr_records == []):
         return [], -1, -1
 
-    # Convert granularity from minutes to seconds
-    granularity_seconds = granularity * 60
-
     # Sort records by timestamp
     hr_records.sort(key=lambda x: x['timestamp'])
 
-    # List to store aggregated results
-    aggregated_data = []
+    timestamps = [record['timestamp'] for record in hr_records]
+    heart_rates = [record['heart_rate'] for record in hr_records]
 
-    # Initialize variables
-    interval_start = None
-    interval_end = None
-    interval_hrs = []
+    # Each interval starts at its first record and spans granularity minutes
+    resampled = resample(timestamps, heart_rates, granularity * 60, aggregations=('mean',), anchored=True)
+
+    aggregated_data = [{'time': timestamps[index], 'heart_rate': round(average_hr, 2)}
+                       for index, average_hr in zip(resampled['first_index'], resampled['mean'])]
 
-    for record in hr_records:
-        timestamp_ = record['timestamp']
-        heart_rate = record['heart_rate']
-
-        dt_object = datetime.strptime(timestamp_, '%Y-%m-%d %H:%M:%S')
-        timestamp = dt_object.timestamp()
-        formatted_time = dt_object.strftime('%Y-%m-%d %H:%M:%S')
-
-        if interval_start is None:
-            interval_start = timestamp
-
-        if (timestamp - interval_start) < granularity_seconds:
-            # Accumulate heart rate within the interval
-            interval_hrs.append(heart_rate)
-            interval_end = timestamp
-        else:
-            # Calculate aggregation metrics
-            average_hr = round(np.mean(interval_hrs), 2)
-            std_dev_hr = round(np.std(interval_hrs), 2)
-            dt_object = datetime.fromtimestamp(interval_start)
-            formatted_time = dt_object.strftime('%Y-%m-%d %H:%M:%S')
-            # Store the aggregated data
-            aggregated_data.append({
-                'time': formatted_time,
-                'heart_rate': average_hr,
-            })
-
-            # Reset for the next interval
-            interval_start = timestamp
-            interval_end = timestamp
-            interval_hrs = [heart_rate]
-
-    # Handle the last interval
-    if interval_hrs:
-        average_hr = round(np.mean(interval_hrs), 2)
-        std_dev_hr = round(np.std(interval_hrs), 2)
-        dt_object = datetime.fromtimestamp(interval_start)
-        formatted_time = dt_object.strftime('%Y-%m-%d %H:%M:%S')
-        aggregated_data.append({
-            'time': formatted_time,
-            'heart_rate': average_hr,
-        })
-
-    # print(aggregated_data)
     hr_rec = [a['heart_rate'] for a in aggregated_data]
     mean_hr = round(np.mean(hr_rec), 2)
     std_dev_hr = round(np.std(hr_rec), 2)
@@ -217,22 +172,23 @@ def get_hr_stats(uid, start_time, end_time):
     return np.mean(heart_rates), np.std(heart_rates)
 
 
-def plot_ibi(ibi_records):
+def plot_ibi(ibi_records, output_format=None):
     timestamps = []
     ibi_values = []
     for entry in ibi_records:
         if entry['heart_rate'] != -99:
-            timestamps.append(datetime.fromtimestamp(entry['timestamp']))
+            timestamps.append(entry['timestamp'])
             ibi_values.append(entry['heart_rate'])
+    timestamps, ibi_values = downsample_series(timestamps, ibi_values)
 
     # Plotting
-    plt.figure(figsize=(10, 5))
-    plt.plot(timestamps, ibi_values)
-    plt.xlabel('Timestamp')
-    plt.ylabel('heart_rate')
-    plt.title('heart_rate vs Time')
-    plt.grid(True)
-    plt.show()
+    fig, ax = create_figure(output_format, figsize=(10, 5))
+    ax.plot(to_datetimes(timestamps), ibi_values)
+    ax.set_xlabel('Timestamp')
+    ax.set_ylabel('heart_rate')
+    ax.set_title('heart_rate vs Time')
+    ax.grid(True)
+    return finish_figure(fig, output_format)
 
 
 if __name__ == "__main__":
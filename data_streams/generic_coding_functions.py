@@ -6,12 +6,19 @@ import pytz
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data_processing')))
 
+import time
 from datetime import datetime, timedelta
 import agents.generic_summarizer
 from data_processing.data_processing_utils import fetch_documents_between_timestamps
 from data_streams.constants import GARMIN_STEPS, time_zone_dict
-from agents.coding_agent import run_coding_agent
-from agents.config import VERBOSE
+from agents.coding_agent import run_coding_agent, run_coding_agent_async
+from agents.code_executor_pool import get_code_executor_pool
+from agents.code_cache import get_code_cache
+from agents.config import VERBOSE, CODE_CACHE_ENABLED
+
+
+# Conclusion of the answers of cached programs, the final message of the original run describes its own values
+CACHED_PROGRAM_CONCLUSION = "Computed by rerunning the program generated for an earlier query of the same template."
 
 
 coding_functions = {
@@ -34,6 +41,8 @@ class GenericCodingFunctions:
     def __init__(self, functions, req_databases):
         self.functions = functions
         self.databases = req_databases
+        # Start warming the code workers while the database manager decides which functions to call
+        get_code_executor_pool()
         database_names = ', '.join(req_databases)
         self.coding_functions = {
             "CODING1": {
@@ -50,6 +59,40 @@ class GenericCodingFunctions:
         }
 
     def get_results_through_data_computation(self, user_query):
+        # Queries of a template answered before rerun the program generated then
+        if CODE_CACHE_ENABLED:
+            output = get_code_cache().run(user_query, self.databases)
+            if output is not None:
+                return self.format_answer(output, CACHED_PROGRAM_CONCLUSION)
+        include_statements, function_imports = self.code_generation_inputs()
+        start = time.perf_counter()
+        executions = []
+        results = run_coding_agent(user_query=user_query, database=self.databases, functions=self.functions,
+                                   include_statements=include_statements, function_imports=function_imports,
+                                   executions=executions)
+        if CODE_CACHE_ENABLED:
+            get_code_cache().store_result(user_query, self.databases, results, executions,
+                                          time.perf_counter() - start)
+        return self.format_results(results)
+
+    async def get_results_through_data_computation_async(self, user_query):
+        if CODE_CACHE_ENABLED:
+            output = await get_code_cache().run_async(user_query, self.databases)
+            if output is not None:
+                return self.format_answer(output, CACHED_PROGRAM_CONCLUSION)
+        include_statements, function_imports = self.code_generation_inputs()
+        start = time.perf_counter()
+        executions = []
+        results = await run_coding_agent_async(user_query=user_query, database=self.databases,
+                                               functions=self.functions, include_statements=include_statements,
+                                               function_imports=function_imports, executions=executions)
+        if CODE_CACHE_ENABLED:
+            get_code_cache().store_result(user_query, self.databases, results, executions,
+                                          time.perf_counter() - start)
+        return self.format_results(results)
+
+    def code_generation_inputs(self):
+        """Return the import statements and the function import instructions of the code generation prompt"""
         if VERBOSE:
             print(f"\n{'🔹' * 20} CODE GENERATION {'🔹' * 20}")
 
@@ -131,11 +174,25 @@ class GenericCodingFunctions:
                 function_imports += (
                         "\nUse following import for brightness functions (BRIGHTNESS)" + "\n" + "from from data_streams.brightness_data import function_name")
 
-        results = run_coding_agent(user_query=user_query, database=self.databases, functions=self.functions,
-                                   include_statements=include_statements, function_imports=function_imports)
+            elif database == "timeline database":
+                function_imports += (
+                        "\nUse following import for timeline functions (TIMELINE)" + "\n" + "from data_streams.timeline_data import function_name")
+
+            elif database == "daily summary database":
+                function_imports += (
+                        "\nUse following import for daily summary functions (DAILY)" + "\n" + "from data_streams.daily_summary_data import function_name")
+
+        return include_statements, function_imports
+
+    def format_results(self, results):
         if (not results.messages):
             return "The code generation couldn't answer this query. Please try again later."
         else:
-            return results.messages[-2].content + "\n" + results.messages[-1].content.replace("TERMINATE", "")
+            return self.format_answer(results.messages[-2].content,
+                                      results.messages[-1].content.replace("TERMINATE", ""))
+
+    def format_answer(self, output, conclusion):
+        """Join the output of the executed program and the conclusion drawn from it, for new and cached programs"""
+        return output + "\n" + conclusion
 
 
@@ -20,11 +20,18 @@ from geopy import distance
 from shapely.geometry import MultiPoint
 from sklearn.cluster import DBSCAN
 from data_processing.data_processing_utils import fetch_documents_between_timestamps
-from data_streams.constants import IOS_LOCATION, home_locations, GOOGLE_API_KEY
+from data_processing.stream_index import fetch_document_asof
+from data_processing.geocode_cache import get_geocoder
+from data_processing.place_index import get_places, get_home_location, get_place_index
+from data_processing.spatial_index import SpatialIndex
+from data_processing.geo_utils import HAVERSINE_TOLERANCE, within_geodesic_distance, step_distances
+from data_processing.block_utils import format_timestamps, whole_second_durations
+from data_processing.trajectory_utils import simplify_trajectory, thin_points
+from data_streams.constants import IOS_LOCATION
 import folium
-from geopy.geocoders import Nominatim
-from geopy.geocoders import GoogleV3
+from folium.plugins import MarkerCluster
 from agents.coding_agent import run_coding_agent
+from agents.config import MAP_POINT_BUDGET, MAP_SIMPLIFY_TOLERANCE_METERS
 from data_streams.constants import time_zone_dict
 
 functions = {
@@ -88,8 +95,8 @@ functions = {
             "end_time": {"type": "str",
                          "description": "The end of the time range for which location data is to be analyzed."}
         },
-        "returns": "GPS location of starting and end point of paths taken",
-        "example": "[{'starting_point': {'timestamp': 1720541549, 'latitude': 42.329721, 'longitude': -71.091918, 'altitude': 15.27495}, 'end_point': {'timestamp': 1720541549, 'latitude': 42.329721, 'longitude': -71.091918, 'altitude': 15.27495}}, {'starting_point': {'timestamp': 1720565225, 'latitude': 42.331035, 'longitude': -71.09332, 'altitude': 13.192509}, 'end_point': {'timestamp': 1720566122, 'latitude': 42.340017, 'longitude': -71.09058, 'altitude': 6.118234}}]"
+        "returns": "GPS location of starting and end point of paths taken, with the 'duration' (seconds), 'distance' (meters) and average 'speed' (meters per second) of each path",
+        "example": "[{'starting_point': {'timestamp': '2024-07-09 18:47:05', 'latitude': 42.331035, 'longitude': -71.09332, 'altitude': 13.192509}, 'end_point': {'timestamp': '2024-07-09 19:02:02', 'latitude': 42.340017, 'longitude': -71.09058, 'altitude': 6.118234}, 'duration': 897, 'distance': 1430.5, 'speed': 1.59}]"
     },
     "LOC4": {
         "name": "get_address_from_coordinates",
@@ -102,6 +109,40 @@ functions = {
         },
         "returns": "The address of the location if found, otherwise an empty string."
     },
+    "LOC8": {
+        "name": "get_addresses_from_coordinates",
+        "usecase": ["code_generation", "function_calling"],
+        "description": "Retrieves the addresses of many locations given their latitudes and longitudes.",
+        "code_generation_instructions": "Use this instead of calling get_address_from_coordinates in a loop. Nearby and repeated coordinates are only geocoded once.",
+        "params": {
+            "coordinates": {"type": "list", "description": "A list of (latitude, longitude) pairs or of dictionaries with 'latitude' and 'longitude' keys."}
+        },
+        "returns": "A list with the address of each location, or an empty string where none is found.",
+        "example": "['360 Huntington Ave, Boston, MA 02115, USA', '360 Huntington Ave, Boston, MA 02115, USA']"
+    },
+    "LOC9": {
+        "name": "get_significant_places",
+        "usecase": ["code_generation", "function_calling"],
+        "description": "Retrieves the inferred home and most visited places of a user.",
+        "code_generation_instructions": "Use these places to tell whether a location is the user's home or one of their frequent places instead of clustering location records yourself.",
+        "params": {
+            "uid": {"type": "str", "description": "The unique identifier for the user."}
+        },
+        "returns": "A list of places ranked by time spent there, the home first. Each place has 'place_id', 'label' ('home' or 'place'), 'latitude', 'longitude', 'dwell_minutes' (total time spent), 'night_minutes' (time spent between 22:00 and 06:00) and 'visits'.",
+        "example": "[{'place_id': 0, 'label': 'home', 'latitude': 42.329721, 'longitude': -71.091918, 'dwell_minutes': 4210.5, 'night_minutes': 2880.0, 'visits': 9}, {'place_id': 1, 'label': 'place', 'latitude': 42.339850, 'longitude': -71.089400, 'dwell_minutes': 1520.0, 'night_minutes': 0.0, 'visits': 5}]"
+    },
+    "LOC10": {
+        "name": "label_location_records",
+        "usecase": ["code_generation"],
+        "description": "Labels location records with the user's home or significant place they are at.",
+        "code_generation_instructions": "Use this to find when the user was at home or at one of their frequent places instead of comparing distances of each record yourself.",
+        "params": {
+            "uid": {"type": "str", "description": "The unique identifier for the user."},
+            "location_records": {"type": "list", "description": "Location records with 'latitude' and 'longitude' keys, e.g. as returned by get_location_records."}
+        },
+        "returns": "The records with two added keys: 'place_id' (the place_id of get_significant_places) and 'place_label' ('home' or 'place'), both None when the record is not within 50 meters of a known place.",
+        "example": "[{'timestamp': '2024-07-09 12:12:29', 'latitude': 42.329721, 'longitude': -71.091918, 'altitude': 15.27495, 'place_id': 0, 'place_label': 'home'}]"
+    },
     "LOC5": {
         "name": "get_location_at_given_time",
         "description": "Retrieves the GPS location record closest to a given timestamp for a specific user.",
@@ -178,7 +219,7 @@ def get_distance_manual(lat1, lon1, lat2, lon2):
     return distance * 1000
 
 
-def get_location_records(uid, start_time, end_time, select_one_from_minute=False):
+def fetch_location_records(uid, start_time, end_time, select_one_from_minute=False):
     # Use New York time zone if the user's timezone is "est"
     user_timezone = time_zone_dict.get(uid, "est")
     timezone = pytz.timezone("America/New_York") if user_timezone == "est" else pytz.timezone(user_timezone)
@@ -205,35 +246,39 @@ def get_location_records(uid, start_time, end_time, select_one_from_minute=False
             else:
                 location_log.append(instance)
 
-    return process_records(uid, location_log)
+    return location_log
+
+
+def get_location_records(uid, start_time, end_time, select_one_from_minute=False):
+    return process_records(uid, fetch_location_records(uid, start_time, end_time, select_one_from_minute))
 
 
 def get_location_at_given_time(uid, given_time):
-    given_time_ = datetime.strptime(given_time, "%Y-%m-%d %H:%M:%S")
+    user_timezone = time_zone_dict.get(uid, "est")
+    timezone = pytz.timezone("America/New_York") if user_timezone == "est" else pytz.timezone(user_timezone)
+    given_timestamp = timezone.localize(datetime.strptime(given_time, "%Y-%m-%d %H:%M:%S")).timestamp()
 
-    # Define the start and end time with a 5-minute range
-    start_time = given_time_ - timedelta(minutes=10)
-    end_time = given_time_ + timedelta(minutes=10)
+    # Find the closest accurate record within 10 minutes of the given time
+    closest_record = fetch_document_asof(uid, given_timestamp, IOS_LOCATION, tolerance=10 * 60, direction='nearest',
+                                         query={'accuracy': {'$lt': 100}})
+    if closest_record is None:
+        return {}
 
-    # Fetch activity records for the user within the given time window
-    records = get_location_records(uid, start_time, end_time)
+    return {'latitude': closest_record['latitude'], 'longitude': closest_record['longitude'],
+            'altitude': closest_record['altitude'], 'timestamp': given_time}
 
-    # Find the closest record by comparing the time difference
-    if (records):
-        closest_record = min(records, key=lambda record: abs(
-            datetime.strptime(record['timestamp'], "%Y-%m-%d %H:%M:%S") - given_time_))
 
-        return {'latitude': closest_record['latitude'], 'longitude': closest_record['longitude'],
-                'altitude': closest_record['altitude'], 'timestamp': given_time}
-    else:
-        return {}
+def get_home_centroid(uid):
+    home = get_home_location(uid)
+    if home is None:
+        raise ValueError(f"No home location is known for user {uid}, run update_place_index to infer it")
+    return home
 
 
 def is_home(uid, location):
     # tmp_client = DbConfig().getTempClient()
     # tmp_db = tmp_client['pheno']
-    home = home_locations[uid]
-    auto_distance = get_distance(home['centroid'], [location['latitude'], location['longitude']])
+    auto_distance = get_distance(get_home_centroid(uid), [location['latitude'], location['longitude']])
     # manual_distance = get_distance_manual(home['centroid'][0], home['centroid'][1],
     #                                       phone['latitude'], phone['longitude'])
     if auto_distance < 50:
@@ -244,8 +289,35 @@ def is_home(uid, location):
 def get_home(uid):
     # tmp_client = DbConfig().getTempClient()
     # tmp_db = tmp_client['pheno']
-    home = home_locations[uid]
-    return home['centroid']
+    return get_home_centroid(uid)
+
+
+def get_significant_places(uid):
+    return [{key: place[key] for key in ('place_id', 'label', 'latitude', 'longitude', 'dwell_minutes',
+                                         'night_minutes', 'visits')}
+            for place in get_places(uid)]
+
+
+def label_location_records(uid, location_records):
+    """
+    Label every location record with the known place of the user it is at.
+
+    Parameters:
+    - uid (str): The user identifier.
+    - location_records (list): Records with 'latitude' and 'longitude' keys.
+
+    Returns:
+    - list: Copies of the records with 'place_id' and 'place_label' ('home' or 'place'), both None when the record is
+      not at a known place.
+    """
+    places = get_places(uid)
+    assignments = get_place_index(uid).assign([r['latitude'] for r in location_records],
+                                              [r['longitude'] for r in location_records])
+    labelled_records = []
+    for record, place in zip(location_records, assignments):
+        labelled_records.append(dict(record, place_id=places[place]['place_id'] if place >= 0 else None,
+                                     place_label=places[place]['label'] if place >= 0 else None))
+    return labelled_records
 
 
 # def get_total_run_time(u, start_time, end_time):
@@ -267,22 +339,42 @@ def get_total_run_time(uid, start_time, end_time):
     return min(lt - ft, end_time - start_time)
 
 
+def get_time_at_matches(times, matches, start_time, end_time):
+    """
+    Time spent at a location given the times of a trace and which records are at the location.
+
+    Gaps under 30 minutes between consecutive records at the location (and from start_time to the first of them)
+    count as time spent there, as does the time from the last of them to end_time if under 1000 seconds.
+
+    Parameters:
+    - times (np.ndarray): Epoch seconds of the trace records.
+    - matches (np.ndarray): Boolean mask of the records at the location.
+    - start_time (float): Epoch seconds of the start of the trace.
+    - end_time (float): Epoch seconds of the end of the trace.
+
+    Returns:
+    - float: Time spent at the location in seconds.
+    """
+    visit_times = np.concatenate(([start_time], np.asarray(times, dtype=float)[matches]))
+    gaps = np.diff(visit_times)
+    time_at_location = float(gaps[gaps < 60 * 30].sum())
+    end_time_delta = end_time - float(visit_times[-1])
+    if end_time_delta < 1000:
+        time_at_location += end_time_delta
+    return time_at_location
+
+
+def get_trace_times(loc_trace):
+    return np.array([datetime.strptime(location['timestamp'], "%Y-%m-%d %H:%M:%S").timestamp()
+                     for location in loc_trace], dtype=float)
+
+
 def get_time_spent_at_home(uid, start_time, end_time):
     loc_trace = get_location_records(uid, start_time, end_time, True)
-    # tmp_client = DbConfig().getTempClient()
-    # tmp_db = tmp_client['pheno']
-    home_time = 0
-    tmp_time = start_time
-    for location in loc_trace:
-        loc_time = datetime.strptime(location['timestamp'], "%Y-%m-%d %H:%M:%S").timestamp()
-        if is_home(uid, location):
-            time_diff = loc_time - tmp_time
-            if time_diff < 60 * 30:
-                home_time += time_diff
-            tmp_time = loc_time
-    end_time_delta = end_time - tmp_time
-    if end_time_delta < 1000:
-        home_time += end_time_delta
+    home = get_home_centroid(uid)
+    at_home = within_geodesic_distance([location['latitude'] for location in loc_trace],
+                                       [location['longitude'] for location in loc_trace], home[0], home[1], 50)
+    home_time = get_time_at_matches(get_trace_times(loc_trace), at_home, start_time, end_time)
     total_time = get_total_run_time(uid, start_time, end_time)
     if total_time == 0:
         return 0, 0, np.NaN
@@ -300,19 +392,30 @@ def is_query_location(query_location, location):
     pass
 
 
-def get_time_spent_at_location(uid, start_time, end_time, query_location, loc_trace):
-    time_at_location = 0
-    tmp_time = start_time
-    for location in loc_trace:
-        loc_time = datetime.strptime(location['timestamp'], "%Y-%m-%d %H:%M:%S").timestamp()
-        if is_query_location(query_location, location):
-            time_diff = loc_time - tmp_time
-            if time_diff < 60 * 30:
-                time_at_location += time_diff
-            tmp_time = loc_time
-    end_time_delta = end_time - tmp_time
-    if end_time_delta < 1000:
-        time_at_location += end_time_delta
+def get_time_spent_at_location(uid, start_time, end_time, query_location, loc_trace, spatial_index=None):
+    """
+    Time spent within 50 meters of a location.
+
+    Parameters:
+    - uid (str): The user identifier.
+    - start_time (float): Epoch seconds of the start of the trace.
+    - end_time (float): Epoch seconds of the end of the trace.
+    - query_location (list): [latitude, longitude] of the location.
+    - loc_trace (list): Location records as returned by get_location_records.
+    - spatial_index (SpatialIndex): Index of loc_trace, to reuse across several locations.
+
+    Returns:
+    - tuple: Time spent at the location (seconds), total run time and their ratio.
+    """
+    if spatial_index is None:
+        spatial_index = SpatialIndex([location['latitude'] for location in loc_trace],
+                                     [location['longitude'] for location in loc_trace], 50)
+    latitude, longitude = float(query_location[0]), float(query_location[1])
+    candidates = spatial_index.query_radius(latitude, longitude, 50 * (1 + HAVERSINE_TOLERANCE))
+    matches = np.zeros(len(loc_trace), dtype=bool)
+    matches[candidates] = within_geodesic_distance(spatial_index.latitudes[candidates],
+                                                   spatial_index.longitudes[candidates], latitude, longitude, 50)
+    time_at_location = get_time_at_matches(get_trace_times(loc_trace), matches, start_time, end_time)
     total_time = get_total_run_time(uid, start_time, end_time)
     if total_time == 0:
         return 0, 0, np.NaN
@@ -348,26 +451,35 @@ def calc_entropy(time_spent_at_centers_ratio):
     return 0 - float(entropy)
 
 
-def plot_map_points(coordinates, output_file, color='blue'):
+def plot_map_points(coordinates, output_file, color='blue', max_points=MAP_POINT_BUDGET):
     """
     Plots points on a map and saves it to an HTML file.
 
+    Points of the same grid cell are merged into one marker when there are more than max_points, and markers are
+    clustered so the map stays responsive for long time ranges.
+
     Parameters:
     - coordinates (list of tuples): List of tuples containing (latitude, longitude) pairs.
     - output_file (str): Name of the output HTML file.
     - color (str): Color of the markers (default is 'blue').
+    - max_points (int): Largest number of markers on the map.
     """
     # Initialize the map centered around the first coordinate pair
-    if coordinates:
+    if len(coordinates):
         center_lat, center_lon = coordinates[0]
     else:
         center_lat, center_lon = 0, 0
 
     mymap = folium.Map(location=[center_lat, center_lon], zoom_start=4)
 
-    # Add markers for each coordinate pair with specified color
-    for coord in coordinates:
-        folium.Marker(location=coord, icon=folium.Icon(color=color)).add_to(mymap)
+    # Add markers for the (merged) coordinates with specified color
+    marker_cluster = MarkerCluster().add_to(mymap)
+    if len(coordinates):
+        coordinates = np.asarray(coordinates, dtype=float)
+        latitudes, longitudes, counts = thin_points(coordinates[:, 0], coordinates[:, 1], max_points)
+        for latitude, longitude, count in zip(latitudes, longitudes, counts):
+            folium.Marker(location=(latitude, longitude), icon=folium.Icon(color=color),
+                          popup=f"{count} points" if count > 1 else None).add_to(marker_cluster)
 
     current_dir = os.path.dirname(__file__)
     output_path = os.path.join(current_dir, output_file)
@@ -406,6 +518,7 @@ def get_location_statistical_metrics(uid, start_time, end_time):
 
     # plot_map_points(coordinates=cord_list, output_file="assets/all_coords.html")
     cord_list = np.array(cord_list)
+    spatial_index = SpatialIndex(cord_list[:, 0], cord_list[:, 1], 50)
 
     kms_per_radian = 6371.0088
     epsilon = 0.03 / kms_per_radian
@@ -431,7 +544,8 @@ def get_location_statistical_metrics(uid, start_time, end_time):
                 max_displacement = disp_distance
             displacement_sum += disp_distance
         time_at_location, total_time, time_spent_ratio = get_time_spent_at_location(uid, start_time, end_time,
-                                                                                    centermost_points[i], loc_trace)
+                                                                                    centermost_points[i], loc_trace,
+                                                                                    spatial_index)
         time_spent_at_centers[i] = time_at_location
         time_spent_at_centers_ratio[i] = time_spent_ratio
         if total_time > total_time_all_centers:
@@ -520,13 +634,18 @@ def get_location_summary(uid, start_time, end_time, instructions):
     return summary
 
 
-def plot_paths_on_map(paths, save_path='assets/map.html'):
+def plot_paths_on_map(paths, save_path='assets/map.html', max_points=MAP_POINT_BUDGET):
     """
     Plots multiple paths on a Folium map and saves it to an HTML file.
 
+    Paths are simplified so that all of them together have at most max_points vertices. Every path keeps its two
+    endpoints, and the rest of the budget is shared in proportion to the other coordinates of the paths. When there
+    are more than max_points / 2 paths only their endpoints are drawn, which can exceed max_points.
+
     Parameters:
     - paths (list): List of paths, where each path is a list of coordinates.
     - save_path (str): File path to save the HTML map.
+    - max_points (int): Largest total number of path vertices on the map.
 
     Returns:
     - None
@@ -537,8 +656,18 @@ def plot_paths_on_map(paths, save_path='assets/map.html'):
 
     colors = ['blue', 'red', 'green', 'purple', 'orange', 'darkred', 'darkblue', 'darkgreen']
 
+    # Charge the endpoints of every path against the budget before sharing the rest
+    endpoints = [min(2, len(path)) for path in paths]
+    shared_points = max(0, max_points - sum(endpoints))
+    inner_points = sum(len(path) for path in paths) - sum(endpoints)
     for i, path in enumerate(paths):
-        points = [(coord['latitude'], coord['longitude']) for coord in path]
+        latitudes = np.array([coord['latitude'] for coord in path], dtype=float)
+        longitudes = np.array([coord['longitude'] for coord in path], dtype=float)
+        path_inner_points = len(path) - endpoints[i]
+        path_budget = endpoints[i] + (min(path_inner_points, shared_points * path_inner_points // inner_points)
+                                      if inner_points else 0)
+        kept = simplify_trajectory(latitudes, longitudes, path_budget, MAP_SIMPLIFY_TOLERANCE_METERS)
+        points = list(zip(latitudes[kept], longitudes[kept]))
         color = colors[i % len(colors)]  # Cycle through colors for paths
         folium.PolyLine(points, color=color, weight=2.5, opacity=1).add_to(map_instance)
 
@@ -550,78 +679,79 @@ def plot_paths_on_map(paths, save_path='assets/map.html'):
 
 
 def get_address(latitude, longitude):
-    geolocator = Nominatim(user_agent="phone_sensing")
-    location = geolocator.reverse((latitude, longitude))
-    return location.address
+    return get_geocoder('nominatim').reverse(latitude, longitude)
 
 
-#
+def get_location_paths(uid, start_time, end_time):
+    """
+    Split the per-minute location trace into the paths the user moved along.
 
-from datetime import datetime
+    A record is moving when it is more than 100 meters from the previous record. Consecutive moving records belong to
+    the same path unless they are 10 minutes or more apart, and paths with a single record are dropped.
 
+    Parameters:
+    - uid (str): The user identifier.
+    - start_time (str): The start of the time range, formatted as '%Y-%m-%d %H:%M:%S'.
+    - end_time (str): The end of the time range, formatted as '%Y-%m-%d %H:%M:%S'.
 
-def get_location_paths(uid, start_time, end_time):
-    coords = get_location_records(uid, start_time, end_time, True)
-    paths = []
-    current_path = []
-    last_moving_coord = coords[0]
-    places_visited = []
-    places_tracks = []
-
-    # Convert the timestamp to Unix time
-    for coord in coords:
-        coord['timestamp'] = int(datetime.strptime(coord['timestamp'], '%Y-%m-%d %H:%M:%S').timestamp())
-
-    for i in range(len(coords)):
-        if i == 0 or get_distance([coords[i]['latitude'], coords[i]['longitude']],
-                                  [coords[i - 1]['latitude'], coords[i - 1]['longitude']]) > 100:
-
-            # Check if there is a gap of 10 minutes or more between current and last moving coordinates
-            if (coords[i]['timestamp'] - last_moving_coord['timestamp'] >= 10 * 60):
-                paths.append(current_path)
-                places_visited.append(last_moving_coord)
-                current_path = []
-
-            current_path += [coords[i]]
-            last_moving_coord = coords[i]
-
-    # Add the last path if any
-    if current_path:
-        paths.append(current_path)
-
-    # for p in places_visited:
-    #     address = get_address(p['latitude'], p['longitude'])
-    #     print(f"{address} visited at {datetime.fromtimestamp(p['timestamp'])}\n")
+    Returns:
+    - list: One dictionary per path with its 'starting_point' and 'end_point' records, 'duration' (seconds),
+      'distance' (meters travelled along the trace) and 'speed' (meters per second).
+    """
+    records = fetch_location_records(uid, start_time, end_time, True)
+    if not records:
+        return []
+
+    timestamps = np.array([r['timestamp'] for r in records], dtype=float)
+    latitudes = np.array([r['latitude'] for r in records], dtype=float)
+    longitudes = np.array([r['longitude'] for r in records], dtype=float)
+    distances = step_distances(latitudes, longitudes, 100)
+
+    # Moving records and the paths they form
+    moving = np.flatnonzero(np.concatenate(([True], distances > 100)))
+    breaks = np.flatnonzero(np.diff(timestamps[moving]) >= 10 * 60) + 1
+    path_starts = moving[np.concatenate(([0], breaks))]
+    path_ends = moving[np.concatenate((breaks, [len(moving)])) - 1]
+    keep = path_ends > path_starts
+    path_starts, path_ends = path_starts[keep], path_ends[keep]
+
+    # Durations between the whole-second formatted times, and distances along the trace from cumulative sums
+    durations = whole_second_durations(timestamps[path_starts], timestamps[path_ends]).astype(int)
+    cumulative_distances = np.concatenate(([0.0], np.cumsum(distances)))
+    path_distances = cumulative_distances[path_ends] - cumulative_distances[path_starts]
+    speeds = np.divide(path_distances, durations, out=np.zeros(len(durations)), where=durations > 0)
+
+    uid_timezone = time_zone_dict.get(uid, 'est')
+    timezone = pytz.timezone("America/New_York") if uid_timezone == "est" else pytz.utc
+    start_times = format_timestamps(timestamps[path_starts], timezone)
+    end_times = format_timestamps(timestamps[path_ends], timezone)
 
-    user_timezone = time_zone_dict.get(uid, "est")
-    # timezone = pytz.timezone("America/New_York") if user_timezone == "est" else pytz.timezone(user_timezone)
+    def path_point(index, time):
+        return {'timestamp': time, 'latitude': records[index]['latitude'], 'longitude': records[index]['longitude'],
+                'altitude': records[index]['altitude']}
 
-    for path in paths:
-        if (len(path) > 1):
-            duration = path[-1]['timestamp'] - path[0]['timestamp']
-            path[0]['timestamp'] = datetime.fromtimestamp(path[0]['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
-            path[-1]['timestamp'] = datetime.fromtimestamp(path[-1]['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
+    return [{'starting_point': path_point(start, start_times[i]), 'end_point': path_point(end, end_times[i]),
+             'duration': int(durations[i]), 'distance': float(path_distances[i]), 'speed': float(speeds[i])}
+            for i, (start, end) in enumerate(zip(path_starts, path_ends))]
 
-            places_tracks.append({'starting_point': path[0], 'end_point': path[-1], 'duration': duration})
 
-    return places_tracks
+def get_address_from_coordinates(latitude, longitude):
+    # Latitude and longitude may be strings, the geocoder converts them to float
+    return get_geocoder('google').reverse(latitude, longitude)
 
 
-def get_address_from_coordinates(latitude, longitude):
-    def get_place_name(lat, lng, api_key):
-        geolocator = GoogleV3(api_key=api_key)
-        location = geolocator.reverse((lat, lng), exactly_one=True)
-        return location.address if location else ""
-
-    # Convert latitude and longitude to float if they are strings
-    if isinstance(latitude, str):
-        latitude = float(latitude)
-    if isinstance(longitude, str):
-        longitude = float(longitude)
-
-    api_key = GOOGLE_API_KEY
-    place_name = get_place_name(latitude, longitude, api_key)
-    return place_name
+def get_addresses_from_coordinates(coordinates):
+    """
+    Get the addresses of many coordinates with one geocoder call per distinct place.
+
+    Parameters:
+    - coordinates (list): (latitude, longitude) pairs or dictionaries with 'latitude' and 'longitude' keys.
+
+    Returns:
+    - list: One address per coordinate, an empty string when none is found.
+    """
+    coordinates = [(c['latitude'], c['longitude']) if isinstance(c, dict) else tuple(c) for c in coordinates]
+    return get_geocoder('google').reverse_many(coordinates)
 
 
 if __name__ == "__main__":
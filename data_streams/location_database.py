@@ -20,6 +20,9 @@ from data_streams.location_data import (
     get_location_statistical_metrics,
     get_location_paths,
     get_address_from_coordinates,
+    get_addresses_from_coordinates,
+    get_significant_places,
+    label_location_records,
     get_location_summary,
     get_location_at_given_time,
     get_total_run_time,
@@ -42,6 +45,9 @@ function_refs = {
     "get_location_statistical_metrics": get_location_statistical_metrics,
     "get_location_paths": get_location_paths,
     "get_address_from_coordinates": get_address_from_coordinates,
+    "get_addresses_from_coordinates": get_addresses_from_coordinates,
+    "get_significant_places": get_significant_places,
+    "label_location_records": label_location_records,
     "get_location_summary": get_location_summary,
     "get_location_at_given_time": get_location_at_given_time,
 }
@@ -7,6 +7,8 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'd
 
 from datetime import datetime, timedelta
 from data_processing.data_processing_utils import fetch_documents_between_timestamps
+from data_processing.stream_index import fetch_document_asof
+from data_processing.block_utils import run_length_blocks, format_timestamps
 
 from data_streams.constants import IOS_LOCK_UNLOCK, time_zone_dict
 
@@ -19,7 +21,7 @@ functions = {
         "description": "Returns periods of consistent lock state for a user within a specified time range.",
         "usecase": ["code_generation", "function_calling"],
         "params": {
-            "uid": {"type": "int", "description": "User identifier."},
+            "uid": {"type": "str", "description": "User identifier."},
             "start_time": {"type": "string", "description": "Start of the time range"},
             "end_time": {"type": "string", "description": "End of the time range."}
         },
@@ -31,7 +33,7 @@ functions = {
         "description": "Summarizes total time spent in each lock state for a user within a specified time range.",
         "usecase": ["code_generation", "function_calling"],
         "params": {
-            "uid": {"type": "int", "description": "User identifier."},
+            "uid": {"type": "str", "description": "User identifier."},
             "start_time": {"type": "string", "description": "Start of the time rang ."},
             "end_time": {"type": "string", "description": "End of the time range."}
         },
@@ -72,6 +74,10 @@ functions = {
 }
 
 def get_lock_unlock_records(uid, start_time, end_time):
+    return process_records(uid, fetch_lock_unlock_records(uid, start_time, end_time))
+
+
+def fetch_lock_unlock_records(uid, start_time, end_time):
     user_timezone = time_zone_dict.get(uid, "est")
     timezone = pytz.timezone("America/New_York") if user_timezone == "est" else pytz.timezone(user_timezone)
 
@@ -81,8 +87,7 @@ def get_lock_unlock_records(uid, start_time, end_time):
             end_time = timezone.localize(datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S")).astimezone(pytz.UTC)
         start_time = start_time.timestamp()
         end_time = end_time.timestamp()
-    lock_unlock_records = fetch_documents_between_timestamps(uid, start_time, end_time, IOS_LOCK_UNLOCK)
-    return process_records(uid, lock_unlock_records)
+    return fetch_documents_between_timestamps(uid, start_time, end_time, IOS_LOCK_UNLOCK)
 
 
 def process_records(uid, lock_unlock_records):
@@ -98,92 +103,65 @@ def process_records(uid, lock_unlock_records):
     return records
 
 
-from datetime import datetime
+def format_time_bound(uid, given_time):
+    """Format a time range bound given as a string, datetime or epoch seconds as a '%Y-%m-%d %H:%M:%S' string."""
+    if isinstance(given_time, str):
+        return given_time
+    if isinstance(given_time, datetime):
+        return given_time.strftime('%Y-%m-%d %H:%M:%S')
+    uid_timezone = time_zone_dict.get(uid, 'est')
+    timezone = pytz.timezone("America/New_York") if uid_timezone == "est" else pytz.utc
+    return format_timestamps([given_time], timezone)[0]
 
 
 def get_lock_unlock_blocks(uid, start_time, end_time):
-    lock_unlock_records = get_lock_unlock_records(uid, start_time, end_time)
+    lock_unlock_records = fetch_lock_unlock_records(uid, start_time, end_time)
 
     if not lock_unlock_records:
         return []
 
-    lock_unlock_blocks = []
-
-    # Parse the start_time and end_time from string if they are provided in string format
-    start_time_dt = datetime.strptime(start_time, '%Y-%m-%d %H:%M:%S')
-    end_time_dt = datetime.strptime(end_time, '%Y-%m-%d %H:%M:%S')
-
-    first_record_time = datetime.strptime(lock_unlock_records[0]['timestamp'], '%Y-%m-%d %H:%M:%S')
-
-    # Initialize the first block
-    lock_unlock_blocks.append({
-        "state": "locked" if lock_unlock_records[0]["lock_state"] == 1 else "unlocked",
-        "start_time": start_time,
-        "end_time": first_record_time.strftime('%Y-%m-%d %H:%M:%S')
-    })
-
-    start_state = lock_unlock_records[0]['lock_state']
-    start_time = first_record_time  # datetime object for tracking start of block
-
-    for i in range(1, len(lock_unlock_records)):
-        current_time = datetime.strptime(lock_unlock_records[i]['timestamp'], '%Y-%m-%d %H:%M:%S')
-
-        # Check if the state has changed from the previous state
-        if lock_unlock_records[i]['lock_state'] != lock_unlock_records[i - 1]['lock_state']:
-            start_state_string = "locked" if start_state == 1 else "unlocked"
-            formatted_start_time = start_time.strftime('%Y-%m-%d %H:%M:%S')
-            formatted_end_time = current_time.strftime('%Y-%m-%d %H:%M:%S')
-
-            lock_unlock_blocks.append({
-                "state": start_state_string,
-                "start_time": formatted_start_time,
-                "end_time": formatted_end_time
-            })
+    uid_timezone = time_zone_dict.get(uid, 'est')  # Get UID-specific timezone or default to EST
+    timezone = pytz.timezone("America/New_York") if uid_timezone == "est" else pytz.utc
 
-            # Update the start time and state
-            start_state = lock_unlock_records[i]['lock_state']
-            start_time = current_time
+    blocks = run_length_blocks([r['timestamp'] for r in lock_unlock_records],
+                               [r['lock_state'] for r in lock_unlock_records])
+    block_starts = format_timestamps(blocks['start'], timezone)
 
-    # Append the last block
-    lock_unlock_blocks.append({
-        "state": "locked" if start_state == 1 else "unlocked",
-        "start_time": start_time.strftime('%Y-%m-%d %H:%M:%S'),
-        "end_time": end_time
-    })
+    # The range start up to the first record takes the state of the first record, and the last block runs until
+    # the range end
+    states = ["locked" if state == 1 else "unlocked" for state in blocks['state']]
+    starts = [format_time_bound(uid, start_time)] + block_starts
+    ends = block_starts + [format_time_bound(uid, end_time)]
 
-    return lock_unlock_blocks
+    return [
+        {
+            "state": state,
+            "start_time": block_start,
+            "end_time": block_end
+        }
+        for state, block_start, block_end in zip(states[:1] + states, starts, ends)
+    ]
 
 
 def get_lock_unlock_state_at_given_time(uid, given_time):
-    given_time_ = datetime.strptime(given_time, "%Y-%m-%d %H:%M:%S")
-
-    # Define the start and end time with a 6-hour range
-    start_time = given_time_ - timedelta(hours=6)
-    end_time = given_time_ + timedelta(hours=6)
-
-    start_time_str = start_time.strftime("%Y-%m-%d %H:%M:%S")
-    end_time_str = end_time.strftime("%Y-%m-%d %H:%M:%S")
-
-    # Fetch lock/unlock blocks within the given time range
-    blocks = get_lock_unlock_blocks(uid, start_time_str, end_time_str)
-
-    # Iterate through the blocks and check if the given time falls within any block
-    for block in blocks:
-
-        block_start_time = datetime.strptime(block['start_time'], "%Y-%m-%d %H:%M:%S")
-        block_end_time = datetime.strptime(block['end_time'], "%Y-%m-%d %H:%M:%S")
-
-        # print(block_start_time)
-        # print(block_end_time)
-        # print(block['state'])
-        # print("=====")
-
-        if block_start_time <= given_time_ <= block_end_time:
-            return {
-                'state': block['state'],
-                'timestamp': given_time
-            }
-    return {}
+    user_timezone = time_zone_dict.get(uid, "est")
+    timezone = pytz.timezone("America/New_York") if user_timezone == "est" else pytz.timezone(user_timezone)
+    given_timestamp = timezone.localize(datetime.strptime(given_time, "%Y-%m-%d %H:%M:%S")).timestamp()
+
+    # The state at a given time is set by the last event before it within 6 hours, a state change exactly at the
+    # given time only applies after it. Without such an event fall back to the next event within 6 hours.
+    record = fetch_document_asof(uid, given_timestamp, IOS_LOCK_UNLOCK, tolerance=6 * 60 * 60,
+                                 allow_exact_matches=False)
+    if record is None:
+        record = fetch_document_asof(uid, given_timestamp, IOS_LOCK_UNLOCK, tolerance=6 * 60 * 60,
+                                     direction='forward')
+    if record is None:
+        return {}
+
+    return {
+        'state': "locked" if record['lock_state'] == 1 else "unlocked",
+        'timestamp': given_time
+    }
 
 
 def get_total_lock_unlock_duration(uid, start_time, end_time):
@@ -75,8 +75,7 @@ def get_phone_steps_records(uid, start_time, end_time):
 
 
 def process_records(uid, step_records):
-    unique_data = {record['start_timestamp']: record for record in step_records}
-    step_records = list(unique_data.values())
+    # Records are unique per start time from ingestion on (data_processing.ingestion)
     records = []
     uid_timezone = time_zone_dict.get(uid, 'est')  # Get UID-specific timezone or default to EST
     timezone = pytz.timezone("America/New_York") if uid_timezone == "est" else pytz.utc
@@ -0,0 +1,268 @@
+import sys
+import os
+import pytz
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data_processing')))
+
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+from data_processing.data_processing_utils import fetch_documents_between_timestamps
+from data_processing.stream_index import build_stream_index
+from data_processing.resampling_utils import resample_to_grid
+from data_processing.block_utils import format_timestamps
+from data_processing.place_index import get_home_location
+from data_processing.geo_utils import haversine_distance
+from data_streams.constants import IOS_LOCK_UNLOCK, IOS_ACTIVITY, IOS_WIFI, IOS_LOCATION, IOS_BATTERY, \
+    IOS_BRIGHTNESS, IOS_STEPS, GARMIN_HR, GARMIN_STEPS, time_zone_dict
+from data_streams.app_usage_data import get_app_sessions
+
+functions = {
+    "TIMELINE1": {
+        "name": "get_timeline",
+        "description": "Builds a single time-aligned table of a user's data streams: one row per time bucket of resolution_seconds and one column per feature. State streams give the state at the start of each bucket and numeric streams are aggregated within each bucket. Use it to combine data from several databases, e.g. stress while using an app at home.",
+        "code_generation_instructions": "Use this function whenever a question combines several data streams instead of joining the records of the individual databases yourself. Filter and aggregate the returned pandas DataFrame.",
+        "usecase": ["code_generation"],
+        "params": {
+            "uid": {"type": "str", "description": "The unique identifier for the user."},
+            "start_time": {"type": "str", "description": "The start timestamp for the time range."},
+            "end_time": {"type": "str", "description": "The end timestamp for the time range."},
+            "resolution_seconds": {"type": "int", "description": "Length of a time bucket in seconds (default 60)."},
+            "features": {"type": "list",
+                         "description": "Features to include, any of 'app', 'lock_state', 'activity', 'wifi', 'location', 'at_home', 'battery', 'heart_rate', 'stress', 'brightness', 'phone_steps', 'garmin_steps'. Defaults to all of them."}
+        },
+        "returns": "A pandas DataFrame with a 'timestamp' column (bucket start formatted as '%Y-%m-%d %H:%M:%S') and the columns of the requested features: 'app' (app with the most foreground time in the bucket), 'app_seconds' (foreground seconds of any app), 'lock_state' ('locked' or 'unlocked'), 'activity', 'wifi' (network name or 'not connected'), 'latitude', 'longitude', 'at_home' (bool), 'battery_left', 'heart_rate' (mean), 'stress' (mean stress probability), 'brightness' (mean), 'phone_steps' and 'garmin_steps' (sums). Missing values are None or NaN.",
+        "example": "   timestamp            app        app_seconds lock_state  activity        wifi               latitude   longitude   at_home  battery_left  heart_rate  stress  brightness  phone_steps  garmin_steps\n0  2024-07-10 09:00:00  Instagram  42.0        unlocked    ['stationary']  FeelTheConnection  42.329721  -71.091918  True     65.0          81.5        0.71    0.4         0.0          0.0"
+    },
+}
+
+FEATURES = ('app', 'lock_state', 'activity', 'wifi', 'location', 'at_home', 'battery', 'heart_rate', 'stress',
+            'brightness', 'phone_steps', 'garmin_steps')
+
+# Tolerances of the as-of joins of the state streams, in seconds
+LOCK_STATE_TOLERANCE = 6 * 60 * 60
+ACTIVITY_TOLERANCE = 5 * 60
+WIFI_TOLERANCE = 5 * 60 * 60
+LOCATION_TOLERANCE = 10 * 60
+BATTERY_TOLERANCE = 6 * 60 * 60
+HOME_RADIUS_METERS = 50
+
+
+def fetch_asof_records(uid, collection_name, grid, tolerance, direction='backward', keep=None,
+                       allow_exact_matches=True):
+    """
+    Look up the record of a state stream in effect at every time of the grid.
+
+    Parameters:
+    - uid (str): The user identifier.
+    - collection_name (str): The stream to read.
+    - grid (np.ndarray): Epoch seconds to look up.
+    - tolerance (float): Maximum distance in seconds between a time and its record.
+    - direction (str): 'backward', 'forward' or 'nearest'.
+    - keep (callable): Optional filter on the records.
+    - allow_exact_matches (bool): Whether a record exactly at a time is in effect at that time.
+
+    Returns:
+    - list: The record at every time, None where no record is within the tolerance.
+    """
+    lookahead = 0 if direction == 'backward' else tolerance
+    records = fetch_documents_between_timestamps(uid, grid[0] - tolerance, grid[-1] + lookahead + 1,
+                                                 collection_name)
+    if keep is not None:
+        records = [r for r in records if keep(r)]
+    return build_stream_index(records).asof_many(grid, tolerance, direction, allow_exact_matches)
+
+
+def fetch_asof_values(uid, collection_name, grid, field, tolerance, direction='backward', keep=None,
+                      allow_exact_matches=True):
+    """Look up the value of a field of a state stream at every time of the grid, None where there is none."""
+    records = fetch_asof_records(uid, collection_name, grid, tolerance, direction, keep, allow_exact_matches)
+    return [record[field] if record is not None else None for record in records]
+
+
+def app_columns(uid, grid, resolution_seconds, start_time, end_time):
+    app = np.full(len(grid), None, dtype=object)
+    app_seconds = np.zeros(len(grid))
+
+    sessions = get_app_sessions(uid, start_time, end_time)
+    if sessions:
+        opens = np.array([s['open'] for s in sessions])
+        closes = np.array([s['close'] for s in sessions])
+        apps = np.array([s['app'] for s in sessions], dtype=object)
+
+        # Spread every session over the buckets it overlaps
+        first_bucket = np.clip(np.floor_divide(opens - grid[0], resolution_seconds).astype(np.int64), 0, None)
+        last_bucket = np.clip(np.floor_divide(closes - grid[0], resolution_seconds).astype(np.int64), None,
+                              len(grid) - 1)
+        counts = np.clip(last_bucket - first_bucket + 1, 0, None)
+        session_ids = np.repeat(np.arange(len(sessions)), counts)
+        buckets = np.repeat(first_bucket, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                                                        counts)
+        overlap = np.minimum(closes[session_ids], grid[buckets] + resolution_seconds) - \
+            np.maximum(opens[session_ids], grid[buckets])
+
+        usage = pd.DataFrame({'bucket': buckets, 'app': apps[session_ids], 'seconds': overlap})
+        usage = usage[usage['seconds'] > 0].groupby(['bucket', 'app'], as_index=False)['seconds'].sum()
+        if not usage.empty:
+            totals = usage.groupby('bucket')['seconds'].sum()
+            app_seconds[totals.index.to_numpy()] = totals.to_numpy()
+            top = usage.loc[usage.groupby('bucket')['seconds'].idxmax()]
+            app[top['bucket'].to_numpy()] = top['app'].to_numpy()
+
+    return {'app': app, 'app_seconds': app_seconds}
+
+
+def lock_state_columns(uid, grid, resolution_seconds, start_time, end_time):
+    # As in get_lock_unlock_state_at_given_time, a state change exactly at a time only applies after it, and times
+    # without an earlier event take the state of the next one
+    states = fetch_asof_values(uid, IOS_LOCK_UNLOCK, grid, 'lock_state', LOCK_STATE_TOLERANCE,
+                               allow_exact_matches=False)
+    if any(s is None for s in states):
+        next_states = fetch_asof_values(uid, IOS_LOCK_UNLOCK, grid, 'lock_state', LOCK_STATE_TOLERANCE, 'forward')
+        states = [next_state if s is None else s for s, next_state in zip(states, next_states)]
+    return {'lock_state': [None if s is None else ("locked" if s == 1 else "unlocked") for s in states]}
+
+
+def activity_columns(uid, grid, resolution_seconds, start_time, end_time):
+    return {'activity': fetch_asof_values(uid, IOS_ACTIVITY, grid, 'activity', ACTIVITY_TOLERANCE, 'nearest')}
+
+
+def wifi_columns(uid, grid, resolution_seconds, start_time, end_time):
+    names = fetch_asof_values(uid, IOS_WIFI, grid, 'ssid', WIFI_TOLERANCE, keep=lambda r: 'ssid' in r)
+    return {'wifi': ['not connected' if not isinstance(n, str) or n in ("nil", '') else n for n in names]}
+
+
+def location_columns(uid, grid, resolution_seconds, start_time, end_time):
+    records = fetch_asof_records(uid, IOS_LOCATION, grid, LOCATION_TOLERANCE, 'nearest',
+                                 keep=lambda r: r['accuracy'] < 100)
+    return {'latitude': np.array([r['latitude'] if r else np.nan for r in records], dtype=float),
+            'longitude': np.array([r['longitude'] if r else np.nan for r in records], dtype=float)}
+
+
+def at_home_columns(uid, grid, resolution_seconds, start_time, end_time):
+    at_home = np.full(len(grid), None, dtype=object)
+    home = get_home_location(uid)
+    if home is None:
+        return {'at_home': at_home}
+
+    location = location_columns(uid, grid, resolution_seconds, start_time, end_time)
+    home_latitude, home_longitude = home
+    distances = haversine_distance(location['latitude'], location['longitude'], home_latitude, home_longitude)
+    located = ~np.isnan(distances)
+    at_home[located] = distances[located] < HOME_RADIUS_METERS
+    return {'at_home': at_home}
+
+
+def battery_columns(uid, grid, resolution_seconds, start_time, end_time):
+    levels = fetch_asof_values(uid, IOS_BATTERY, grid, 'battery_left', BATTERY_TOLERANCE,
+                               keep=lambda r: 'battery_left' in r and not pd.isna(r['battery_left']))
+    return {'battery_left': np.array(levels, dtype=float)}
+
+
+def resampled_column(name, timestamps, values, grid, resolution_seconds, aggregation):
+    end = grid[-1] + resolution_seconds
+    return {name: resample_to_grid(timestamps, values, grid[0], end, resolution_seconds, (aggregation,))[aggregation]}
+
+
+def heart_rate_columns(uid, grid, resolution_seconds, start_time, end_time):
+    records = fetch_documents_between_timestamps(uid, grid[0], grid[-1] + resolution_seconds, GARMIN_HR)
+    records = [r for r in records if r['status'] == "locked"]
+    return resampled_column('heart_rate', [r['timestamp'] for r in records], [r['heart_rate'] for r in records],
+                            grid, resolution_seconds, 'mean')
+
+
+def stress_columns(uid, grid, resolution_seconds, start_time, end_time):
+    try:
+        from models.stress_prediction_model import get_stress_predictions
+    except ImportError as e:
+        print(f"Warning: stress predictions are not available: {e}")
+        return {'stress': np.full(len(grid), np.nan)}
+
+    predictions = get_stress_predictions(uid, start_time, end_time)
+    uid_timezone = time_zone_dict.get(uid, 'est')
+    timezone = pytz.timezone("America/New_York") if uid_timezone == "est" else pytz.utc
+    timestamps = [timezone.localize(datetime.strptime(p['timestamp'], '%Y-%m-%d %H:%M:%S')).timestamp()
+                  for p in predictions]
+    return resampled_column('stress', timestamps, [p['stress_probability'] for p in predictions], grid,
+                            resolution_seconds, 'mean')
+
+
+def brightness_columns(uid, grid, resolution_seconds, start_time, end_time):
+    records = fetch_documents_between_timestamps(uid, grid[0], grid[-1] + resolution_seconds, IOS_BRIGHTNESS)
+    return resampled_column('brightness', [r['timestamp'] for r in records], [r['brightness'] for r in records],
+                            grid, resolution_seconds, 'mean')
+
+
+def steps_column(name, records, grid, resolution_seconds):
+    return resampled_column(name, [r['start_timestamp'] for r in records], [r['steps'] for r in records], grid,
+                            resolution_seconds, 'sum')
+
+
+def phone_steps_columns(uid, grid, resolution_seconds, start_time, end_time):
+    records = fetch_documents_between_timestamps(uid, grid[0], grid[-1] + resolution_seconds, IOS_STEPS)
+    return steps_column('phone_steps', records, grid, resolution_seconds)
+
+
+def garmin_steps_columns(uid, grid, resolution_seconds, start_time, end_time):
+    records = fetch_documents_between_timestamps(uid, grid[0], grid[-1] + resolution_seconds, GARMIN_STEPS)
+    return steps_column('garmin_steps', records, grid, resolution_seconds)
+
+
+feature_columns = {
+    'app': app_columns,
+    'lock_state': lock_state_columns,
+    'activity': activity_columns,
+    'wifi': wifi_columns,
+    'location': location_columns,
+    'at_home': at_home_columns,
+    'battery': battery_columns,
+    'heart_rate': heart_rate_columns,
+    'stress': stress_columns,
+    'brightness': brightness_columns,
+    'phone_steps': phone_steps_columns,
+    'garmin_steps': garmin_steps_columns,
+}
+
+
+def get_timeline(uid, start_time, end_time, resolution_seconds=60, features=None):
+    """
+    Build a time-aligned frame of a user's data streams.
+
+    Parameters:
+    - uid (str): The user identifier.
+    - start_time (str): Start of the range, in the format '%Y-%m-%d %H:%M:%S'.
+    - end_time (str): End of the range (exclusive), in the format '%Y-%m-%d %H:%M:%S'.
+    - resolution_seconds (int): Length of a time bucket in seconds.
+    - features (list): Features to include, see FEATURES. Defaults to all of them.
+
+    Returns:
+    - pd.DataFrame: One row per bucket with a 'timestamp' column and the columns of the requested features.
+    """
+    features = list(FEATURES if features is None else features)
+    unknown = [feature for feature in features if feature not in feature_columns]
+    if unknown:
+        raise ValueError(f"Unknown timeline features: {unknown}. Available features: {list(FEATURES)}")
+    if resolution_seconds <= 0:
+        raise ValueError("resolution_seconds must be positive")
+
+    user_timezone = time_zone_dict.get(uid, "est")
+    timezone = pytz.timezone("America/New_York") if user_timezone == "est" else pytz.timezone(user_timezone)
+    start_timestamp = timezone.localize(datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S")).timestamp()
+    end_timestamp = timezone.localize(datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S")).timestamp()
+
+    grid = np.arange(start_timestamp, end_timestamp, resolution_seconds, dtype=float)
+    uid_timezone = time_zone_dict.get(uid, 'est')  # Get UID-specific timezone or default to EST
+    record_timezone = pytz.timezone("America/New_York") if uid_timezone == "est" else pytz.utc
+    columns = {'timestamp': format_timestamps(grid, record_timezone)}
+    if len(grid) == 0:
+        return pd.DataFrame(columns)
+
+    for feature in features:
+        columns.update(feature_columns[feature](uid, grid, resolution_seconds, start_time, end_time))
+    return pd.DataFrame(columns)
+
+
+if __name__ == "__main__":
+    print(get_timeline("test004", "2025-08-28 12:00:00", "2025-08-28 13:00:00", 300))
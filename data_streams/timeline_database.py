@@ -0,0 +1,47 @@
+"""
+Timeline Database - Time-aligned view across all data streams
+Uses the database registry system
+"""
+
+import sys
+import os
+from typing import Dict, Any, Callable
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data_processing')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../agents')))
+
+# Import function metadata from timeline_data.py
+from data_streams.timeline_data import functions
+
+# Import all the actual function implementations from timeline_data.py
+from data_streams.timeline_data import (
+    get_timeline
+)
+
+# Database metadata for registry
+database_info = {
+    "name": "timeline database",
+    "info": "Contains a time-aligned table combining app usage, lock state, activity, wifi, location, battery, heart rate, stress, brightness and steps data, with one row per time bucket.",
+    "device": "Phone and Garmin Smartwatch",
+    "additional_instructions": "Use the timeline database for questions that combine several data streams, e.g. stress while using an app at home. State streams (app, lock state, activity, wifi, location) give the state in each time bucket and numeric streams (heart rate, stress, brightness, steps) are aggregated within each time bucket."
+}
+
+# Create function references mapping (function name -> actual function)
+function_refs = {
+    "get_timeline": get_timeline
+}
+
+# Optional: Custom registration function
+def register_database(registry):
+    """Register this database with the registry"""
+    from agents.database_registry import DatabaseRegistry
+    registry.register_database(
+        name=database_info["name"],
+        info=database_info["info"],
+        device=database_info["device"],
+        additional_instructions=database_info["additional_instructions"],
+        functions=functions,  # Function metadata/definitions for LLMs
+        function_refs=function_refs,  # Actual function references
+        module_path="data_streams.timeline_database"
+    )
@@ -8,6 +8,8 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'd
 
 from datetime import datetime, timedelta
 from data_processing.data_processing_utils import fetch_documents_between_timestamps
+from data_processing.stream_index import fetch_document_asof
+from data_processing.block_utils import run_length_blocks, format_timestamps
 from data_streams.constants import IOS_WIFI, time_zone_dict
 import agents.generic_summarizer
 from agents.coding_agent import run_coding_agent
@@ -86,6 +88,10 @@ functions = {
 
 
 def get_wifi_records(uid, start_time, end_time):
+    return process_wifi_records(uid, fetch_wifi_records(uid, start_time, end_time))
+
+
+def fetch_wifi_records(uid, start_time, end_time):
     # Use New York time zone if the user's timezone is "est"
     user_timezone = time_zone_dict.get(uid, "est")
     timezone = pytz.timezone("America/New_York") if user_timezone == "est" else pytz.timezone(user_timezone)
@@ -99,8 +105,7 @@ def get_wifi_records(uid, start_time, end_time):
         end_time = end_time.timestamp()
 
     # Fetch WiFi records
-    wifi_records = fetch_documents_between_timestamps(uid, start_time, end_time, IOS_WIFI)
-    return process_wifi_records(uid, wifi_records)
+    return fetch_documents_between_timestamps(uid, start_time, end_time, IOS_WIFI)
 
 
 def process_wifi_records(uid, wifi_records):
@@ -118,28 +123,30 @@ def process_wifi_records(uid, wifi_records):
 
 
 def get_wifi_blocks(uid, start_time, end_time):
-    wifi_records = get_wifi_records(uid, start_time, end_time)
-
-    first_flag = True
-    wifi_blocks = []
-    for i in range(1, len(wifi_records)):
-        if "wifi_name" in wifi_records[i]:
-            if wifi_records[i]["wifi_name"] == "nil" or wifi_records[i]["wifi_name"] == '':
-                wifi_records[i]["wifi_name"] = 'not connected'
-
-            if first_flag == True:
-                start_wifi = wifi_records[1]['wifi_name']
-                start_time = wifi_records[1]['timestamp']
-                last_wifi_info = i
-                first_flag = False
-
-            if wifi_records[i]['wifi_name'] != wifi_records[last_wifi_info]['wifi_name']:
-                wifi_blocks.append(
-                    {"wifi_name": start_wifi, "start_time": start_time, "end_time": wifi_records[i]['timestamp']})
-                start_wifi = wifi_records[i]['wifi_name']
-                start_time = wifi_records[i]['timestamp']
-                last_wifi_info = i
-    wifi_blocks.append({"wifi_name": start_wifi, "start_time": start_time, "end_time": end_time})
+    wifi_records = [r for r in fetch_wifi_records(uid, start_time, end_time) if "ssid" in r]
+
+    # Blocks start from the second record of the range
+    wifi_records = wifi_records[1:]
+    if not wifi_records:
+        return []
+
+    uid_timezone = time_zone_dict.get(uid, 'est')  # Get UID-specific timezone or default to EST
+    timezone = pytz.timezone("America/New_York") if uid_timezone == "est" else pytz.utc
+
+    wifi_names = ['not connected' if r['ssid'] == "nil" or r['ssid'] == '' else r['ssid'] for r in wifi_records]
+    blocks = run_length_blocks([r['timestamp'] for r in wifi_records], wifi_names)
+    block_starts = format_timestamps(blocks['start'], timezone)
+
+    # The last block runs until the range end
+    wifi_blocks = [
+        {"wifi_name": wifi_name, "start_time": block_start, "end_time": block_end}
+        for wifi_name, block_start, block_end in zip(blocks['state'], block_starts, block_starts[1:] + [end_time])
+    ]
+
+    # A missing name (NaN) never equals itself, so a range starting with one opens with an empty block
+    if wifi_names[0] != wifi_names[0]:
+        wifi_blocks.insert(0, {"wifi_name": wifi_names[0], "start_time": block_starts[0],
+                               "end_time": block_starts[0]})
     return wifi_blocks
 
 
@@ -199,32 +206,26 @@ def get_wifi_at_a_time(uid, given_time):
     Finds the Wi-Fi connection name at a specific time.
 
     Args:
-        records (list): A list of dictionaries containing Wi-Fi connection details.
-                        Each dictionary has 'wifi_name', 'start_time', and 'end_time'.
+        uid (str): The unique identifier for the user.
         given_time (str): The time to check in the format '%Y-%m-%d %H:%M:%S'.
 
     Returns:
-        str: The Wi-Fi name at the given time, or 'not connected' if no match is found.
+        dict: The Wi-Fi name at the given time, or 'not connected' if no match is found.
     """
-    # Convert the given time to a datetime object
-    given_time = datetime.strptime(given_time, '%Y-%m-%d %H:%M:%S')
-    end_datetime = given_time + timedelta(hours=5)  # Add 5 hours to convert to UTC
-    start_datetime = given_time - timedelta(hours=5)  # Subtract 5 hours to convert to UTC
-    start_time = start_datetime.strftime('%Y-%m-%d %H:%M:%S')
-    end_time = end_datetime.strftime('%Y-%m-%d %H:%M:%S')
-    records = get_wifi_blocks(uid, start_time, end_time)
-
-    for record in records:
-        # Convert start and end times to datetime objects
-        start_time = datetime.strptime(record['start_time'], '%Y-%m-%d %H:%M:%S')
-        end_time = datetime.strptime(record['end_time'], '%Y-%m-%d %H:%M:%S')
-
-        # Check if the given time falls within the start and end times
-        if start_time <= given_time <= end_time:
-            return {"wifi": record['wifi_name']}
-
-    # If no match is found, return 'not connected'
-    return {"wifi": 'not connected'}
+    user_timezone = time_zone_dict.get(uid, "est")
+    timezone = pytz.timezone("America/New_York") if user_timezone == "est" else pytz.timezone(user_timezone)
+    given_timestamp = timezone.localize(datetime.strptime(given_time, '%Y-%m-%d %H:%M:%S')).timestamp()
+
+    # The connection at a given time is the one reported last before it within 5 hours
+    record = fetch_document_asof(uid, given_timestamp, IOS_WIFI, tolerance=5 * 60 * 60, allow_exact_matches=False,
+                                 query={'ssid': {'$exists': True}})
+    if record is None:
+        return {"wifi": 'not connected'}
+
+    wifi_name = record['ssid']
+    if not isinstance(wifi_name, str) or wifi_name in ("nil", ''):
+        wifi_name = 'not connected'
+    return {"wifi": wifi_name}
 
 
 if __name__ == "__main__":
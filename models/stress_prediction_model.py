@@ -8,6 +8,7 @@ from ubiwell_stress_detection.preprocess import *
 from data_streams.constants import time_zone_dict
 
 from data_streams.garmin_ibi_data import get_garmin_ibi
+from data_processing.resampling_utils import resample
 from datetime import datetime
 import pytz
 import sys
@@ -134,62 +135,17 @@ def get_stress_aggregation(uid, start_time, end_time, granularity=1):
     if stress_records == []:
         return [], -1, -1
 
-    # Convert granularity from minutes to seconds
-    granularity_seconds = granularity * 60
-
     # Sort records by timestamp
     stress_records.sort(key=lambda x: x['timestamp'])
 
-    # List to store aggregated results
-    aggregated_data = []
-
-    # Initialize variables
-    interval_start = None
-    interval_end = None
-    interval_stress = []
-
-    for record in stress_records:
-        timestamp_ = record['timestamp']
-        stress_level = record['stress_probability']
-
-        dt_object = datetime.strptime(timestamp_, '%Y-%m-%d %H:%M:%S')
-        timestamp = dt_object.timestamp()
-        formatted_time = dt_object.strftime('%Y-%m-%d %H:%M:%S')
-
-        if interval_start is None:
-            interval_start = timestamp
-
-        if (timestamp - interval_start) < granularity_seconds:
-            # Accumulate stress level within the interval
-            interval_stress.append(stress_level)
-            interval_end = timestamp
-        else:
-            # Calculate aggregation metrics
-            average_stress = round(np.mean(interval_stress), 4)
-            std_dev_stress = round(np.std(interval_stress), 4)
-            dt_object = datetime.fromtimestamp(interval_start)
-            formatted_time = dt_object.strftime('%Y-%m-%d %H:%M:%S')
-            # Store the aggregated data
-            aggregated_data.append({
-                'time': formatted_time,
-                'stress_probability': average_stress,
-            })
-
-            # Reset for the next interval
-            interval_start = timestamp
-            interval_end = timestamp
-            interval_stress = [stress_level]
-
-    # Handle the last interval
-    if interval_stress:
-        average_stress = round(np.mean(interval_stress), 4)
-        std_dev_stress = round(np.std(interval_stress), 4)
-        dt_object = datetime.fromtimestamp(interval_start)
-        formatted_time = dt_object.strftime('%Y-%m-%d %H:%M:%S')
-        aggregated_data.append({
-            'time': formatted_time,
-            'stress_probability': average_stress,
-        })
+    timestamps = [record['timestamp'] for record in stress_records]
+    stress_levels = [record['stress_probability'] for record in stress_records]
+
+    # Each interval starts at its first record and spans granularity minutes
+    resampled = resample(timestamps, stress_levels, granularity * 60, aggregations=('mean',), anchored=True)
+
+    aggregated_data = [{'time': timestamps[index], 'stress_probability': round(average_stress, 4)}
+                       for index, average_stress in zip(resampled['first_index'], resampled['mean'])]
 
     # Calculate overall statistics
     stress_rec = [a['stress_probability'] for a in aggregated_data]
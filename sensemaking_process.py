@@ -4,6 +4,8 @@ import sys
 import json
 from termios import VERASE
 import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
 import agents.sensemaking_agent
 
@@ -14,7 +16,11 @@ from agents import sensemaking_agent, information_seeking_agent, \
     action_plan_generation_agent, generic_database_manager, presentation_agent
 from agents.database_registry import get_all_databases
 from agents.next_step_agent import NextStepAgent
-from agents.config import VERBOSE
+from agents.memory_manager import MemoryManager
+from agents.config import VERBOSE, LLM_CACHE_ENABLED, MULTI_REQUEST_SEEKING, MAX_PARALLEL_REQUESTS, \
+    CODE_CACHE_ENABLED
+from agents.llm_cache import get_cache_stats
+from agents.code_cache import get_code_cache_stats
 
 max_iters = 3
 
@@ -82,6 +88,7 @@ class SenseMaker:
         self.user_query = question
         self.presentation_instructions = presentation_instructions
         self.memory = ''
+        self.memory_manager = MemoryManager()
         self.answer = ''
         self.current_step = ""
         self.understanding = ''
@@ -116,18 +123,8 @@ class SenseMaker:
         print_step("ACTION PLAN GENERATION", verbose=verbose)
 
         action_plans = self.invoke_with_retry(self.action_plan_generator_agent, 'invoke', {'user_query': self.user_query})
-
-        if "NOT POSSIBLE" in action_plans:
-            if verbose:
-                print("❌ Not possible to answer the question with current data")
-        else:
-            if verbose:
-                print(f"📋 Action plan: {action_plans['action_plan']}")
-            self.action_plan = action_plans["action_plan"]
-            if (self.action_plan == "The query cannot be answered with given datasets"):
-                self.answer = "The query cannot be answered with given datasets"
-                self.current_step = "FINISH"
-                return
+        if self.set_action_plan(action_plans, verbose):
+            return
 
         num_iters = 0
 
@@ -135,23 +132,16 @@ class SenseMaker:
 
             response = self.invoke_with_retry(self.next_step_agent, 'invoke_next_step', {
                 'user_query': self.user_query,
-                'memory': self.memory,
+                'memory': self.memory_manager.for_prompt(),
                 'understanding': self.understanding,
                 'action_plan': self.action_plan
             })
-            try:
-                # response_dict = json.loads(response)
-                if "next_step" in response:
-                    state = response["next_step"]
-            except Exception as e:
-                if verbose:
-                    print(f"❌ Error in response: {str(e)}")
-                continue
+            state = response["next_step"] if isinstance(response, dict) and "next_step" in response else None
 
             if verbose:
                 print(f"🔄 Returned state: {state}")
 
-            self.current_step = self.state_dict[state]
+            self.current_step = self.state_dict.get(state, "INVALID STATE")
             self.step_history.append(self.current_step)
 
             if state == "INF" or state == 'INF':
@@ -159,85 +149,127 @@ class SenseMaker:
                 if verbose:
                     print_step("INFORMATION SEEKING", verbose=verbose)
 
-                response = self.invoke_with_retry(self.information_seeking_agent, 'invoke', {
+                seeking_method = 'invoke_multiple' if MULTI_REQUEST_SEEKING else 'invoke'
+                response = self.invoke_with_retry(self.information_seeking_agent, seeking_method, {
                     'understanding': self.understanding,
                     'user_query': self.user_query,
                     'action_plan': self.action_plan,
-                    'memory': self.memory
+                    'memory': self.memory_manager.for_prompt()
                 })
 
-                if 'NOT POSSIBLE' in response:
-                    self.memory += f"\n\nNot possible to answer {self.user_query} using the available data. CODE-999."
-                    self.understanding += f"\n\nNot possible to answer {self.user_query} using the available data. CODE-999."
-                    continue
-
-                if not "database" in response:
-                    continue
-                database = response["database"]
-                request = response["request"]
-                database = database.split(',')
-                database = [d.strip() for d in database]
-                self.information_request.append(f"{database}: {request}")
+                information_requests = self.parse_information_requests(response, verbose)
+                # Independent requests are answered concurrently, each with its own local sensemaking
+                if len(information_requests) <= 1:
+                    local_senses = [self.answer_request(*request, verbose=verbose) for request in information_requests]
+                else:
+                    with ThreadPoolExecutor(max_workers=len(information_requests)) as executor:
+                        local_senses = list(executor.map(lambda r: self.answer_request(*r, verbose=verbose),
+                                                         information_requests))
+
+                if not self.record_local_senses(information_requests, local_senses, verbose):
+                    # Rounds without findings count as iterations, so failing LLM calls cannot loop forever
+                    num_iters += 1
+                else:
+                    response = self.invoke_with_retry(self.sense_making_agent, 'invoke_global_sense', {
+                        'user_query': self.user_query,
+                        'understanding': self.understanding,
+                        'memory': self.memory_manager.for_prompt(),
+                        "action_plan": self.action_plan
+                    })
+                    if (response != "FAILED"):
+                        self.understanding = response['understanding']
+                    num_iters += 1
+                    if verbose:
+                        print(f"🔄 Number of iterations: {num_iters}")
+                    print_understanding(self.understanding, verbose)
 
+            if state not in ("INF", "END"):
                 if verbose:
-                    print(f"🔍 Querying databases: {database}")
-                    print(f"📝 Request: {request}")
+                    print("❌ Invalid state")
+                    print(state)
+                self.step_history.append("INVALID STATE")
+                num_iters += 1
 
-                results = None
+            if state == "END" or num_iters >= max_iters:
+                self.start_presentation(verbose)
 
-                results = self.invoke_with_retry(self.generic_db_manager, 'invoke',
-                                                 {'user_query': request, 'databases': database})
-                if results == "FAILED":
-                    results = None
+                answer = self.invoke_with_retry(self.presentation_agent, 'invoke', {
+                    'user_query': self.user_query,
+                    'understanding': self.understanding,
+                    'instructions': self.presentation_instructions
+                })
+                self.finish(answer, verbose)
+                break
 
-                elif database == "NOT POSSIBLE":
-                    self.memory += f"\n\nNot possible to answer {request} using the available data. CODE-999."
+    async def make_sense_async(self, verbose=True):
+        """
+        Asynchronous variant of make_sense. The LangChain chains are awaited with ainvoke and the coding agent runs on
+        the caller's event loop, so one process can serve many sessions at once. Independent information requests,
+        their function calls and their local sensemaking run concurrently.
+        """
+        print_welcome()
 
-                if results:
-                    if ("NOT POSSIBLE" in results):
-                        local_sense = f"Failed to generate results because {results['NOT POSSIBLE']}"
-                    else:
-                        for res in results:
-                            if ('func' in res):
-                                self.function_calls.append(res['func'])
+        self.current_step = "START"
+        self.step_history.append(self.current_step)
 
-                        if verbose:
-                            print_step("LOCAL SENSEMAKING", verbose=verbose)
-                            print("Creating natural language interpretation of code results and updating memory...")
+        if self.user_query == "" or self.presentation_instructions == "":
+            self.answer = "Incomplete query or instructions"
+            self.current_step = "FINISH"
+            return
 
+        self.current_step = "ACTION PLAN GENERATION"
+        self.step_history.append(self.current_step)
+        print_step("ACTION PLAN GENERATION", verbose=verbose)
 
-                        self.current_step = "LOCAL SENSEMAKING"
-                        self.step_history.append(self.current_step)
+        action_plans = await self.ainvoke_with_retry(self.action_plan_generator_agent, 'invoke',
+                                                     {'user_query': self.user_query})
+        if self.set_action_plan(action_plans, verbose):
+            return
 
-                        response = self.invoke_with_retry(self.sense_making_agent, 'invoke_local_sense', {
-                            'results': results,
-                            'data_type': database,
-                            'user_query': request
-                        })
-                        if (response != "FAILED"):
-                            if ("NOT POSSIBLE" not in response):
-                                local_sense = response["summary"]
-                            else:
-                                local_sense = f"Failed to generate local sense of results because {response['NOT POSSIBLE']}"
-                        else:
-                            local_sense = f"Failed to generate local sense of results because of LLM call failure"
+        num_iters = 0
 
-                    question_and_sense = f"Question: \n {request} \n\n Database: \n {database} \n\n Answer: \n {local_sense}\n\n"
-                    self.memory += "\n\n" + question_and_sense
+        while self.current_step != "END":
 
-                    print_memory(self.memory, verbose)
+            response = await self.ainvoke_with_retry(self.next_step_agent, 'invoke_next_step', {
+                'user_query': self.user_query,
+                'memory': self.memory_manager.for_prompt(),
+                'understanding': self.understanding,
+                'action_plan': self.action_plan
+            })
+            state = response["next_step"] if isinstance(response, dict) and "next_step" in response else None
 
-                    if verbose:
-                        print_step("GLOBAL SENSEMAKING", verbose=verbose)
-                        print("Updating understanding...")
+            if verbose:
+                print(f"🔄 Returned state: {state}")
 
-                    self.current_step = "GLOBAL SENSEMAKING"
-                    self.step_history.append(self.current_step)
+            self.current_step = self.state_dict.get(state, "INVALID STATE")
+            self.step_history.append(self.current_step)
 
-                    response = self.invoke_with_retry(self.sense_making_agent, 'invoke_global_sense', {
+            if state == "INF":
+                if verbose:
+                    print_step("INFORMATION SEEKING", verbose=verbose)
+
+                seeking_method = 'invoke_multiple' if MULTI_REQUEST_SEEKING else 'invoke'
+                response = await self.ainvoke_with_retry(self.information_seeking_agent, seeking_method, {
+                    'understanding': self.understanding,
+                    'user_query': self.user_query,
+                    'action_plan': self.action_plan,
+                    'memory': self.memory_manager.for_prompt()
+                })
+
+                information_requests = await asyncio.to_thread(self.parse_information_requests, response, verbose)
+                local_senses = await asyncio.gather(*[self.answer_request_async(database, request, verbose=verbose)
+                                                      for database, request in information_requests])
+
+                # Memory compaction may call the LLM synchronously, so it runs off the event loop
+                if not await asyncio.to_thread(self.record_local_senses, information_requests, local_senses,
+                                               verbose):
+                    # Rounds without findings count as iterations, so failing LLM calls cannot loop forever
+                    num_iters += 1
+                else:
+                    response = await self.ainvoke_with_retry(self.sense_making_agent, 'invoke_global_sense', {
                         'user_query': self.user_query,
                         'understanding': self.understanding,
-                        'memory': self.memory,
+                        'memory': self.memory_manager.for_prompt(),
                         "action_plan": self.action_plan
                     })
                     if (response != "FAILED"):
@@ -247,37 +279,203 @@ class SenseMaker:
                         print(f"🔄 Number of iterations: {num_iters}")
                     print_understanding(self.understanding, verbose)
 
-            if state == "END" or state == 'END' or num_iters >= max_iters:
-                state = "END"
+            if state not in ("INF", "END"):
                 if verbose:
-                    print("\n" + "🎯" * 20 + " END OF SENSEMAKING " + "🎯" * 20)
-                    print_understanding(self.understanding, verbose)
-
-                self.current_step = "PRESENTATION"
-                self.step_history.append(self.current_step)
+                    print("❌ Invalid state")
+                    print(state)
+                self.step_history.append("INVALID STATE")
+                num_iters += 1
 
-                if verbose:
-                    print_step("PRESENTATION", verbose=verbose)
+            if state == "END" or num_iters >= max_iters:
+                self.start_presentation(verbose)
 
-                answer = self.invoke_with_retry(self.presentation_agent, 'invoke', {
+                answer = await self.ainvoke_with_retry(self.presentation_agent, 'invoke', {
                     'user_query': self.user_query,
                     'understanding': self.understanding,
                     'instructions': self.presentation_instructions
                 })
-                self.answer = answer["response"]
-
-                print("\n" + "🎉" * 20 + " FINAL ANSWER " + "🎉" * 20)
-                print(self.answer)
-                print("🎉" * 50)
+                self.finish(answer, verbose)
+                break
 
+    def set_action_plan(self, action_plans, verbose=True):
+        """Store the generated action plan, returning True if the query cannot be answered."""
+        if "NOT POSSIBLE" in action_plans:
+            if verbose:
+                print("❌ Not possible to answer the question with current data")
+        else:
+            if verbose:
+                print(f"📋 Action plan: {action_plans['action_plan']}")
+            self.action_plan = action_plans["action_plan"]
+            if (self.action_plan == "The query cannot be answered with given datasets"):
+                self.answer = "The query cannot be answered with given datasets"
                 self.current_step = "FINISH"
-                self.step_history.append(self.current_step)
-                break
-            if state != "END" and state != 'INF':
-                if verbose:
-                    print("❌ Invalid state")
-                    print(state)
-                self.step_history.append("INVALID STATE")
+                return True
+        return False
+
+    def parse_information_requests(self, response, verbose=True):
+        """
+        Parse the information seeking response into (databases, request) pairs.
+
+        Returns:
+        - list: The requests to answer, empty if there are none (or it is not possible to answer the query).
+        """
+        if 'NOT POSSIBLE' in response:
+            self.add_to_memory(f"Not possible to answer {self.user_query} using the available data. CODE-999.")
+            self.understanding += f"\n\nNot possible to answer {self.user_query} using the available data. CODE-999."
+            return []
+
+        if MULTI_REQUEST_SEEKING and "requests" in response:
+            requests = [r for r in response["requests"] if "database" in r and "request" in r]
+        elif "database" in response:
+            requests = [response]
+        else:
+            return []
+
+        information_requests = []
+        for r in requests[:MAX_PARALLEL_REQUESTS]:
+            database = [d.strip() for d in r["database"].split(',')]
+            request = r["request"]
+            self.information_request.append(f"{database}: {request}")
+            information_requests.append((database, request))
+
+            if verbose:
+                print(f"🔍 Querying databases: {database}")
+                print(f"📝 Request: {request}")
+        return information_requests
+
+    def record_local_senses(self, information_requests, local_senses, verbose=True):
+        """Add the answered requests to memory, returning True if global sensemaking should follow."""
+        answered = False
+        for (database, request), local_sense in zip(information_requests, local_senses):
+            if local_sense is not None:
+                self.add_to_memory(local_sense, question=request, database=database)
+                answered = True
+        if not answered:
+            return False
+
+        print_memory(self.memory, verbose)
+
+        if verbose:
+            print_step("GLOBAL SENSEMAKING", verbose=verbose)
+            print("Updating understanding...")
+
+        self.current_step = "GLOBAL SENSEMAKING"
+        self.step_history.append(self.current_step)
+        return True
+
+    def start_presentation(self, verbose=True):
+        if verbose:
+            print("\n" + "🎯" * 20 + " END OF SENSEMAKING " + "🎯" * 20)
+            print_understanding(self.understanding, verbose)
+
+        self.current_step = "PRESENTATION"
+        self.step_history.append(self.current_step)
+
+        if verbose:
+            print_step("PRESENTATION", verbose=verbose)
+
+    def finish(self, answer, verbose=True):
+        if answer == "FAILED":
+            self.answer = "Failed to generate the answer because of LLM call failure"
+        else:
+            self.answer = answer["response"]
+
+        print("\n" + "🎉" * 20 + " FINAL ANSWER " + "🎉" * 20)
+        print(self.answer)
+        print("🎉" * 50)
+
+        if verbose:
+            print(f"🧠 Memory: {self.memory_manager.stats()}")
+        if verbose and LLM_CACHE_ENABLED:
+            print(f"💾 LLM cache hits and misses per agent: {get_cache_stats()}")
+        if verbose and CODE_CACHE_ENABLED:
+            print(f"💾 Code cache: {get_code_cache_stats()}")
+
+        self.current_step = "FINISH"
+        self.step_history.append(self.current_step)
+
+    def answer_request(self, database, request, verbose=True):
+        """
+        Query the databases for an information request and interpret the results.
+
+        Parameters:
+        - database (list): The databases to query.
+        - request (str): The information request.
+        - verbose (bool): Whether to print the progress.
+
+        Returns:
+        - str: The local sense of the results, or None if no results were returned.
+        """
+        results = self.invoke_with_retry(self.generic_db_manager, 'invoke',
+                                         {'user_query': request, 'databases': database})
+        local_sense = self.check_results(results, database, request, verbose)
+        if local_sense is not False:
+            return local_sense
+
+        response = self.invoke_with_retry(self.sense_making_agent, 'invoke_local_sense', {
+            'results': results,
+            'data_type': database,
+            'user_query': request
+        })
+        return self.interpret_local_sense(response)
+
+    async def answer_request_async(self, database, request, verbose=True):
+        """Asynchronous variant of answer_request."""
+        results = await self.ainvoke_with_retry(self.generic_db_manager, 'invoke',
+                                                {'user_query': request, 'databases': database})
+        local_sense = self.check_results(results, database, request, verbose)
+        if local_sense is not False:
+            return local_sense
+
+        response = await self.ainvoke_with_retry(self.sense_making_agent, 'invoke_local_sense', {
+            'results': results,
+            'data_type': database,
+            'user_query': request
+        })
+        return self.interpret_local_sense(response)
+
+    def check_results(self, results, database, request, verbose=True):
+        """
+        Check the results of a database request before local sensemaking, recording the function calls made.
+
+        Returns:
+        - str: None if there are no results, a failure message if the request was not possible, or False if the
+          results should be interpreted by local sensemaking.
+        """
+        if results == "FAILED":
+            results = None
+
+        elif database == "NOT POSSIBLE":
+            self.add_to_memory(f"Not possible to answer {request} using the available data. CODE-999.")
+
+        if not results:
+            return None
+        if ("NOT POSSIBLE" in results):
+            return f"Failed to generate results because {results['NOT POSSIBLE']}"
+
+        for res in results:
+            if ('func' in res):
+                self.function_calls.append(res['func'])
+
+        if verbose:
+            print_step("LOCAL SENSEMAKING", verbose=verbose)
+            print("Creating natural language interpretation of code results and updating memory...")
+
+        self.current_step = "LOCAL SENSEMAKING"
+        self.step_history.append(self.current_step)
+        return False
+
+    def interpret_local_sense(self, response):
+        if (response != "FAILED"):
+            if ("NOT POSSIBLE" not in response):
+                return response["summary"]
+            return f"Failed to generate local sense of results because {response['NOT POSSIBLE']}"
+        return f"Failed to generate local sense of results because of LLM call failure"
+
+    def add_to_memory(self, answer, question=None, database=None):
+        """Add a finding to the memory manager and refresh the memory shown to the user"""
+        self.memory_manager.add(answer, question=question, database=database)
+        self.memory = self.memory_manager.render()
 
     def invoke_with_retry(self, agent, method, params, max_retries=1):
         retries = 0
@@ -290,6 +488,18 @@ class SenseMaker:
                     print(f"Failed after {max_retries + 1} attempts: {str(e)}")
                     return "FAILED"
 
+    async def ainvoke_with_retry(self, agent, method, params, max_retries=1):
+        """Asynchronous invoke_with_retry, awaiting the 'a' prefixed variant of method, e.g. ainvoke for invoke."""
+        retries = 0
+        while retries <= max_retries:
+            try:
+                return await getattr(agent, 'a' + method)(params)
+            except Exception as e:
+                retries += 1
+                if retries > max_retries:
+                    print(f"Failed after {max_retries + 1} attempts: {str(e)}")
+                    return "FAILED"
+
 
 if __name__ == "__main__":
 
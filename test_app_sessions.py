@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for the persisted app session table against the app usage stream, on CSV copies of the sample data
+"""
+
+import os
+import shutil
+import sys
+
+import pytest
+
+# Add the project root to the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "not-used")
+
+import data_processing.data_processing_utils as data_processing_utils
+from data_processing.data_processing_utils import find_documents
+from data_streams.app_usage_data import get_app_usage_blocks, get_total_app_usage, get_most_recent_app, \
+    get_app_session_coverage, update_app_session_table, to_utc_timestamp
+from data_streams.constants import APP_SESSIONS, APP_SESSION_COVERAGE
+
+SAMPLE_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_data')
+UID = "test004"
+DAY_START, DAY_END = "2025-08-28 00:00:00", "2025-08-29 00:00:00"
+
+
+@pytest.fixture(autouse=True)
+def csv_dir(tmp_path, monkeypatch):
+    """Copy the sample data to a temporary folder and point the CSV collections to it."""
+    for filename in os.listdir(SAMPLE_DATA):
+        if filename.endswith(".csv"):
+            shutil.copy(os.path.join(SAMPLE_DATA, filename), tmp_path)
+    monkeypatch.setattr(data_processing_utils, "USE_CSV", True)
+    monkeypatch.setattr(data_processing_utils, "get_csv_path",
+                        lambda collection_name: str(tmp_path / f"{collection_name}.csv"))
+
+
+def stored_sessions():
+    return [{key: value for key, value in session.items() if key != '_id'}
+            for session in find_documents(APP_SESSIONS, {'uid': UID}, sort_field='open')]
+
+
+def test_table_matches_the_stream_over_covered_ranges():
+    ranges = [(DAY_START, DAY_END), ("2025-08-28 03:00:00", "2025-08-28 12:00:00"),
+              ("2025-08-28 06:00:00", "2025-08-28 18:00:00")]
+    times = ["2025-08-28 02:06:00", "2025-08-28 12:00:00", "2025-08-28 23:59:00"]
+    stream_blocks = [get_app_usage_blocks(UID, *time_range) for time_range in ranges]
+    stream_totals = [get_total_app_usage(UID, *time_range) for time_range in ranges]
+    stream_recent = [get_most_recent_app(UID, time) for time in times]
+
+    assert update_app_session_table(UID, DAY_START, DAY_END) > 0
+    assert [get_app_usage_blocks(UID, *time_range) for time_range in ranges] == stream_blocks
+    assert [get_total_app_usage(UID, *time_range) for time_range in ranges] == stream_totals
+    assert [get_most_recent_app(UID, time) for time in times] == stream_recent
+
+
+def test_most_recent_app_includes_the_session_in_use():
+    update_app_session_table(UID, DAY_START, DAY_END)
+    # Instagram is in use from 11:30:15 to 11:44:55, and is cut at the given time
+    assert get_most_recent_app(UID, "2025-08-28 11:40:00") == {
+        'app': 'Instagram', 'open': '2025-08-28 11:30:15', 'close': '2025-08-28 11:40:00', 'duration': 585.0}
+
+
+def test_table_is_extended_incrementally():
+    update_app_session_table(UID, DAY_START, "2025-08-28 12:00:00")
+    update_app_session_table(UID, DAY_START, DAY_END)
+    extended = stored_sessions()
+    assert get_app_session_coverage(UID)['end'] == to_utc_timestamp(UID, DAY_END)
+    # A range already covered is not rebuilt
+    assert update_app_session_table(UID, "2025-08-28 06:00:00", "2025-08-28 20:00:00") == 0
+
+    data_processing_utils.delete_documents(APP_SESSIONS, {'uid': UID})
+    data_processing_utils.delete_documents(APP_SESSION_COVERAGE, {'uid': UID})
+    update_app_session_table(UID, DAY_START, DAY_END)
+    assert extended == stored_sessions()
+
+
+def test_table_is_rebuilt_from_a_start_outside_the_coverage():
+    update_app_session_table(UID, "2025-08-28 06:00:00", DAY_END)
+    update_app_session_table(UID, DAY_START, "2025-08-28 12:00:00")
+
+    coverage = get_app_session_coverage(UID)
+    assert (coverage['start'], coverage['end']) == (to_utc_timestamp(UID, DAY_START),
+                                                    to_utc_timestamp(UID, "2025-08-28 12:00:00"))
+    sessions = stored_sessions()
+    assert sessions[0]['open'] < to_utc_timestamp(UID, "2025-08-28 06:00:00")
+    assert all(session['open'] <= coverage['end'] for session in sessions)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Differential test for the sweep-line app usage reconciliation against the original nested-loop implementation
+"""
+
+import os
+import sys
+import time
+import random
+from datetime import datetime, timedelta
+
+import pytz
+
+# Add the project root to the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "not-used")
+
+from data_streams.app_usage_data import reconcile_app_events
+
+TIMEZONE = pytz.timezone("America/New_York")
+APPS = ["IG", "SNAP", "TT", "WHT", "YT"]
+
+
+def legacy_reconcile(app_usage_records, lock_unlock_blocks, timezone):
+    """The reconciliation loop of get_app_usage_records before the sweep-line rewrite"""
+    block_index = 0
+    updated_app_usage_records = []
+
+    j = 0
+    while (j < len(app_usage_records)):
+        for i in range(block_index, len(lock_unlock_blocks)):
+            block_start_time = timezone.localize(
+                datetime.strptime(lock_unlock_blocks[i]['start_time'], "%Y-%m-%d %H:%M:%S")).astimezone(
+                pytz.UTC).timestamp()
+            block_end_time = timezone.localize(
+                datetime.strptime(lock_unlock_blocks[i]['end_time'], "%Y-%m-%d %H:%M:%S")).astimezone(
+                pytz.UTC).timestamp()
+
+            if (app_usage_records[j]['timestamp'] > block_end_time):
+                continue
+            block_index = i
+            break
+
+        if (j == 0):
+            if app_usage_records[j]['status'] == "close":
+                record = {"appName": app_usage_records[0]["appName"], "timestamp": block_start_time, "status": "open"}
+                updated_app_usage_records.append(record)
+            updated_app_usage_records.append(app_usage_records[j])
+            j += 1
+            continue
+
+        if (j == len(app_usage_records) - 1):
+            updated_app_usage_records.append(app_usage_records[j])
+            if app_usage_records[j]['status'] == "open":
+                record = {"appName": app_usage_records[j]["appName"], "timestamp": block_end_time, "status": "close"}
+                updated_app_usage_records.append(record)
+            j += 1
+            continue
+
+        if (app_usage_records[j]['status'] == "close"):
+            if j - 1 >= 0:
+                if updated_app_usage_records[-1]['status'] == "open":
+                    if updated_app_usage_records[-1]["appName"] == app_usage_records[j]['appName']:
+                        updated_app_usage_records.append(app_usage_records[j])
+                    else:
+                        previous_block_end = datetime.strptime(lock_unlock_blocks[i - 1]['end_time'],
+                                                               "%Y-%m-%d %H:%M:%S").timestamp()
+                        if (block_start_time > updated_app_usage_records[-1]['timestamp']):
+                            update_time = previous_block_end
+                        else:
+                            update_time = app_usage_records[j]['timestamp']
+                        record_close = {"appName": updated_app_usage_records[-1]["appName"], "timestamp": update_time,
+                                        "status": "close"}
+                        updated_app_usage_records.append(record_close)
+
+                        update_time = max(updated_app_usage_records[-1]['timestamp'], block_start_time)
+                        record_open = {"appName": app_usage_records[j]["appName"], "timestamp": update_time,
+                                       "status": "open"}
+                        updated_app_usage_records.append(record_open)
+                        updated_app_usage_records.append(app_usage_records[j])
+
+                else:
+                    update_time = max(updated_app_usage_records[-1]['timestamp'], block_start_time)
+                    record_open = {"appName": app_usage_records[j]["appName"], "timestamp": update_time,
+                                   "status": "open"}
+                    updated_app_usage_records.append(record_open)
+                    updated_app_usage_records.append(app_usage_records[j])
+
+        if (app_usage_records[j]['status'] == "open"):
+            if j - 1 < len(app_usage_records) and updated_app_usage_records[-1]['status'] == "close":
+                updated_app_usage_records.append(app_usage_records[j])
+            else:
+                update_time = min(app_usage_records[j]['timestamp'], block_end_time)
+                record_close = {"appName": app_usage_records[j - 1]["appName"], "timestamp": update_time,
+                                "status": "close"}
+                updated_app_usage_records.append(record_close)
+                updated_app_usage_records.append(app_usage_records[j])
+
+        j += 1
+
+    return updated_app_usage_records
+
+
+def random_day(rng):
+    """Generate sorted app events and contiguous lock/unlock blocks (as local time strings) for one day"""
+    window_start = TIMEZONE.localize(datetime(2025, 8, 28, 0, 0, 0))
+    window_end = window_start + timedelta(hours=rng.choice([1, 6, 24]))
+    span = (window_end - window_start).total_seconds()
+
+    def local_string(seconds):
+        return (window_start + timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S")
+
+    change_points = sorted(rng.sample(range(1, int(span)), rng.randint(0, 30)))
+    bounds = [0] + change_points + [int(span)]
+    blocks = [{"start_time": local_string(bounds[k]), "end_time": local_string(bounds[k + 1])}
+              for k in range(len(bounds) - 1)]
+
+    event_offsets = sorted(rng.uniform(0, span) for _ in range(rng.randint(1, 60)))
+    # Snap some events onto block bounds to exercise the boundary comparisons
+    event_offsets = sorted(rng.choice(bounds) if rng.random() < 0.2 else offset for offset in event_offsets)
+    events = [{"appName": rng.choice(APPS), "status": rng.choice(["open", "close"]),
+               "timestamp": window_start.timestamp() + offset} for offset in event_offsets]
+    return events, blocks
+
+
+def test_sweep_matches_legacy_reconciliation():
+    """The sweep produces exactly the stream the nested loop produced on randomized event sequences"""
+    # The legacy loop parses one block bound with the host timezone; pin it to the user's timezone
+    previous_tz = os.environ.get("TZ")
+    os.environ["TZ"] = "America/New_York"
+    time.tzset()
+    try:
+        rng = random.Random(2025)
+        for _ in range(500):
+            events, blocks = random_day(rng)
+            expected = legacy_reconcile(events, blocks, TIMEZONE)
+
+            block_starts = [TIMEZONE.localize(datetime.strptime(b['start_time'], "%Y-%m-%d %H:%M:%S")).timestamp()
+                            for b in blocks]
+            block_ends = [TIMEZONE.localize(datetime.strptime(b['end_time'], "%Y-%m-%d %H:%M:%S")).timestamp()
+                          for b in blocks]
+            actual = reconcile_app_events([e['timestamp'] for e in events], [e['appName'] for e in events],
+                                          [e['status'] for e in events], block_starts, block_ends)
+
+            assert [(r['appName'], r['timestamp'], r['status']) for r in actual] == \
+                   [(r['appName'], r['timestamp'], r['status']) for r in expected]
+    finally:
+        if previous_tz is None:
+            del os.environ["TZ"]
+        else:
+            os.environ["TZ"] = previous_tz
+        time.tzset()
+
+
+def test_sweep_handles_empty_input():
+    """No events or no blocks yield no reconciled events"""
+    assert reconcile_app_events([], [], [], [0.0], [10.0]) == []
+    assert reconcile_app_events([1.0], ["IG"], ["open"], [], []) == []
+
+
+if __name__ == "__main__":
+    test_sweep_matches_legacy_reconciliation()
+    test_sweep_handles_empty_input()
+    print("App usage reconciliation tests passed.")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Tests for the charging and discharging phases and drain statistics of synthetic battery traces
+"""
+
+import math
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Add the project root to the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "not-used")
+
+import data_streams.battery_data as battery_data
+from data_streams.battery_data import detect_battery_phases, get_battery_drain_stats
+
+START = 1756353600.0
+
+
+def discharge_then_charge(noise=0.0, step=60, seed=0):
+    """Readings every step seconds of a 5 hour discharge from 100% to 50%, then a 5 hour charge to 90%."""
+    seconds = np.arange(0, 36000 + step, step, dtype=float)
+    levels = np.where(seconds <= 18000, 100 - 50 * seconds / 18000, 50 + 40 * (seconds - 18000) / 18000)
+    levels += np.random.default_rng(seed).uniform(-noise, noise, len(levels))
+    return START + seconds, levels
+
+
+@pytest.fixture
+def battery_records(monkeypatch):
+    """Answer get_battery_drain_stats from the given readings instead of the database."""
+    def set_records(timestamps, levels):
+        records = [{'timestamp': timestamp, 'battery_left': level} for timestamp, level in zip(timestamps, levels)]
+        monkeypatch.setattr(battery_data, "fetch_battery_records", lambda uid, start_time, end_time: records)
+    return set_records
+
+
+def test_clean_trace_has_one_phase_per_direction():
+    phases = detect_battery_phases(*discharge_then_charge())
+    assert phases['phase'].tolist() == ['discharging', 'charging']
+    assert phases['duration'].tolist() == [18000, 18000]
+    assert phases['rate'] == pytest.approx([-10, 8])
+    assert phases['start_level'].tolist() == [100, 50]
+
+
+@pytest.mark.parametrize("step", [10, 60, 300])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_noisy_trace_follows_the_trend(seed, step):
+    phases = detect_battery_phases(*discharge_then_charge(noise=0.6, step=step, seed=seed))
+    assert phases['phase'].tolist() == ['discharging', 'charging']
+    assert phases['duration'] == pytest.approx([18000, 18000], abs=300)
+    assert phases['rate'] == pytest.approx([-10, 8], abs=0.5)
+
+
+def test_short_phases_are_merged():
+    # Plugged in for 5 minutes in the middle of a discharge
+    timestamps, levels = discharge_then_charge()
+    timestamps, levels = timestamps[:150], levels[:150].copy()
+    levels[60:65] = levels[59] + np.arange(1, 6) * 0.5
+    phases = detect_battery_phases(timestamps, levels)
+    assert phases['phase'].tolist() == ['discharging']
+    assert phases['duration'].tolist() == [timestamps[-1] - timestamps[0]]
+
+    # Unless shorter phases are allowed
+    phases = detect_battery_phases(timestamps, levels, min_duration=0)
+    assert phases['phase'].tolist() == ['discharging', 'charging', 'discharging']
+
+
+def test_flat_and_short_traces():
+    phases = detect_battery_phases(START + np.arange(0, 3600, 60), np.full(60, 80.0))
+    assert phases['phase'].tolist() == ['discharging']
+    assert phases['rate'].tolist() == [0]
+
+    for levels in ([], [80.0], [80.0, np.nan]):
+        phases = detect_battery_phases(START + np.arange(len(levels)) * 60, levels)
+        assert all(len(values) == 0 for values in phases.values())
+
+
+def test_drain_stats(battery_records):
+    battery_records(*discharge_then_charge(noise=0.6))
+    stats = get_battery_drain_stats("test004", "2025-08-28 00:00:00", "2025-08-28 10:00:00")
+    assert (stats['num_discharging_phases'], stats['num_charging_phases']) == (1, 1)
+    assert stats['mean_drain_rate'] == pytest.approx(10, abs=0.5)
+    assert stats['mean_charge_rate'] == pytest.approx(8, abs=0.5)
+    assert stats['discharging_hours'] == pytest.approx(5, abs=0.1)
+    assert stats['estimated_hours_full_to_empty'] == pytest.approx(10, abs=0.5)
+
+
+def test_drain_stats_without_phases(battery_records):
+    battery_records([START, START + 3600], [80.0, 80.0])
+    stats = get_battery_drain_stats("test004", "2025-08-28 00:00:00", "2025-08-28 10:00:00")
+    assert stats['mean_drain_rate'] == 0
+    assert math.isnan(stats['estimated_hours_full_to_empty'])
+    assert math.isnan(stats['mean_charge_rate'])
+
+    battery_records([START], [80.0])
+    stats = get_battery_drain_stats("test004", "2025-08-28 00:00:00", "2025-08-28 10:00:00")
+    assert (stats['num_discharging_phases'], stats['num_charging_phases']) == (0, 0)
+    assert all(math.isnan(stats[name]) for name in ('mean_drain_rate', 'median_drain_rate', 'max_drain_rate',
+                                                    'mean_charge_rate', 'estimated_hours_full_to_empty'))
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests for the parameterization of queries and generated programs in the code cache
+"""
+
+import os
+import sys
+
+# Add the project root to the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__))))
+
+from agents.code_cache import CodeCache, parameterize_query, substitute_parameters
+
+PROGRAM = '''uid = "test004"
+start = "2025-08-28 10:00:00"
+end = datetime(2025, 8, 29, 23, 59)
+'''
+
+
+def test_queries_of_a_template_share_a_signature():
+    signature, params = parameterize_query("on aug 28 2025, for test004 what was most used app by duration?")
+    other_signature, other_params = parameterize_query("On Sep 3, 2025 for test011 what was most used app by duration")
+    assert signature == other_signature == "on {DATE0} for {UID0} what was most used app by duration"
+    assert params == {'DATE0': '2025-08-28', 'UID0': 'test004'}
+    assert other_params == {'DATE0': '2025-09-03', 'UID0': 'test011'}
+
+    _, params = parameterize_query("steps of test004 on 08/28/2025 from 9:30 am to 11 pm")
+    assert params == {'DATE0': '2025-08-28', 'TIME0': '09:30:00', 'TIME1': '23:00:00', 'UID0': 'test004'}
+
+    # Tokens shaped like user ids that are not known users are part of the template
+    signature, params = parameterize_query("top100 apps of test004 with sha256 hashes")
+    assert signature == "top100 apps of {UID0} with sha256 hashes"
+    assert params == {'UID0': 'test004'}
+
+
+def test_programs_are_adapted_to_new_values():
+    old = {'UID0': 'test004', 'DATE0': '2025-08-28', 'DATE1': '2025-08-29', 'TIME0': '10:00:00'}
+    # Dates are swapped at once, the new first date is not replaced again
+    new = {'UID0': 'test011', 'DATE0': '2025-08-29', 'DATE1': '2025-08-30', 'TIME0': '11:30:00'}
+    assert substitute_parameters(PROGRAM, old, new) == '''uid = "test011"
+start = "2025-08-29 11:30:00"
+end = datetime(2025, 8, 30, 23, 59)
+'''
+
+
+def test_programs_with_other_dates_are_not_adapted():
+    # The second date of the program does not come from the query, so it would not follow the new date
+    old = {'UID0': 'test004', 'DATE0': '2025-08-28'}
+    assert substitute_parameters(PROGRAM, old, {'UID0': 'test004', 'DATE0': '2025-09-01'}) is None
+    # Even when the dates do not change, the program may depend on the day it was generated
+    assert substitute_parameters(PROGRAM, old, {'UID0': 'test009', 'DATE0': '2025-08-28'}) is None
+    # The date of a query without dates, e.g. 'yesterday', is not a parameter
+    assert substitute_parameters('uid = "test004"\nday = "2025-08-27"\n', {'UID0': 'test004'},
+                                 {'UID0': 'test011'}) is None
+    # A value missing from the program cannot be replaced
+    assert substitute_parameters(PROGRAM, {'UID0': 'test005'}, {'UID0': 'test009'}) is None
+
+
+def test_programs_with_other_dates_are_not_stored(tmp_path):
+    cache = CodeCache(cache_path=str(tmp_path / "code_cache.db"))
+    cache.store("total screen time of test004 yesterday", ["app usage database"],
+                [('uid = "test004"\nday = "2025-08-27"\nprint(uid, day)', "python")], 30.0)
+    assert cache.lookup("total screen time of test004 yesterday", ["app usage database"]) is None
+
+    cache.store("total screen time of test004 on 2025-08-27", ["app usage database"],
+                [('uid = "test004"\nday = "2025-08-27"\nprint(uid, day)', "python")], 30.0)
+    _, code_blocks, _ = cache.lookup("total screen time of test011 on 2025-08-28", ["app usage database"])
+    assert code_blocks[0].code == 'uid = "test011"\nday = "2025-08-28"\nprint(uid, day)'
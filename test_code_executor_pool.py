@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Tests for the pool of warm code execution workers, using local worker processes
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+
+# Add the project root to the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__))))
+
+import pytest
+from autogen_core.base import CancellationToken
+from autogen_core.components.code_executor import CodeBlock
+
+from agents.code_executor_pool import CodeExecutorPool
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = CodeExecutorPool(size=1, backend="local", max_uses=100, timeout=2, memory_mb=2048,
+                            allow_network=False)
+    yield pool
+    pool.close()
+
+
+def run_blocks(pool, *code_blocks):
+    async def run():
+        async with pool.worker() as worker:
+            result = await worker.execute_code_blocks(list(code_blocks), CancellationToken())
+            return worker, result
+    return asyncio.run(run())
+
+
+def test_scripts_run_with_the_preamble_loaded(pool):
+    worker, result = run_blocks(pool, CodeBlock("import sys\nprint('numpy' in sys.modules)", "python"))
+    assert result.exit_code == 0
+    assert result.output.strip() == "True"
+
+    # Blocks stop at the first failure, and scripts are killed at the timeout
+    worker, result = run_blocks(pool, CodeBlock("echo first; exit 3", "sh"), CodeBlock("print(2)", "python"))
+    assert (result.exit_code, result.output) == (3, "first\n")
+    worker, result = run_blocks(pool, CodeBlock("import time\ntime.sleep(30)", "python"))
+    assert result.exit_code == 124
+
+
+def test_dead_workers_are_respawned(pool):
+    worker, _ = run_blocks(pool, CodeBlock("print(1)", "python"))
+    pid = worker.process.pid
+    worker.process.kill()
+    worker.process.wait()
+
+    # A dead worker is restarted when it is handed out
+    worker, result = run_blocks(pool, CodeBlock("print(1)", "python"))
+    assert result.output == "1\n"
+    assert worker.process.pid != pid
+    assert pool.stats()['restarts'] >= 1
+
+
+def test_workers_are_recycled_after_max_uses():
+    pool = CodeExecutorPool(size=1, backend="local", max_uses=1, timeout=2)
+    try:
+        # Scripts are forked by the worker, so their parent is the worker process serving the request
+        pids = [int(run_blocks(pool, CodeBlock("import os\nprint(os.getppid())", "python"))[1].output)
+                for _ in range(3)]
+        assert len(set(pids)) == 3
+        assert pool.stats()['restarts'] == 3
+    finally:
+        pool.close()
+
+
+def test_scripts_are_sandboxed(pool):
+    worker, result = run_blocks(pool, CodeBlock("import numpy as np\nnp.ones(8 * 1024 ** 3 // 8)", "python"))
+    assert result.exit_code == 1
+    assert "Unable to allocate" in result.output
+
+    if not worker.network_isolated:
+        pytest.skip("Network namespaces are not available")
+    worker, result = run_blocks(pool, CodeBlock("import socket\nsocket.create_connection(('1.1.1.1', 80), 2)",
+                                                "python"))
+    assert result.exit_code == 1
+
+
+def test_more_requests_than_executor_threads(pool):
+    async def session(number):
+        async with pool.worker() as worker:
+            # Code rounds separated by LLM turns, while other requests wait for the worker
+            for _ in range(2):
+                result = await worker.execute_code_blocks([CodeBlock(f"print({number})", "python")],
+                                                          CancellationToken())
+                await asyncio.sleep(0.05)
+            return result.output
+
+    async def run():
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=2))
+        return await asyncio.wait_for(asyncio.gather(*(session(number) for number in range(6))), 60)
+
+    assert asyncio.run(run()) == [f"{number}\n" for number in range(6)]
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests for the session memo of function call results, using a stub registry function that counts its calls
+"""
+
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# Add the project root to the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "not-used")
+
+# The data layer imports the stress detection package installed in the README setup
+pytest.importorskip("ubiwell_stress_detection")
+
+import agents.data_driver as data_driver
+from agents.data_driver import FunctionCallMemo, extract_data_multiple_type, function_call_key
+
+
+@pytest.fixture
+def get_steps(monkeypatch):
+    """Registry function returning the step count of a user, failing for the user 'broken'."""
+    def get_steps(uid, day):
+        get_steps.calls += 1
+        if uid == "broken":
+            raise RuntimeError("database is down")
+        return f"{uid} took 100 steps on {day}"
+    get_steps.calls = 0
+
+    def prepare_function_call(name, params, function_id=None):
+        if name != "get_steps":
+            raise ValueError(f"Unknown function {name}")
+        return get_steps, {"uid": str(params["uid"]), "day": str(params["day"])}
+
+    monkeypatch.setattr(data_driver, "prepare_function_call", prepare_function_call)
+    return get_steps
+
+
+def llm_calls(**calls):
+    return SimpleNamespace(content=json.dumps({function_id: {"name": "get_steps", "params": params}
+                                               for function_id, params in calls.items()}))
+
+
+def test_calls_are_keyed_by_canonical_params(get_steps):
+    key, name, params = function_call_key("STEPS1", {"name": "get_steps", "params": {"uid": "test004", "day": 1}})
+    other_key, _, _ = function_call_key("STEPS2", {"name": "get_steps", "params": {"day": "1", "uid": "test004"}})
+    assert key == other_key
+    assert (name, params) == ("get_steps", {"uid": "test004", "day": "1"})
+    assert function_call_key("STEPS1", {"name": "get_distance", "params": {}}) is None
+
+
+def test_repeated_calls_across_batches_run_once(get_steps):
+    memo = FunctionCallMemo()
+    first = extract_data_multiple_type(llm_calls(STEPS1={"uid": "test004", "day": "2025-08-28"}), memo=memo)
+    second = extract_data_multiple_type(llm_calls(STEPS2={"day": "2025-08-28", "uid": "test004"},
+                                                  STEPS3={"uid": "test005", "day": "2025-08-28"}), memo=memo)
+    assert get_steps.calls == 2
+    assert first[0]['cached'] is False
+    assert [result['cached'] for result in second] == [True, False]
+    assert second[0]['result'] == first[0]['result']
+    # Memo hits are reported under the call that asked for them
+    assert (second[0]['func_id'], second[0]['latency']) == ("STEPS2", 0.0)
+
+    assert memo.fetched_calls() == [
+        {"name": "get_steps", "params": {"uid": uid, "day": "2025-08-28"}, "status": "already fetched"}
+        for uid in ("test004", "test005")]
+
+
+def test_duplicate_calls_of_a_batch_run_once(get_steps):
+    memo = FunctionCallMemo()
+    results = extract_data_multiple_type(llm_calls(STEPS1={"uid": "test004", "day": "2025-08-28"},
+                                                   STEPS2={"uid": "test004", "day": "2025-08-28"}), memo=memo)
+    assert get_steps.calls == 1
+    assert [(result['func_id'], result['cached']) for result in results] == [("STEPS1", False), ("STEPS2", True)]
+    assert results[0]['result'] == results[1]['result']
+    assert len(memo.fetched_calls()) == 1
+
+
+def test_failed_calls_are_not_memoized(get_steps):
+    memo = FunctionCallMemo()
+    for _ in range(2):
+        results = extract_data_multiple_type(llm_calls(STEPS1={"uid": "broken", "day": "2025-08-28"}), memo=memo)
+        assert results[0]['error'] == "RuntimeError: database is down"
+        assert results[0]['cached'] is False
+    assert get_steps.calls == 2
+    assert memo.fetched_calls() == []
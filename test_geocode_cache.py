@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Offline tests for the reverse-geocoding cache, using a local gazetteer file as the provider
+"""
+
+import os
+import sys
+
+# Add the project root to the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__))))
+
+from data_processing.geocode_cache import ReverseGeocodeCache, gazetteer_provider
+
+GAZETTEER = [
+    (42.339850, -71.089400, "360 Huntington Ave, Boston, MA 02115, USA"),
+    (42.361145, -71.057083, "1 City Hall Square, Boston, MA 02201, USA"),
+]
+
+
+def make_cache(tmp_path, radius_meters=25, ttl_seconds=3600):
+    gazetteer_path = tmp_path / "gazetteer.csv"
+    gazetteer_path.write_text("latitude,longitude,address\n" +
+                              "".join(f'{lat},{lon},"{address}"\n' for lat, lon, address in GAZETTEER))
+
+    calls = []
+    provider = gazetteer_provider(str(gazetteer_path))
+
+    def counting_provider(latitude, longitude):
+        calls.append((latitude, longitude))
+        return provider(latitude, longitude)
+
+    cache = ReverseGeocodeCache(counting_provider, "gazetteer", str(tmp_path / "cache" / "geocode.sqlite"),
+                                radius_meters, ttl_seconds)
+    return cache, calls
+
+
+def test_nearby_points_reuse_cached_address(tmp_path):
+    cache, calls = make_cache(tmp_path)
+
+    assert cache.reverse(42.339850, -71.089400) == GAZETTEER[0][2]
+    # About 10 meters away
+    assert cache.reverse(42.339940, -71.089400) == GAZETTEER[0][2]
+    assert len(calls) == 1
+
+    # About 2 kilometers away
+    assert cache.reverse(42.357850, -71.089400) == GAZETTEER[0][2]
+    assert len(calls) == 2
+
+
+def test_cache_persists_across_instances(tmp_path):
+    cache, calls = make_cache(tmp_path)
+    cache.reverse(42.361145, -71.057083)
+
+    cache, calls = make_cache(tmp_path)
+    assert cache.reverse(42.361150, -71.057080) == GAZETTEER[1][2]
+    assert calls == []
+
+
+def test_expired_addresses_are_evicted(tmp_path):
+    cache, calls = make_cache(tmp_path, ttl_seconds=-1)
+    cache.reverse(42.339850, -71.089400)
+    cache.reverse(42.339850, -71.089400)
+    assert len(calls) == 2
+
+    cache.evict_expired()
+    with cache._connect() as connection:
+        assert connection.execute("SELECT COUNT(*) FROM geocode_cache").fetchone()[0] == 0
+
+
+def test_bulk_lookup_deduplicates_coordinates(tmp_path):
+    cache, calls = make_cache(tmp_path)
+    coordinates = [(42.339850, -71.089400), (42.361145, -71.057083), (42.339850, -71.089400),
+                   (42.339860, -71.089410), (42.361145, -71.057083)]
+
+    addresses = cache.reverse_many(coordinates)
+
+    assert addresses == [GAZETTEER[0][2], GAZETTEER[1][2], GAZETTEER[0][2], GAZETTEER[0][2], GAZETTEER[1][2]]
+    assert len(calls) == 2
+    assert cache.stats() == {'hits': 1, 'misses': 2}
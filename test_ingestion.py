@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for the de-duplication of step records at ingestion, on CSV copies of the sample data
+"""
+
+import os
+import shutil
+import sys
+
+import pandas as pd
+import pytest
+
+# Add the project root to the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "not-used")
+
+import data_processing.data_processing_utils as data_processing_utils
+import data_processing.ingestion as ingestion
+from data_processing.ingestion import ingest_documents, deduplicate_collection
+from data_streams.constants import IOS_STEPS, GARMIN_STEPS
+
+SAMPLE_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_data')
+
+
+@pytest.fixture
+def csv_dir(tmp_path, monkeypatch):
+    """Copy the steps CSVs to a temporary folder and point the CSV collections to it."""
+    for collection_name in (IOS_STEPS, GARMIN_STEPS):
+        shutil.copy(os.path.join(SAMPLE_DATA, f"{collection_name}.csv"), tmp_path)
+
+    def get_csv_path(collection_name):
+        return str(tmp_path / f"{collection_name}.csv")
+
+    for module in (data_processing_utils, ingestion):
+        monkeypatch.setattr(module, "USE_CSV", True)
+        monkeypatch.setattr(module, "get_csv_path", get_csv_path)
+    return get_csv_path
+
+
+def test_uploads_replace_records_with_the_same_key(csv_dir):
+    stored = pd.read_csv(csv_dir(IOS_STEPS))
+    record = stored.iloc[0]
+
+    # The stored start timestamp is read back as a float, the upload has an int
+    upload = {'uid': record['uid'], 'start_timestamp': int(record['start_timestamp']),
+              'end_timestamp': int(record['end_timestamp']), 'steps': 42, 'distance': 30.0,
+              'floors_ascended': 0.0, 'floors_descended': 0.0}
+    ingest_documents(IOS_STEPS, [dict(upload, steps=7), upload])
+
+    updated = pd.read_csv(csv_dir(IOS_STEPS))
+    assert len(updated) == len(stored)
+    matching = updated[(updated['uid'] == record['uid']) &
+                       (updated['start_timestamp'] == record['start_timestamp'])]
+    # The last write of a key wins
+    assert matching['steps'].tolist() == [42]
+
+    # Records with a new key are added
+    ingest_documents(IOS_STEPS, [dict(upload, start_timestamp=upload['start_timestamp'] + 1)])
+    assert len(pd.read_csv(csv_dir(IOS_STEPS))) == len(stored) + 1
+
+
+def test_stored_duplicates_are_removed(csv_dir):
+    stored = pd.read_csv(csv_dir(GARMIN_STEPS))
+    duplicates = stored.head(5).assign(steps=1.0)
+    pd.concat([stored, duplicates], ignore_index=True).to_csv(csv_dir(GARMIN_STEPS), index=False)
+
+    assert deduplicate_collection(GARMIN_STEPS) == 5
+    deduplicated = pd.read_csv(csv_dir(GARMIN_STEPS))
+    assert len(deduplicated) == len(stored)
+    assert not deduplicated.duplicated(subset=['uid', 'start_timestamp']).any()
+    # The last written record of a key is kept
+    assert (deduplicated.tail(5)['steps'] == 1.0).all()
+
+    assert deduplicate_collection(GARMIN_STEPS) == 0
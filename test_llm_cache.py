@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Offline tests for the persistent LLM response cache, using a fake chat model
+"""
+
+import os
+import sys
+
+# Add the project root to the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__))))
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from agents.llm_cache import SQLiteLLMCache, get_cache_stats
+
+
+def make_model(tmp_path, agent_name, responses, max_entries=100):
+    cache = SQLiteLLMCache(agent_name, str(tmp_path / "cache" / "llm.sqlite"), max_entries=max_entries)
+    return FakeListChatModel(responses=responses, cache=cache)
+
+
+def test_repeated_prompts_are_answered_from_disk(tmp_path):
+    model = make_model(tmp_path, "test_repeat", ["first", "second"])
+    assert model.invoke("How many steps?").content == "first"
+    # Differs only in whitespace
+    assert model.invoke("How  many\nsteps? ").content == "first"
+
+    # A new model instance reads the same cache file
+    model = make_model(tmp_path, "test_repeat", ["first", "second"])
+    assert model.invoke("How many steps?").content == "first"
+    assert get_cache_stats()["test_repeat"] == {'hits': 2, 'misses': 1}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    model = make_model(tmp_path, "test_evict", ["a", "b", "c", "d"], max_entries=2)
+    model.invoke("one")
+    model.invoke("two")
+    # Using "one" again makes "two" the least recently used entry
+    assert model.invoke("one").content == "a"
+    model.invoke("three")
+
+    assert model.invoke("one").content == "a"
+    assert model.invoke("two").content == "d"
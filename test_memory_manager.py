@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the compaction of the sensemaking memory, using a stub summarizer instead of the LLM
+"""
+
+import os
+import sys
+
+# Add the project root to the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "not-used")
+
+from agents.memory_manager import MemoryManager, NOT_POSSIBLE_MARKER, count_tokens
+
+
+class StubSummarizer:
+    """Summarizer keeping only the number of entries folded into the summary."""
+
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, summary, text):
+        self.texts.append(text)
+        return f"{text.count('Question:') + (int(summary.split()[0]) if summary else 0)} findings"
+
+
+def add_entries(memory, count, answer="The user took 1200 steps between 10:00 and 11:00 on 2025-08-28."):
+    for i in range(count):
+        memory.add(answer, question=f"How many steps did test004 take in hour {i}?", database="garmin steps")
+
+
+def test_memory_within_budget_is_kept_verbatim():
+    summarizer = StubSummarizer()
+    memory = MemoryManager(token_budget=10000, keep_recent=2, summarize=summarizer)
+    add_entries(memory, 6)
+    assert summarizer.texts == []
+    assert memory.render() == memory.render_full()
+    assert memory.summary == ''
+
+
+def test_oldest_entries_are_compacted_to_the_budget():
+    summarizer = StubSummarizer()
+    memory = MemoryManager(token_budget=150, keep_recent=2, summarize=summarizer)
+    add_entries(memory, 8)
+
+    assert count_tokens(memory.render()) <= memory.token_budget
+    assert len(summarizer.texts) >= 1
+    # Every compressed entry went to the summarizer once, oldest first, and the recent ones are kept verbatim
+    assert ''.join(summarizer.texts).count('Question:') == memory.num_compressed
+    assert "hour 0?" in summarizer.texts[0]
+    assert memory.summary == f"{memory.num_compressed} findings"
+    assert memory.verbatim_entries() == memory.entries[memory.num_compressed:]
+    assert "hour 7?" in memory.render()
+
+
+def test_recent_entries_are_kept_over_the_budget():
+    summarizer = StubSummarizer()
+    memory = MemoryManager(token_budget=1, keep_recent=3, summarize=summarizer)
+    add_entries(memory, 5)
+    assert memory.num_compressed == 2
+    assert len(memory.verbatim_entries()) == 3
+    assert count_tokens(memory.render()) > memory.token_budget
+
+
+def test_unanswerable_requests_survive_compaction():
+    memory = MemoryManager(token_budget=1, keep_recent=1, summarize=StubSummarizer())
+    memory.add(f"Heart rate data is not available. {NOT_POSSIBLE_MARKER}", question="What was the heart rate?",
+               database="garmin heart rate")
+    add_entries(memory, 1)
+    assert memory.num_compressed == 1
+    assert NOT_POSSIBLE_MARKER in memory.summary
+    assert NOT_POSSIBLE_MARKER in memory.render()
+
+
+def test_tokens_saved_are_counted_per_prompt():
+    memory = MemoryManager(token_budget=150, keep_recent=2, summarize=StubSummarizer())
+    add_entries(memory, 8)
+
+    saved_per_prompt = count_tokens(memory.render_full()) - count_tokens(memory.render())
+    assert saved_per_prompt > 0
+    for _ in range(2):
+        memory.for_prompt()
+    assert memory.stats() == {'entries': 8, 'compressed_entries': memory.num_compressed,
+                              'tokens_sent': 2 * count_tokens(memory.render()), 'tokens_saved': 2 * saved_per_prompt}
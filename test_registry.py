@@ -9,6 +9,8 @@ import os
 # Add the project root to the path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__))))
 
+os.environ.setdefault("OPENAI_API_KEY", "not-used")
+
 def test_registry():
     """Test the database registry functionality"""
     try:
@@ -133,6 +135,45 @@ def test_function_metadata_structure():
         traceback.print_exc()
         return False
 
+def test_prepare_function_call():
+    """Test the validation and coercion of LLM function calls"""
+    import pytest
+    from agents.database_registry import prepare_function_call
+    from data_streams.location_data import get_addresses_from_coordinates
+    from data_streams.timeline_data import get_timeline
+
+    timeline_params = {'uid': 'test004', 'start_time': '2025-08-28 10:00:00', 'end_time': '2025-08-28 11:00:00'}
+
+    # Integers written as strings are coerced to the declared type
+    func, params = prepare_function_call('get_timeline', {**timeline_params, 'resolution_seconds': '5'}, 'TIMELINE1')
+    assert func is get_timeline
+    assert params['resolution_seconds'] == 5
+
+    # Lists written as JSON strings are parsed
+    func, params = prepare_function_call('get_addresses_from_coordinates',
+                                         {'coordinates': '[[42.34, -71.09], [42.36, -71.06]]'}, 'LOC8')
+    assert func is get_addresses_from_coordinates
+    assert params == {'coordinates': [[42.34, -71.09], [42.36, -71.06]]}
+
+    # An explicit None for an optional parameter is passed as is
+    _, params = prepare_function_call('get_timeline', {**timeline_params, 'features': None})
+    assert params['features'] is None
+
+    # Unknown names fall back to the function ID
+    func, _ = prepare_function_call('get_timeline_table', timeline_params, 'TIMELINE1')
+    assert func is get_timeline
+
+    with pytest.raises(ValueError, match="Unknown function"):
+        prepare_function_call('get_timeline_table', timeline_params)
+    with pytest.raises(ValueError, match="Missing parameters"):
+        prepare_function_call('get_timeline', {'uid': 'test004'})
+    with pytest.raises(ValueError, match="Unexpected parameters"):
+        prepare_function_call('get_timeline', {**timeline_params, 'timezone': 'UTC'})
+    with pytest.raises(ValueError, match="should be an integer"):
+        prepare_function_call('get_timeline', {**timeline_params, 'resolution_seconds': 'a minute'})
+    with pytest.raises(ValueError, match="should be a list"):
+        prepare_function_call('get_addresses_from_coordinates', {'coordinates': '42.34, -71.09'})
+
 if __name__ == "__main__":
     print("Database Registry Conversion Test")
     print("=" * 50)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests that sensemaking sessions end when the next step or information seeking agents keep failing, using stub agents
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Add the project root to the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "not-used")
+
+# The data layer imports the stress detection package installed in the README setup
+pytest.importorskip("ubiwell_stress_detection")
+
+import sensemaking_process
+from sensemaking_process import SenseMaker
+
+
+class StubAgent:
+    """Agent answering every method, and its 'a' prefixed asynchronous variant, with a fixed response."""
+
+    def __init__(self, response):
+        self.response = response
+        self.calls = 0
+
+    def __getattr__(self, name):
+        def respond(params):
+            self.calls += 1
+            if isinstance(self.response, Exception):
+                raise self.response
+            return self.response
+
+        async def respond_async(params):
+            # Yield to the event loop like an API call, so a session that never ends times out
+            await asyncio.sleep(0)
+            return respond(params)
+
+        return respond_async if name.startswith('a') else respond
+
+
+def make_sense_maker(next_step, information_request=None):
+    sense_maker = SenseMaker("how many steps did test004 take on aug 28 2025?", "clear and concise")
+    sense_maker.action_plan_generator_agent = StubAgent({"action_plan": "count the steps"})
+    sense_maker.next_step_agent = StubAgent(next_step)
+    sense_maker.information_seeking_agent = StubAgent(information_request)
+    sense_maker.presentation_agent = StubAgent({"response": "done"})
+    return sense_maker
+
+
+@pytest.mark.parametrize("next_step", [RuntimeError("API is down"), {"unexpected": "INF"}, {"next_step": "ASK"}])
+def test_failing_next_step_ends_the_session(next_step):
+    sense_maker = make_sense_maker(next_step)
+    asyncio.run(asyncio.wait_for(sense_maker.make_sense_async(verbose=False), 10))
+
+    assert sense_maker.answer == "done"
+    assert sense_maker.step_history.count("INVALID STATE") == 2 * sensemaking_process.max_iters
+    assert sense_maker.step_history[-2:] == ["PRESENTATION", "FINISH"]
+
+
+def test_failing_information_seeking_ends_the_session():
+    sense_maker = make_sense_maker({"next_step": "INF"}, RuntimeError("API is down"))
+    asyncio.run(asyncio.wait_for(sense_maker.make_sense_async(verbose=False), 10))
+    assert sense_maker.answer == "done"
+    assert sense_maker.next_step_agent.calls == sensemaking_process.max_iters
+
+    # The synchronous session ends the same way
+    sync_sense_maker = make_sense_maker({"next_step": "INF"}, RuntimeError("API is down"))
+    sync_sense_maker.make_sense(verbose=False)
+    assert sync_sense_maker.step_history == sense_maker.step_history
+
+
+def test_failing_presentation_still_finishes():
+    sense_maker = make_sense_maker({"next_step": "END"})
+    sense_maker.presentation_agent = StubAgent(RuntimeError("API is down"))
+    asyncio.run(sense_maker.make_sense_async(verbose=False))
+    assert sense_maker.answer == "Failed to generate the answer because of LLM call failure"
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Tests that the timeline agrees with the lock state lookup of the lock/unlock functions, on the sample data
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Add the project root to the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "not-used")
+
+import data_processing.data_processing_utils as data_processing_utils
+import data_processing.stream_index as stream_index
+from data_streams.app_usage_data import to_local_string
+from data_streams.lock_unlock_data import get_lock_unlock_state_at_given_time
+from data_streams.timeline_data import lock_state_columns
+
+SAMPLE_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_data')
+UID = "test004"
+
+
+@pytest.fixture(autouse=True)
+def sample_data(monkeypatch):
+    def get_csv_path(collection_name):
+        return os.path.join(SAMPLE_DATA, f"{collection_name}.csv")
+
+    for module in (data_processing_utils, stream_index):
+        monkeypatch.setattr(module, "USE_CSV", True)
+        monkeypatch.setattr(module, "get_csv_path", get_csv_path)
+
+
+def test_lock_state_at_events_and_between_them():
+    events = pd.read_csv(os.path.join(SAMPLE_DATA, "ios_lock_unlock.csv"))
+    event_times = events[events['uid'] == UID]['timestamp'].to_numpy()[:200]
+    # Event times themselves, where a state change only applies after them, and times right after them
+    grid = np.sort(np.concatenate([np.floor(event_times), np.floor(event_times) + 1]))
+
+    states = lock_state_columns(UID, grid, 1, None, None)['lock_state']
+    expected = [get_lock_unlock_state_at_given_time(UID, to_local_string(UID, time)).get('state') for time in grid]
+    assert states == expected